@@ -1,18 +1,73 @@
 import streamlit as st
 import sqlite3
-import hashlib
 import os
 import sys
+import logging
+import math
+import tempfile
 
 # Add the current directory to Python path to allow importing the page modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Import page modules
-from pages.about.content import content_page
-from pages.about.about import about_page
-from pages.models.model_a import model_a_page
-from pages.models.model_b import model_b_page
+# Page modules under pages/ are discovered and imported lazily by the registry
+import page_registry
 import session_util
+import session_tokens
+import config
+import log_util
+import metrics_util
+import db_util
+import user_repo
+import user_directory
+import user_bulk
+import migrations
+import model_registry
+import jobs
+import password_util
+import login_throttle
+import audit
+import health
+
+logger = log_util.get_logger(__name__)
+
+def _user_directory_size():
+    directory = user_directory.get_directory()
+    return directory.stats()['users'] if directory is not None else 0
+
+# Process-wide counters exported next to the stage timings
+_metrics = metrics_util.get_metrics()
+_metrics.gauge("log_records_dropped", log_util.dropped_records, "Log records dropped on a full queue.")
+for _reason in (login_throttle.CLIENT, login_throttle.USERNAME, login_throttle.BUSY):
+    _metrics.gauge(f"login_throttled_{_reason}",
+                   lambda reason=_reason: login_throttle.get_throttle().stats()['rejected'][reason],
+                   f"Login attempts rejected by the {_reason} limit before any database or hashing work.")
+_metrics.gauge("audit_events_dropped", lambda: audit.get_log().stats()['dropped'],
+               "Audit events dropped on a full queue or after failed writes.")
+_metrics.gauge("audit_events_queued", lambda: audit.get_log().stats()['queued'],
+               "Audit events waiting for the background writer.")
+_metrics.gauge("reruns_inflight", lambda: health.get_gate().stats()['inflight'], "Reruns being executed.")
+_metrics.gauge("reruns_shed", lambda: health.get_gate().stats()['shed'],
+               "Reruns answered with the busy page because too many were in flight.")
+_metrics.gauge("warm_up_ready", lambda: int(health.get_warm_up().ready()),
+               "1 once the required startup warm-up steps have succeeded.")
+_metrics.gauge("kdf_rejected", lambda: password_util.get_pool().rejected,
+               "Password hashing calls rejected because the pool was saturated.")
+_metrics.gauge("user_directory_users", _user_directory_size,
+               "Users held by the in-memory user directory (0 when lookups go to SQLite).")
+_metrics.gauge("models_loaded_bytes", lambda: model_registry.get_registry().stats()['loaded_bytes'],
+               "Approximate memory held by loaded models.")
+_metrics.gauge("token_cache_hit_ratio", lambda: session_util.token_cache_stats()['hit_ratio'],
+               "Hit ratio of the validated session token cache.")
+_metrics.gauge("jobs_queued", lambda: jobs.get_queue().stats()['queued'], "Scoring jobs waiting for a worker.")
+_metrics.gauge("jobs_running", lambda: jobs.get_queue().stats()['running'], "Scoring jobs being executed.")
+_metrics.gauge("job_worker_utilization", lambda: jobs.get_queue().stats()['utilization'],
+               "Busy share of the job workers over the last 15 minutes.")
+_metrics.gauge("prediction_cache_hit_ratio", lambda: jobs.cache_totals()['hit_ratio'],
+               "Share of scored chunks served from the prediction cache.")
+
+# Admin user management listing sizes
+USER_PICKER_LIMIT = 20
+USERS_TABLE_PAGE_SIZES = [25, 50, 100]
 
 # Page configuration
 st.set_page_config(
@@ -30,259 +85,180 @@ if 'username' not in st.session_state:
 if 'is_admin' not in st.session_state:
     st.session_state.is_admin = False
 
-# Try to restore session from file
-if not st.session_state.authenticated:
-    session_restored = session_util.restore_session()
-    if session_restored:
-        print(f"Session restored for user: {st.session_state.username}")
-
-def hash_password(password):
-    """Hash the password using SHA-256."""
-    return hashlib.sha256(password.encode()).hexdigest()
-
 def init_db():
-    """Initialize the database and create tables if they don't exist."""
-    conn = None
+    """Bring the database schema up to date.
+
+    Migrations run once per server process; on normal reruns this is a flag check.
+    """
     try:
-        db_path = os.path.join(os.getcwd(), 'users.db')
-        print(f"Initializing database at: {db_path}")
-        
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Create users table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password TEXT NOT NULL,
-            is_admin BOOLEAN NOT NULL
-        )
-        ''')
-        conn.commit()
-        print("Users table created successfully")
-        
-        # Check if admin user exists
-        cursor.execute('SELECT username FROM users WHERE username = ?', ('admin',))
-        if cursor.fetchone() is None:
-            # Create admin user with password 'admin123'
-            admin_password = 'admin123'
-            hashed_password = hash_password(admin_password)
-            
-            print(f"Creating admin user with password: {admin_password}")
-            print(f"Hashed password: {hashed_password}")
-            
-            cursor.execute('INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)',
-                          ('admin', hashed_password, True))
-            conn.commit()
-            print("Admin user created successfully!")
-        
-        # Check if test user exists
-        cursor.execute('SELECT username FROM users WHERE username = ?', ('user',))
-        if cursor.fetchone() is None:
-            # Create test user with password 'password'
-            test_password = 'password'
-            hashed_password = hash_password(test_password)
-            
-            print(f"Creating test user with password: {test_password}")
-            print(f"Hashed password: {hashed_password}")
-            
-            cursor.execute('INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)',
-                          ('user', hashed_password, False))
-            conn.commit()
-            print("Test user created successfully!")
-        
-        # List all users in the database
-        cursor.execute('SELECT username, is_admin FROM users')
-        users = cursor.fetchall()
-        print(f"All users in database: {users}")
-        
+        # Startup warm-up and health endpoint (once per process; already running under serve.py)
+        health.start()
+        applied = migrations.ensure_schema()
+        if applied:
+            logger.info("Applied database migrations %s at: %s", applied, config.DB_PATH)
+        # Load the token revocation index (once per process)
+        session_tokens.get_revocation_index()
+        # In-memory user directory (once per process) for logins and the admin listing
+        user_directory.get_directory()
+        # Model registry (once per process); starts the optional model warm-up
+        model_registry.get_registry()
+        # Job queue (once per process); re-dispatches jobs left unfinished by a restart
+        jobs.get_queue()
+        # Audit log writer (once per process)
+        audit.get_log()
         return True
     except Exception as e:
-        print(f"Error initializing database: {str(e)}")
+        logger.exception("Error initializing database")
         st.error(f"Error initializing database: {str(e)}")
         return False
-    finally:
-        if conn:
-            conn.close()
-            print("Database connection closed after initialization")
 
 def verify_user(username, password):
-    """Verify user credentials."""
-    print(f"Attempting to verify user: {username}")
-    st.write(f"Attempting to verify user: {username}")
+    """Verify user credentials, unless the login throttle rejects the attempt first."""
+    logger.debug("Attempting to verify user: %s", username)
     
     if not username or not password:
-        print("Username or password is empty")
         st.error("Username and password are required")
         return False, False
     
-    conn = None
+    # Throttled attempts stop here, before any database or hashing work
+    client = login_throttle.client_key()
+    with login_throttle.get_throttle().attempt(client, username) as decision:
+        if not decision.allowed:
+            logger.warning("Login throttled (%s) for user %s from %s", decision.reason, username, client)
+            audit.record(audit.LOGIN_FAILED, username, client, f"throttled: {decision.reason}")
+            if decision.reason == login_throttle.BUSY:
+                st.error("The server is busy with other logins. Please try again in a moment.")
+            else:
+                st.error(f"Too many login attempts. Please try again in {math.ceil(decision.retry_after)} seconds.")
+            return False, False
+        return check_credentials(username, password)
+
+def check_credentials(username, password):
+    """Check the password against the users table; shows the reason on failure."""
     try:
-        # Use absolute path for database file
-        db_path = os.path.join(os.getcwd(), 'users.db')
-        print(f"Opening database at: {db_path}")
-        st.write(f"Opening database at: {db_path}")
-        
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # First check if the user exists
-        cursor.execute('SELECT password, is_admin FROM users WHERE username = ?', (username,))
-        result = cursor.fetchone()
+        # First check if the user exists (served from the in-memory user directory)
+        result = user_repo.get_credentials(username)
         
         if result is None:
-            print(f"User not found: {username}")
+            logger.info("Login failed, user not found: %s", username)
+            audit.record(audit.LOGIN_FAILED, username, detail="unknown user")
             st.error(f"User not found: {username}")
             
-            # List all users for debugging
-            cursor.execute('SELECT username FROM users')
-            all_users = cursor.fetchall()
-            print(f"Available users in database: {all_users}")
-            st.write(f"Available users in database: {all_users}")
+            # Diagnostic query only in debug mode
+            if logger.isEnabledFor(logging.DEBUG):
+                user_count = db_util.fetch_one('SELECT COUNT(*) FROM users')[0]
+                logger.debug("Users in database at %s: %d", config.DB_PATH, user_count)
             
             return False, False
         
         stored_password = result[0]
         is_admin = result[1]
         
-        # Hash the provided password
-        hashed_password = hash_password(password)
-        
-        # Debug output
-        print(f"Provided password hash: {hashed_password}")
-        print(f"Stored password hash: {stored_password}")
-        st.write(f"Provided password hash: {hashed_password}")
-        st.write(f"Stored password hash: {stored_password}")
-        
-        # Compare the hashes
-        if hashed_password == stored_password:
-            print(f"Login successful for user: {username}")
+        # Check the password on the bounded KDF pool
+        pool = password_util.get_pool()
+        if pool.verify(password, stored_password):
+            logger.info("Login successful for user: %s", username)
+            audit.record(audit.LOGIN, username, detail="admin" if is_admin else None)
+            if password_util.needs_rehash(stored_password):
+                rehash_password(username, password, stored_password)
             return True, is_admin
         else:
-            print(f"Invalid password for user: {username}")
+            logger.info("Login failed, invalid password for user: %s", username)
+            audit.record(audit.LOGIN_FAILED, username, detail="invalid password")
             st.error("Invalid password")
             return False, False
+    except password_util.PasswordPoolBusy:
+        logger.warning("Password pool saturated, rejecting login for: %s", username)
+        st.error("The server is busy verifying other logins. Please try again in a moment.")
+        return False, False
     except Exception as e:
-        print(f"Error verifying user: {str(e)}")
+        logger.exception("Error verifying user: %s", username)
         st.error(f"Error verifying user: {str(e)}")
         return False, False
-    finally:
-        if conn:
-            conn.close()
+
+def rehash_password(username, password, old_hash):
+    """Upgrade a legacy or low-cost hash after a successful login."""
+    try:
+        new_hash = password_util.get_pool().hash(password)
+        # Only replace the hash we verified against, in case the password changed meanwhile
+        db_util.execute('UPDATE users SET password = ? WHERE username = ? AND password = ?',
+                        (new_hash, username, old_hash))
+        logger.info("Rehashed password for user: %s", username)
+    except Exception:
+        # The login itself succeeded; the upgrade is retried on the next login
+        logger.exception("Error rehashing password for user: %s", username)
 
 def save_user(username, password, is_admin):
     """Save a new user to the database."""
-    print(f"Attempting to save user: {username}, is_admin: {is_admin}")
+    logger.debug("Attempting to save user: %s, is_admin: %s", username, is_admin)
     
     if not username or not password:
         st.error("Username and password are required")
         return False
     
-    conn = None
     try:
-        # Connect to the database using absolute path
-        db_path = os.path.join(os.getcwd(), 'users.db')
-        print(f"Opening database at: {db_path}")
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
         # Check if user already exists
-        print(f"Checking if user '{username}' already exists...")
-        cursor.execute('SELECT username FROM users WHERE username = ?', (username,))
-        if cursor.fetchone():
+        if db_util.fetch_one('SELECT username FROM users WHERE username = ?', (username,)):
             st.error(f"Username '{username}' already exists")
             return False
         
-        # Hash the password
-        hashed_password = hash_password(password)
-        print(f"Hashed password: {hashed_password}")
+        # Hash the password on the KDF pool, outside any database transaction
+        hashed_password = password_util.get_pool().hash(password)
         
         # Insert the new user
-        print(f"Executing INSERT for user: {username}")
-        cursor.execute('INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)',
-                      (username, hashed_password, is_admin))
-        
-        # Commit the transaction
-        conn.commit()
-        print(f"Transaction committed for user: {username}")
-        
-        # Verify the user was created
-        cursor.execute('SELECT username FROM users WHERE username = ?', (username,))
-        result = cursor.fetchone()
+        db_util.execute('INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)',
+                        (username, hashed_password, is_admin))
         
-        if result:
-            print(f"User '{username}' successfully created and verified in database")
-            return True
-        else:
-            print(f"Failed to verify user '{username}' after commit")
-            st.error(f"Failed to create user '{username}': Verification failed after commit")
-            try: conn.rollback() 
-            except: pass
-            return False
+        logger.info("User created: %s, is_admin: %s", username, is_admin)
+        audit.record(audit.USER_CREATED, st.session_state.get('username'), username, "admin" if is_admin else None)
+        return True
             
+    except sqlite3.IntegrityError:
+        # Another session inserted the same username between our check and insert
+        st.error(f"Username '{username}' already exists")
+        return False
+    except password_util.PasswordPoolBusy as e:
+        st.error(str(e))
+        return False
     except sqlite3.Error as e:
-        print(f"SQLite error saving user: {str(e)}")
+        logger.exception("SQLite error saving user: %s", username)
         st.error(f"SQLite error saving user: {str(e)}")
-        if conn:
-            try: 
-                conn.rollback()
-                print("Transaction rolled back due to SQLite error")
-            except Exception as rollback_err:
-                 print(f"Error during rollback: {rollback_err}")
         return False
     except Exception as e:
-        print(f"Unexpected error saving user: {str(e)}")
+        logger.exception("Unexpected error saving user: %s", username)
         st.error(f"Error saving user: {str(e)}")
-        if conn:
-            try: 
-                conn.rollback()
-                print("Transaction rolled back due to unexpected error")
-            except Exception as rollback_err:
-                 print(f"Error during rollback: {rollback_err}")
         return False
-    finally:
-        if conn:
-            conn.close()
-            print(f"Database connection closed after save_user for {username}")
 
 def update_user_password(username, new_password):
     """Update user's password."""
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
     try:
-        # Hash the new password
-        hashed_password = hash_password(new_password)
+        # Hash the new password on the KDF pool
+        hashed_password = password_util.get_pool().hash(new_password)
         
         # Update the password
-        cursor.execute('UPDATE users SET password = ? WHERE username = ?',
-                      (hashed_password, username))
-        conn.commit()
+        db_util.execute('UPDATE users SET password = ? WHERE username = ?',
+                        (hashed_password, username))
+        
+        # Existing sessions of this user must log in again with the new password
+        session_util.revoke_user_tokens(username)
+        logger.info("Password updated for user: %s", username)
+        audit.record(audit.PASSWORD_CHANGED, st.session_state.get('username'), username)
         return True
     except Exception as e:
+        logger.exception("Error updating password for user: %s", username)
         st.error(f"Error updating password: {str(e)}")
         return False
-    finally:
-        conn.close()
 
 def get_all_users():
     """Get all users except admin."""
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute('SELECT username, is_admin FROM users WHERE username != "admin"')
-        users = cursor.fetchall()
-        
-        # Debug output
-        st.write(f"Found {len(users)} users in the database")
-        
+        users = user_repo.all_users()
+        logger.debug("Found %d users in the database", len(users))
         return users
     except Exception as e:
+        logger.exception("Error retrieving users")
         st.error(f"Error retrieving users: {str(e)}")
         return []
-    finally:
-        conn.close()
 
 def login_page():
     """Display the login page."""
@@ -300,8 +276,6 @@ def login_page():
             if not username or not password:
                 st.error("Please enter both username and password")
             else:
-                st.write(f"Attempting to login with username: {username}")
-                
                 is_valid, is_admin = verify_user(username, password)
                 if is_valid:
                     # Update session state
@@ -311,7 +285,7 @@ def login_page():
                     st.session_state.current_page = 'default'
                     st.session_state.current_section = None
                     
-                    # Save session to file for persistence
+                    # Store the session so it survives reloads
                     session_util.save_session(username, is_admin, 'default', None)
                     
                     st.success(f"Login successful! Welcome {username}")
@@ -321,12 +295,60 @@ def login_page():
                     pass
 
 def admin_page():
-    """Display the admin page for user management."""
+    """Display the admin page for user management.
+
+    Each block is a fragment, so interacting with one block reruns only that
+    block instead of the whole script.
+    """
     st.title("👨‍💼 Admin Panel")
     
-    # Create new user section using a form
+    create_user_fragment()
+    update_password_fragment()
+    users_table_fragment()
+    bulk_users_fragment()
+    render_import_status()
+    
+    cache_stats = session_util.token_cache_stats()
+    st.caption(
+        f"Session token cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+        f"({cache_stats['hit_ratio']:.0%} hit ratio), {cache_stats['size']} cached tokens"
+        f" · {log_util.dropped_records()} log records dropped"
+    )
+    throttle_stats = login_throttle.get_throttle().stats()
+    rejected = throttle_stats['rejected']
+    st.caption(
+        f"Login throttle: {throttle_stats['allowed']} attempts allowed, "
+        f"{throttle_stats['rejected_total']} rejected ({rejected[login_throttle.CLIENT]} per client, "
+        f"{rejected[login_throttle.USERNAME]} per username, {rejected[login_throttle.BUSY]} busy) · "
+        f"tracking {throttle_stats['client_keys']} clients and {throttle_stats['username_keys']} usernames"
+    )
+    audit_stats = audit.get_log().stats()
+    st.caption(
+        f"Audit log: {audit_stats['written']:,} events written in {audit_stats['batches']:,} batches, "
+        f"{audit_stats['queued']} queued, {audit_stats['dropped_full']} dropped on a full queue, "
+        f"{audit_stats['dropped_failed']} dropped after failed writes"
+    )
+    directory = user_directory.get_directory()
+    if directory is not None:
+        directory_stats = directory.stats()
+        st.caption(
+            f"User directory: {directory_stats['users']:,} users in memory, "
+            f"{directory_stats['refreshes']} incremental refreshes ({directory_stats['changes_applied']} changed users), "
+            f"{directory_stats['reloads']} full loads"
+        )
+    else:
+        st.caption("User directory: off, user lookups go to SQLite")
+
+@health.gated_fragment
+def create_user_fragment():
+    """Create new user section using a form."""
     st.subheader("Create New User")
     
+    # Confirmation carried over the rerun that follows a successful creation
+    created = st.session_state.pop('admin_created_user', None)
+    if created:
+        st.success(f"User '{created}' created successfully!")
+    
     with st.form(key="create_user_form", clear_on_submit=True):
         new_username = st.text_input("New Username")
         new_password = st.text_input("New Password", type="password")
@@ -337,27 +359,28 @@ def admin_page():
             if not new_username or not new_password:
                 st.error("Please enter both username and password")
             else:
-                st.write(f"Attempting to create user: {new_username}")
                 success = save_user(new_username, new_password, is_admin)
                 
                 if success:
-                    st.success(f"User '{new_username}' created successfully!")
-                    # Refresh the page to show the updated user list
-                    st.rerun()
+                    st.session_state.admin_created_user = new_username
+                    # The user picker and table below list the new user,
+                    # so this is the one action that reruns the whole page
+                    st.rerun(scope="app")
                 # No else needed here, save_user displays errors
 
-    # Update user password section
+@health.gated_fragment
+def update_password_fragment():
+    """Update user password section."""
     st.subheader("Update User Password")
     
-    # Get all users except admin
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT username FROM users WHERE username != "admin"')
-    users = [user[0] for user in cursor.fetchall()]
-    conn.close()
+    # Only the first matches for the typed prefix are loaded, never the whole table
+    search = st.text_input("Search User", key="user_search", placeholder="Start typing a username")
+    users = user_repo.search_usernames(search.strip(), limit=USER_PICKER_LIMIT)
     
     if users:
         selected_user = st.selectbox("Select User", users, key="selected_user")
+        if len(users) == USER_PICKER_LIMIT:
+            st.caption(f"Showing the first {USER_PICKER_LIMIT} matches; type more of the name to narrow down.")
         update_new_password = st.text_input("New Password", type="password", key="update_password")
         
         if st.button("Update Password", key="update_pwd_btn"):
@@ -366,51 +389,213 @@ def admin_page():
             else:
                 success = update_user_password(selected_user, update_new_password)
                 if success:
+                    # Nothing else on the page shows passwords; no app rerun needed
                     st.success(f"Password updated for {selected_user}")
-                    # Refresh to show updated data
-                    st.rerun()
                 else:
                     st.error(f"Failed to update password for {selected_user}")
+    elif search:
+        st.info(f"No non-admin users starting with '{search.strip()}'")
     else:
         st.info("No non-admin users to manage")
-    
-    # Display all users table
+
+def _users_table_page(step):
+    """Button callback: move the users table one page forward (1) or back (-1)."""
+    cursors = st.session_state.users_table_cursors
+    if step > 0:
+        cursors.append(st.session_state.users_table_next)
+    elif len(cursors) > 1:
+        cursors.pop()
+
+@health.gated_fragment
+def users_table_fragment():
+    """Display all users table, one keyset-paginated page at a time."""
     st.subheader("All Users")
     
-    # Button to refresh user list table
-    if st.button("Refresh List", key="refresh_list_btn"):
-        st.rerun()
+    filter_col, size_col = st.columns([3, 1])
+    prefix = filter_col.text_input("Filter by username prefix", key="users_table_prefix").strip()
+    page_size = size_col.selectbox("Rows per page", USERS_TABLE_PAGE_SIZES, index=1, key="users_table_page_size")
     
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
+    # Start over from the first page whenever the filter or page size changes.
+    # users_table_cursors holds the last username before each visited page.
+    if st.session_state.get('users_table_filter') != (prefix, page_size):
+        st.session_state.users_table_filter = (prefix, page_size)
+        st.session_state.users_table_cursors = [None]
+    cursors = st.session_state.users_table_cursors
     
     try:
-        cursor.execute('SELECT username, is_admin FROM users WHERE username != "admin"')
-        all_users = cursor.fetchall()
+        # Fetch one extra row to know whether there is a next page
+        rows = user_repo.list_users(prefix, after=cursors[-1], limit=page_size + 1)
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        st.session_state.users_table_next = rows[-1][0] if rows else None
         
-        if all_users:
+        if prefix:
+            matching = user_repo.count_matching(prefix)
+            total_label = f"{matching:,}+" if matching >= user_repo.COUNT_LIMIT else f"{matching:,}"
+        else:
+            total_label = f"{user_repo.count_users():,}"
+        
+        if rows:
             user_data = []
-            for username, is_admin_flag in all_users:
+            for username, is_admin_flag in rows:
                 user_data.append({
                     "Username": username,
                     "Admin": "Yes" if is_admin_flag else "No"
                 })
-            st.dataframe(user_data)
+            st.dataframe(user_data, use_container_width=True)
+        elif prefix:
+            st.info(f"No non-admin users starting with '{prefix}'")
         else:
             st.info("No non-admin users found in the database")
+        
+        prev_col, info_col, next_col, refresh_col = st.columns([1, 3, 1, 1])
+        prev_col.button("Previous", key="users_table_prev", disabled=len(cursors) == 1,
+                        on_click=_users_table_page, args=(-1,))
+        info_col.caption(f"Page {len(cursors)} · {total_label} matching users")
+        next_col.button("Next", key="users_table_next_btn", disabled=not has_next,
+                        on_click=_users_table_page, args=(1,))
+        # Clicking the button reruns this fragment, which reloads the page
+        refresh_col.button("Refresh List", key="refresh_list_btn")
     except Exception as e:
         st.error(f"Error retrieving users: {str(e)}")
-    finally:
-        conn.close()
+
+@health.gated_fragment
+def bulk_users_fragment():
+    """Bulk import and export of users."""
+    st.subheader("Bulk Import / Export")
+    
+    uploaded = st.file_uploader(
+        "Import users from CSV or NDJSON",
+        type=["csv", "ndjson", "jsonl", "json"],
+        key="bulk_import_file",
+        help="CSV header: username,password,is_admin. NDJSON: one object per line with the same keys.",
+    )
+    if uploaded is not None and st.button("Import Users", key="bulk_import_btn"):
+        # Imported on the job queue, so this session and its rerun slot are free meanwhile
+        try:
+            uploaded.seek(0)
+            jobs.get_queue().submit_import(st.session_state.username, uploaded, uploaded.name)
+        except OSError as e:
+            st.error(f"Could not queue the import: {str(e)}")
+        else:
+            # Full rerun so the import status below starts polling
+            st.rerun(scope="app")
+    
+    export_format = st.radio("Export format", user_bulk.FORMATS, horizontal=True, key="bulk_export_format")
+    if st.button("Prepare Export", key="bulk_export_btn"):
+        # Stream the table to a temporary file rather than building it in memory
+        previous = st.session_state.pop('admin_export_path', None)
+        if previous and os.path.exists(previous):
+            os.remove(previous)
+        fd, path = tempfile.mkstemp(prefix="users_export_", suffix=f".{export_format}")
+        os.close(fd)
+        user_bulk.export_to_file(path, export_format)
+        st.session_state.admin_export_path = path
+    
+    export_path = st.session_state.get('admin_export_path')
+    if export_path and os.path.exists(export_path):
+        with open(export_path, "rb") as f:
+            st.download_button("Download Users", f, file_name=f"users{os.path.splitext(export_path)[1]}",
+                               key="bulk_export_download")
+
+def render_import_status():
+    """Progress, then result, of this admin's latest bulk import; polls while it runs."""
+    recent = jobs.list_jobs(st.session_state.username, kind=jobs.USER_IMPORT, limit=1)
+    if not recent:
+        return
+    active = recent[0].status in jobs.ACTIVE_STATUSES
+    poll = config.JOB_POLL_SECONDS if active else None
+    health.gated_fragment(import_status_fragment, run_every=poll)(recent[0].job_id, polling=active)
+
+def import_status_fragment(job_id, polling):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return
+    if polling and job.status not in jobs.ACTIVE_STATUSES:
+        # Finished: a full rerun stops the polling timer and lists the imported users above
+        st.rerun()
+    
+    if job.status == jobs.QUEUED:
+        st.info(f"Import of {job.input_name} is queued.")
+    elif job.status == jobs.RUNNING:
+        fraction = min(job.bytes_done / job.bytes_total, 1.0) if job.bytes_total else 0.0
+        st.progress(fraction, text=f"Importing {job.input_name}: {job.rows_done:,} rows read")
+    elif job.status == jobs.FAILED:
+        st.error(f"Could not import users from {job.input_name}: {job.error}")
+    elif os.path.exists(job.output_path):
+        result = jobs.import_result(job)
+        st.success(f"Imported {result.imported:,} of {result.rows:,} rows from {job.input_name}")
+        if result.error_count:
+            st.warning(f"{result.error_count:,} rows were skipped")
+            st.dataframe(
+                [{"Line": line, "Username": name, "Error": message} for line, name, message in result.errors],
+                use_container_width=True,
+            )
+
+def get_page_registry():
+    """Process-wide page registry, with the admin page from this script registered."""
+    registry = page_registry.get_registry()
+    registry.register('admin', "Admin Panel", admin_page, role=page_registry.ROLE_ADMIN)
+    return registry
+
+def navigate(page_id, section_id):
+    """Button callback: switch to another page and record it in the session store.
+
+    Callbacks run before the script, so a navigation click costs a single
+    rerun that already renders the new page (no extra st.rerun()).
+    """
+    st.session_state.current_page = page_id
+    st.session_state.current_section = section_id
+    
+    # Record the new navigation state (coalesced by the session store)
+    session_util.update_navigation(page_id, section_id)
+    audit.record(audit.PAGE_VIEW, st.session_state.username, page_id, section_id)
+
+def logout():
+    """Button callback: end the session."""
+    audit.record(audit.LOGOUT, st.session_state.username)
+    
+    # Clear session state
+    st.session_state.authenticated = False
+    st.session_state.username = None
+    st.session_state.is_admin = False
+    st.session_state.current_page = 'default'
+    st.session_state.current_section = None
+    
+    # Remove the stored session
+    session_util.clear_session()
 
 def main():
     """Main application logic."""
-    # Initialize database
-    db_initialized = init_db()
+    # Above the in-flight rerun limit, answer with the busy page instead of queuing more work
+    with health.admit_rerun() as admitted:
+        if not admitted:
+            busy_page()
+            return
+        with metrics_util.span("rerun"):
+            render_app()
+
+def busy_page():
+    """Lightweight response while the server is overloaded: no database or page work."""
+    st.warning(health.BUSY_MESSAGE)
+    st.button("Try again", key="busy_retry")
+
+def render_app():
+    """Render one rerun; each stage is timed for the Performance page."""
+    # Apply pending schema migrations (once per server process)
+    with metrics_util.span("init_db"):
+        db_initialized = init_db()
     
     if not db_initialized:
         st.error("Failed to initialize database. Application may not function correctly.")
     
+    # Try to restore this browser's session from the session store
+    if not st.session_state.authenticated:
+        with metrics_util.span("restore_session"):
+            session_restored = session_util.restore_session()
+        if session_restored:
+            logger.debug("Session restored for user: %s", st.session_state.username)
+    
     # Initialize page state if not present
     if 'current_page' not in st.session_state:
         st.session_state.current_page = 'default'
@@ -419,93 +604,42 @@ def main():
     
     # Show login page if not authenticated
     if not st.session_state.authenticated:
-        login_page()
+        with metrics_util.span("page.login"):
+            login_page()
         return
     
-    # Sidebar navigation
-    st.sidebar.title("Navigation")
-
-
-# ------------------------------------------------------------
-    # ABOUT
-    about_expander = st.sidebar.expander("About", expanded=(st.session_state.current_section == 'about'))
-    with about_expander:
-        if st.button("Content", key="about_content"):
-            st.session_state.current_page = 'about_content'
-            st.session_state.current_section = 'about'
-            
-            # Update session file with new navigation state
-            session_util.save_session(
-                st.session_state.username, 
-                st.session_state.is_admin,
-                'about_content',
-                'about'
-            )
-            
-            st.rerun()
-        if st.button("About", key="about_about"):
-            st.session_state.current_page = 'about_about'
-            st.session_state.current_section = 'about'
-            
-            # Update session file with new navigation state
-            session_util.save_session(
-                st.session_state.username, 
-                st.session_state.is_admin,
-                'about_about',
-                'about'
-            )
-            
-            st.rerun()
-    
-    # Create an expander for Models section
-    # MODELS
-    models_expander = st.sidebar.expander("Models", expanded=(st.session_state.current_section == 'models'))
-    with models_expander:
-        if st.button("Model A", key="models_a"):
-            st.session_state.current_page = 'model_a'
-            st.session_state.current_section = 'models'
-            
-            # Update session file with new navigation state
-            session_util.save_session(
-                st.session_state.username, 
-                st.session_state.is_admin,
-                'model_a',
-                'models'
-            )
-            
-            st.rerun()
-        if st.button("Model B", key="models_b"):
-            st.session_state.current_page = 'model_b'
-            st.session_state.current_section = 'models'
-            
-            # Update session file with new navigation state
-            session_util.save_session(
-                st.session_state.username, 
-                st.session_state.is_admin,
-                'model_b',
-                'models'
-            )
-            
-            st.rerun()
+    with metrics_util.span("sidebar"):
+        registry = build_sidebar()
     
-# ------------------------------------------------------------
-
-
+    # Dispatch to the current page; its module is imported on first visit
+    current_page = st.session_state.current_page
+    if current_page != 'default':
+        # Unknown ids share one stage so stored page names cannot grow the metrics
+        stage = f"page.{current_page}" if registry.get(current_page) else "page.unknown"
+        with metrics_util.span(stage):
+            rendered = registry.render(current_page, st.session_state.is_admin)
+        if not rendered:
+            st.error("This page does not exist or you do not have access to it.")
+    
+    # Back button only on admin page
+    if current_page == 'admin':
+        # Back button
+        st.sidebar.button("Back to Main", on_click=navigate, args=('default', None))
 
+def build_sidebar():
+    """Sidebar navigation; returns the page registry used to build it."""
+    st.sidebar.title("Navigation")
+    registry = get_page_registry()
+    
+    # One expander per discovered section under pages/
+    for section in registry.sections(st.session_state.is_admin):
+        with st.sidebar.expander(section.label, expanded=(st.session_state.current_section == section.section_id)):
+            for page in section.pages:
+                st.button(page.label, key=page.page_id, on_click=navigate,
+                          args=(page.page_id, section.section_id))
 
     # Logout button
-    if st.sidebar.button("Logout"):
-        # Clear session state
-        st.session_state.authenticated = False
-        st.session_state.username = None
-        st.session_state.is_admin = False
-        st.session_state.current_page = 'default'
-        st.session_state.current_section = None
-        
-        # Clear session file
-        session_util.clear_session()
-        
-        st.rerun()
+    st.sidebar.button("Logout", on_click=logout)
     
     # User info
     st.sidebar.write(f"Logged in as: {st.session_state.username}")
@@ -513,52 +647,11 @@ def main():
     # Admin panel button
     if st.session_state.is_admin:
         st.sidebar.markdown("---")
-        if st.sidebar.button("Admin Panel"):
-            st.session_state.current_page = 'admin'
-            st.session_state.current_section = None
-            
-            # Update session file with new page state
-            session_util.save_session(
-                st.session_state.username, 
-                st.session_state.is_admin,
-                'admin',
-                None
-            )
-            
-            st.rerun()
+        st.sidebar.button("Admin Panel", on_click=navigate, args=('admin', None))
     
     # Navigation sections
     st.sidebar.markdown("---")
-    
-
-
-    if st.session_state.current_page == 'admin':
-        # Display admin page
-        admin_page()
-    elif st.session_state.current_page == 'about_content':
-        content_page()
-    elif st.session_state.current_page == 'about_about':
-        about_page()
-    elif st.session_state.current_page == 'model_a':
-        model_a_page()
-    elif st.session_state.current_page == 'model_b':
-        model_b_page()
-    
-    # Back button only on admin page
-    if st.session_state.current_page == 'admin':
-        # Back button
-        if st.sidebar.button("Back to Main"):
-            st.session_state.current_page = 'default'
-            
-            # Update session file with new navigation state
-            session_util.save_session(
-                st.session_state.username, 
-                st.session_state.is_admin,
-                'default',
-                None
-            )
-            
-            st.rerun()
+    return registry
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,209 @@
+import atexit
+import queue
+import threading
+import time
+
+import config
+import db_util
+import log_util
+import usage_rollups
+
+logger = log_util.get_logger(__name__)
+
+# Audit trail of logins, logouts, user administration and page navigation.
+#
+# Script threads only put a tuple on a bounded in-memory queue. A writer
+# thread takes events off the queue and appends them to the audit_events
+# table in batches: one transaction per AUDIT_BATCH_SIZE events, or per
+# AUDIT_FLUSH_INTERVAL_MS after the first event of a batch, whichever comes
+# first. When the queue is full a caller waits up to AUDIT_ENQUEUE_TIMEOUT_MS
+# for room (backpressure while the writer catches up); after that the event
+# is dropped and counted, so a stalled database never blocks a rerun for long.
+# A batch that still fails after WRITE_ATTEMPTS is dropped and counted too.
+# On shutdown the writer drains the queue before exiting.
+#
+# The same transaction folds the batch into the usage rollups
+# (usage_rollups.py), and the writer compacts them every
+# ROLLUP_COMPACT_INTERVAL_SECONDS.
+#
+# audit_events is append-only: a trigger rejects updates, and rows are only
+# ever deleted by retention pruning (usage_rollups.compact).
+
+# Event types
+LOGIN = "login"
+LOGIN_FAILED = "login_failed"
+LOGOUT = "logout"
+USER_CREATED = "user_created"
+PASSWORD_CHANGED = "password_changed"
+PAGE_VIEW = "page_view"
+
+WRITE_ATTEMPTS = 3
+
+# Longer field values (usernames typed on the login form) are truncated
+MAX_FIELD_LENGTH = 256
+
+# Wakes the writer on shutdown; never written
+_STOP = object()
+
+def _clip(value):
+    return value[:MAX_FIELD_LENGTH] if isinstance(value, str) else value
+
+class AuditLog:
+    """Bounded event queue drained into audit_events by a background writer."""
+
+    def __init__(self, queue_size=None, batch_size=None, flush_interval=None, enqueue_timeout=None):
+        if flush_interval is None:
+            flush_interval = config.AUDIT_FLUSH_INTERVAL_MS / 1000
+        if enqueue_timeout is None:
+            enqueue_timeout = config.AUDIT_ENQUEUE_TIMEOUT_MS / 1000
+        self.batch_size = batch_size or config.AUDIT_BATCH_SIZE
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=queue_size or config.AUDIT_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_compact = 0.0
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped_full = 0
+        self.dropped_failed = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, event, username=None, target=None, detail=None):
+        """Queue one event; returns False if it was dropped (queue still full, or the log is closed)."""
+        item = (int(time.time()), event, _clip(username), _clip(target), _clip(detail))
+        try:
+            if self._stopped.is_set():
+                raise queue.Full
+            if self.enqueue_timeout > 0:
+                self._queue.put(item, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped_full += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _collect(self):
+        """Wait for the next batch: up to batch_size events, or what arrived within flush_interval."""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [] if first is _STOP else [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                if self._stopped.is_set():
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        return batch
+
+    def _run(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if batch:
+                self.write(batch)
+            if time.monotonic() - self._last_compact >= config.ROLLUP_COMPACT_INTERVAL_SECONDS:
+                self._last_compact = time.monotonic()
+                try:
+                    usage_rollups.compact()
+                except Exception:
+                    logger.exception("Error compacting usage rollups")
+
+    def write(self, batch):
+        """Append ``batch`` and its rollups in one transaction, retrying a few times before dropping it."""
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                with db_util.transaction() as conn:
+                    conn.executemany(
+                        'INSERT INTO audit_events (created_at, event, username, target, detail) '
+                        'VALUES (?, ?, ?, ?, ?)', batch)
+                    usage_rollups.apply(conn, batch)
+            except Exception:
+                if attempt == WRITE_ATTEMPTS:
+                    logger.exception("Dropping %d audit events after %d failed writes", len(batch), attempt)
+                    with self._lock:
+                        self.dropped_failed += len(batch)
+                    return False
+                logger.warning("Audit write failed (attempt %d), retrying", attempt)
+                time.sleep(self.flush_interval * attempt)
+                continue
+            with self._lock:
+                self.written += len(batch)
+                self.batches += 1
+            return True
+
+    def close(self, timeout=None):
+        """Stop accepting events and wait for the writer to drain the queue."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            pass
+        thread = self._thread
+        if thread is not None:
+            thread.join(config.AUDIT_SHUTDOWN_TIMEOUT_SECONDS if timeout is None else timeout)
+            if thread.is_alive():
+                logger.warning("Audit writer still busy on shutdown, %d events queued", self._queue.qsize())
+                return
+        # No writer (never started or died): drain here
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            self.write(batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "batches": self.batches,
+                "dropped_full": self.dropped_full,
+                "dropped_failed": self.dropped_failed,
+                "dropped": self.dropped_full + self.dropped_failed,
+            }
+
+_log = None
+_log_lock = threading.Lock()
+
+def get_log():
+    """Return the process-wide audit log, starting its writer on first use."""
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                log = AuditLog()
+                log.start()
+                _log = log
+    return _log
+
+def record(event, username=None, target=None, detail=None):
+    """Queue an audit event on the process-wide log."""
+    return get_log().record(event, username, target, detail)
@@ -0,0 +1,138 @@
+"""Per-interaction latency on the admin page, before and after the admin fragments.
+
+Before the admin blocks became fragments, every click on the admin page
+re-executed the whole script, and the old handlers called st.rerun(), so most
+clicks paid for two runs. Now a click reruns only the fragment it belongs to;
+creating a user still reruns the whole app once (st.rerun(scope="app")) so the
+pickers list the new user.
+
+Both versions are measured the same way: the baseline revision is exported
+from git into a scratch directory, each version is started with
+``streamlit run`` on a seeded database, and a simulated browser (the
+websocket client of load_test.py) logs in, opens the Admin Panel and clicks.
+A click is timed from sending the rerun request until the server reports the
+run finished, including any st.rerun() it triggered and Streamlit's own
+fixed cost per run (message round trip, script thread start), which an
+empty fragment pays too. AppTest cannot be used for this: it reruns the whole
+script on every click and ignores fragments.
+
+Usage: python benchmarks/bench_admin_fragments.py [--users 2000] [--repeats 20] [--baseline REV]
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+import load_test
+
+ROOT = load_test.ROOT
+
+# The last revision before the admin blocks became fragments
+DEFAULT_BASELINE = "d8871dc~1"
+
+def export_revision(rev, target):
+    """Write the tree of git revision ``rev`` into ``target``."""
+    archive = subprocess.run(["git", "-C", ROOT, "archive", "--format=tar", rev],
+                             check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+
+def seed_users(tree, workdir, count):
+    """Create the schema with the tree's own migrations, then add ``count`` users."""
+    env = dict(os.environ, APP_DB_PATH=os.path.join(workdir, "users.db"), APP_LOG_FILE="")
+    subprocess.run([sys.executable, "-c", "import migrations; migrations.ensure_schema()"],
+                   cwd=tree, env=env, check=True, capture_output=True)
+    rows = [(f"user{i:07d}", "0" * 64, i % 10 == 0) for i in range(count)]
+    with sqlite3.connect(env["APP_DB_PATH"]) as conn:
+        conn.executemany('INSERT OR IGNORE INTO users (username, password, is_admin) VALUES (?, ?, ?)', rows)
+
+async def update_password(session, password):
+    """Type into the (form-less) new password box and press Update Password."""
+    box = session.widget("text_input", "New Password", form_id="")
+    button = session.widget("button", "Update Password")
+    text = WidgetState()
+    text.id = box.id
+    text.string_value = password
+    click = WidgetState()
+    click.id = button.id
+    click.trigger_value = True
+    await session.rerun([text, click], button.fragment_id)
+
+async def measure(port, repeats):
+    """Median and p90 milliseconds per interaction for one running server."""
+    session = load_test.BrowserSession(port, timeout=120)
+    names = (f"bench{i:06d}" for i in itertools.count())
+    interactions = [
+        ("create user (form submit)", lambda: session.submit_form("Create User", {
+            "New Username": next(names), "New Password": "bench-password", "Admin privileges": False})),
+        ("update password", lambda: update_password(session, "bench-password")),
+        ("refresh user table", lambda: session.click("Refresh List")),
+    ]
+    samples = {label: [] for label, _ in interactions}
+    try:
+        await session.connect()
+        await load_test.login(session, *load_test.ADMIN_USER)
+        await session.click("Admin Panel")
+        for i in range(repeats + 1):
+            for label, interaction in interactions:
+                start = time.perf_counter()
+                await interaction()
+                if i:  # the first round warms up
+                    samples[label].append((time.perf_counter() - start) * 1000)
+    finally:
+        session.close()
+    return {label: (statistics.median(values), load_test.percentile(sorted(values), 0.9))
+            for label, values in samples.items()}
+
+def run_version(tree, users, repeats, kdf_iterations):
+    workdir = tempfile.mkdtemp(prefix="bench_admin_")
+    seed_users(tree, workdir, users)
+    port = load_test.free_port()
+    server = load_test.start_server(port, workdir, kdf_iterations, app_path=os.path.join(tree, "app.py"))
+    try:
+        return asyncio.run(measure(port, repeats))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Admin page click latency before and after the fragments")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="git revision to compare against")
+    parser.add_argument("--kdf-iterations", type=int, default=1000,
+                        help="APP_KDF_ITERATIONS for the current version (the baseline has no KDF)")
+    args = parser.parse_args(argv)
+
+    baseline_tree = tempfile.mkdtemp(prefix="bench_admin_baseline_")
+    export_revision(args.baseline, baseline_tree)
+    print(f"measuring {args.baseline} ...", flush=True)
+    before = run_version(baseline_tree, args.users, args.repeats, args.kdf_iterations)
+    print("measuring the working tree ...", flush=True)
+    after = run_version(ROOT, args.users, args.repeats, args.kdf_iterations)
+
+    print(f"admin page with {args.users} users, {args.repeats} clicks each, median (p90) ms per click")
+    print(f"{'interaction':<28}{'before':>18}{'after':>18}{'speedup':>10}")
+    for label, (median, p90) in before.items():
+        new_median, new_p90 = after[label]
+        print(f"{label:<28}{f'{median:.1f} ({p90:.1f})':>18}{f'{new_median:.1f} ({new_p90:.1f})':>18}"
+              f"{median / new_median:>9.1f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Compare loading evaluation data from CSV with pandas against the memory-mapped column store.
+
+Writes a synthetic CSV (four float columns and a class label) and reports, for
+each way of getting the columns into NumPy, the time and the peak Python heap
+allocation (tracemalloc; memory-mapped pages live in the OS page cache and are
+shared, so they are not counted):
+
+  pandas       pandas.read_csv of the whole file, then column sums
+  convert      one-off CSV -> column store conversion (column_store.sync)
+  open+scan    opening the store in a fresh process state and summing every column
+  reopen       a further open in the same process (what each session pays)
+
+Usage: python benchmarks/bench_column_store.py [--rows 1000000] [--repeats 3] [--data-dir DIR]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import column_store
+
+COLUMNS = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+CLASSES = np.array(["setosa", "versicolor", "virginica"])
+
+def write_csv(path, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(COLUMNS + ["species"]) + "\n")
+        for start in range(0, rows, 100000):
+            n = min(100000, rows - start)
+            values = rng.uniform(0.1, 8.0, (n, len(COLUMNS)))
+            labels = CLASSES[rng.integers(0, len(CLASSES), n)]
+            f.write("".join("%.3f,%.3f,%.3f,%.3f,%s\n" % (*row, label)
+                            for row, label in zip(values.tolist(), labels.tolist())))
+
+def measure(func, repeats, trace=True):
+    """(median seconds over ``repeats`` runs, peak traced bytes of one more run or None).
+
+    Tracing slows allocation-heavy code down a lot, so timed runs are untraced.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    if not trace:
+        return statistics.median(times), None
+    tracemalloc.start()
+    try:
+        func()
+        return statistics.median(times), tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--data-dir", default=None, help="where to write the CSV and the store (default: a temp dir)")
+    args = parser.parse_args()
+
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench_column_store_")
+    os.makedirs(data_dir, exist_ok=True)
+    csv_path = os.path.join(data_dir, "eval.csv")
+    store_dir = os.path.join(data_dir, "eval.cols")
+    if not os.path.exists(csv_path):
+        write_csv(csv_path, args.rows)
+    print(f"{csv_path}: {os.path.getsize(csv_path) / 1024 / 1024:.1f} MB")
+
+    results = []
+    if pd is not None:
+        def load_pandas():
+            frame = pd.read_csv(csv_path)
+            return [frame[name].to_numpy().sum() for name in COLUMNS]
+        results.append(("pandas", *measure(load_pandas, args.repeats)))
+    else:
+        print("pandas is not installed; skipping the pandas baseline")
+
+    def convert():
+        if os.path.isdir(store_dir):
+            for name in os.listdir(store_dir):
+                os.remove(os.path.join(store_dir, name))
+        column_store.sync(csv_path, store_dir)
+    results.append(("convert", *measure(convert, 1, trace=False)))
+
+    def open_and_scan():
+        column_store._stores.clear()
+        store = column_store.open_store(store_dir)
+        return [store.column(name).sum() for name in COLUMNS] + [np.bincount(store.column("species"))]
+    results.append(("open+scan", *measure(open_and_scan, args.repeats)))
+
+    def reopen():
+        store = column_store.open_store(store_dir)
+        return store.column(COLUMNS[0])[:10].sum()
+    results.append(("reopen", *measure(reopen, args.repeats)))
+
+    print(f"{'step':<12}{'seconds':>10}{'peak heap MB':>15}")
+    for name, seconds, peak in results:
+        print(f"{name:<12}{seconds:>10.4f}{'-' if peak is None else f'{peak / 1024 / 1024:.1f}':>15}")
+    if pd is not None:
+        speedup = results[0][1] / results[2][1]
+        print(f"open+scan is {speedup:.0f}x faster than pandas.read_csv")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Pick a PBKDF2 iteration count that fits a target login latency on this host.
+
+Measures single-hash cost, then the latency seen by each login when
+``--concurrency`` logins arrive at once and share the PasswordPool's workers,
+and prints the iteration count to use as APP_KDF_ITERATIONS.
+
+Usage: python benchmarks/bench_kdf.py [--target-ms 250] [--concurrency 8] [--workers N]
+"""
+import argparse
+import hashlib
+import math
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import password_util
+
+PROBE_ITERATIONS = 100000
+
+def time_hash(iterations, repeats=5):
+    """Median seconds for one PBKDF2-SHA256 computation."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        hashlib.pbkdf2_hmac("sha256", b"benchmark-password", b"0123456789abcdef", iterations)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def time_burst(iterations, concurrency, workers):
+    """Per-login latencies when ``concurrency`` verifications hit the pool together."""
+    stored = password_util.hash_password("benchmark-password", iterations)
+    pool = password_util.PasswordPool(workers=workers, max_pending=concurrency, queue_timeout=60)
+
+    def login(_):
+        start = time.perf_counter()
+        pool.verify("benchmark-password", stored)
+        return time.perf_counter() - start
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            return sorted(clients.map(login, range(concurrency)))
+    finally:
+        pool.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=250.0, help="worst-case login latency budget")
+    parser.add_argument("--concurrency", type=int, default=8, help="simultaneous logins to plan for")
+    parser.add_argument("--workers", type=int, default=config.KDF_WORKERS)
+    args = parser.parse_args()
+
+    per_iteration = time_hash(PROBE_ITERATIONS) / PROBE_ITERATIONS
+    # Logins beyond the worker count queue behind each other
+    waves = math.ceil(args.concurrency / args.workers)
+    budget = args.target_ms / 1000 / waves
+    iterations = max(10000, int(budget / per_iteration) // 10000 * 10000)
+
+    print(f"host: {os.cpu_count()} CPUs, pool workers: {args.workers}")
+    print(f"PBKDF2-SHA256 cost: {per_iteration * 1e6 * 1000:.1f} ms per 1,000,000 iterations")
+    print(f"configured APP_KDF_ITERATIONS={config.KDF_ITERATIONS}: "
+          f"{time_hash(config.KDF_ITERATIONS, repeats=3) * 1000:.0f} ms per hash")
+
+    latencies = time_burst(iterations, args.concurrency, args.workers)
+    p50 = latencies[len(latencies) // 2] * 1000
+    worst = latencies[-1] * 1000
+    print(f"{args.concurrency} concurrent logins at {iterations} iterations: "
+          f"p50 {p50:.0f} ms, max {worst:.0f} ms (target {args.target_ms:.0f} ms)")
+    print(f"suggested: APP_KDF_ITERATIONS={iterations}")
+
+if __name__ == "__main__":
+    main()
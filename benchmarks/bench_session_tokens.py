@@ -0,0 +1,59 @@
+"""Compare encode/decode throughput of the legacy JSON session tokens and the
+binary HMAC tokens in ``session_tokens``.
+
+Usage: python benchmarks/bench_session_tokens.py [iterations]
+"""
+import base64
+import hashlib
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("APP_SESSION_SECRET", "benchmark-secret")
+
+import session_tokens
+
+def legacy_create_session_token(username, is_admin, current_page='default', current_section=None):
+    """The original base64(JSON) token, kept here as the benchmark reference"""
+    session_data = {
+        "username": username,
+        "is_admin": is_admin,
+        "current_page": current_page,
+        "current_section": current_section,
+        "expiry": (datetime.now() + timedelta(days=7)).isoformat()
+    }
+    secret = "streamlit_app_secret_key"
+    session_data["signature"] = hashlib.sha256(f"{username}{secret}".encode()).hexdigest()
+    return base64.b64encode(json.dumps(session_data).encode()).decode()
+
+def legacy_validate_session_token(token):
+    session_data = json.loads(base64.b64decode(token).decode())
+    if datetime.now() > datetime.fromisoformat(session_data["expiry"]):
+        return None
+    secret = "streamlit_app_secret_key"
+    expected = hashlib.sha256(f"{session_data['username']}{secret}".encode()).hexdigest()
+    if session_data.get("signature") != expected:
+        return None
+    return session_data
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{label:<28} {number / seconds:>12,.0f} ops/s  {seconds / number * 1e6:8.2f} us/op")
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    legacy = legacy_create_session_token("some.user", False, "model_a", "models")
+    binary = session_tokens.encode_token("some.user", False)
+
+    print(f"token size: legacy {len(legacy)} chars, binary {len(binary)} chars")
+    bench("legacy encode", lambda: legacy_create_session_token("some.user", False, "model_a", "models"), number)
+    bench("binary encode", lambda: session_tokens.encode_token("some.user", False), number)
+    bench("legacy decode+verify", lambda: legacy_validate_session_token(legacy), number)
+    bench("binary decode+verify", lambda: session_tokens.decode_token(binary), number)
+
+if __name__ == "__main__":
+    main()
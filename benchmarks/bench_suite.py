@@ -0,0 +1,343 @@
+"""Headless benchmark suite: page reruns, logins, user queries and session tokens.
+
+Everything runs in-process with Streamlit's AppTest (no browser, no network):
+
+  cold_start               first run of app.py in a fresh interpreter
+  rerun.<page>             rerun latency of each page for a logged-in admin
+  login                    login_page -> verify_user round trip (configured KDF cost)
+  save_user.<n>            app.save_user against a database seeded with n users
+  get_all_users.<n>        app.get_all_users against the same database
+  token.create/validate    create_session_token / validate_session_token throughput
+
+save_user is timed with APP_BENCH_KDF_ITERATIONS (default 1000) so it measures
+the database path rather than the password hash; login uses the configured cost.
+Seeded databases are kept in --data-dir and reused by later runs.
+
+--only selects benchmark groups by name (cold_start, rerun.<page>, login,
+token, database.<n>). Results are written as JSON. Each result is compared
+against the stored baseline and the exit status is 1 if any is worse by more
+than --tolerance. benchmarks/baseline.json is the committed baseline; with
+--ci (or CI set in the environment) a missing baseline, or a benchmark it
+has no value for, fails the run instead of only printing the results.
+
+Usage:
+  python benchmarks/bench_suite.py [--sizes 1000,100000,1000000] [--only REGEX]
+      [--output results.json] [--baseline baseline.json] [--save-baseline] [--tolerance 0.2] [--ci]
+"""
+import argparse
+import json
+import logging
+import os
+import platform as platform_info
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_suite_")
+os.environ.setdefault("APP_DB_PATH", os.path.join(WORKDIR, "users.db"))
+os.environ.setdefault("APP_SESSION_SECRET", "benchmark-secret")
+os.environ.setdefault("APP_LOG_FILE", os.path.join(WORKDIR, "app.log"))
+os.environ.setdefault("APP_LOG_LEVEL", "WARNING")
+# Every benchmark login comes from one client as one user: keep the login throttle out of the way
+os.environ.setdefault("APP_LOGIN_CLIENT_BURST", "1000000")
+os.environ.setdefault("APP_LOGIN_USER_BURST", "1000000")
+
+import streamlit
+from streamlit.testing.v1 import AppTest
+
+import config
+import db_util
+import migrations
+
+# Streamlit calls made outside a script run (app helpers in bare mode, AppTest
+# state access) warn on every call. AppTest resets log levels on each run, so
+# silence these loggers with filters instead.
+for _name in ("streamlit.runtime.scriptrunner_utils.script_run_context",
+              "streamlit.runtime.state.session_state_proxy"):
+    logging.getLogger(_name).addFilter(lambda record: record.levelno >= logging.ERROR)
+
+APP_PATH = os.path.join(ROOT, "app.py")
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+BENCH_KDF_ITERATIONS = int(os.environ.get("APP_BENCH_KDF_ITERATIONS", 1000))
+
+# page_id -> section the sidebar would record for it
+PAGES = {
+    "admin": None,
+    "about_content": "about",
+    "about_about": "about",
+    "model_a": "models",
+    "model_b": "models",
+}
+
+COLD_START_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.run()
+if at.exception:
+    raise SystemExit(at.exception[0].value)
+print((time.perf_counter() - start) * 1000)
+"""
+
+def latency(samples_ms):
+    """Summarise latency samples; lower is better."""
+    ordered = sorted(samples_ms)
+    return {
+        "unit": "ms",
+        "better": "lower",
+        "value": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "min": ordered[0],
+        "samples": len(ordered),
+    }
+
+def throughput(operations, seconds):
+    """Summarise a throughput measurement; higher is better."""
+    return {
+        "unit": "ops/s",
+        "better": "higher",
+        "value": operations / seconds if seconds else 0.0,
+        "samples": operations,
+    }
+
+def time_call(func, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+# Benchmarks
+
+def bench_cold_start(repeats):
+    samples = []
+    env = dict(os.environ)
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT.format(app=APP_PATH)],
+                             cwd=WORKDIR, env=env, capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return latency(samples)
+
+def admin_app(page_id):
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.session_state["authenticated"] = True
+    at.session_state["username"] = "admin"
+    at.session_state["is_admin"] = True
+    at.session_state["current_page"] = page_id
+    at.session_state["current_section"] = PAGES[page_id]
+    return at
+
+def bench_rerun(page_id, repeats):
+    at = admin_app(page_id)
+    at.run()  # warm-up: first visit imports the page module
+    if at.exception:
+        raise RuntimeError(f"{page_id}: {at.exception[0].value}")
+    return latency(time_call(at.run, repeats))
+
+def bench_login(repeats):
+    total = 0.0
+    samples = []
+    for _ in range(repeats):
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        at.run()
+        at.text_input[0].input("admin")
+        at.text_input[1].input("admin123")
+        start = time.perf_counter()
+        at.button[0].click().run()
+        elapsed = time.perf_counter() - start
+        if not at.session_state["authenticated"]:
+            raise RuntimeError("benchmark login failed")
+        total += elapsed
+        samples.append(elapsed * 1000)
+    result = latency(samples)
+    result["logins_per_sec"] = repeats / total
+    return result
+
+def seeded_db(data_dir, size):
+    """Path of a database with ``size`` generated users, created on first use."""
+    path = os.path.join(data_dir, f"users_{size}.db")
+    if os.path.exists(path):
+        return path
+    building = path + ".building"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(building + suffix):
+            os.remove(building + suffix)
+    print(f"  seeding {size:,} users into {path}", flush=True)
+    conn = sqlite3.connect(building)
+    conn.execute("PRAGMA journal_mode=WAL")
+    migrations.migrate(conn)
+    batch = 50000
+    for start in range(0, size, batch):
+        # Bare SHA-256-shaped hashes: seeding must not pay for the KDF
+        conn.executemany('INSERT OR IGNORE INTO users (username, password, is_admin) VALUES (?, ?, ?)',
+                           ((f"user{i:07d}", "0" * 64, i % 10 == 0)
+                            for i in range(start, min(start + batch, size))))
+        conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    os.replace(building, path)
+    return path
+
+def use_database(path):
+    db_util.close_pool()
+    config.DB_PATH = path
+
+def bench_database(size, data_dir, repeats):
+    import app  # bare mode: only the helper functions are used
+
+    use_database(seeded_db(data_dir, size))
+    results = {}
+    iterations = config.KDF_ITERATIONS
+    config.KDF_ITERATIONS = BENCH_KDF_ITERATIONS
+    try:
+        run_id = int(time.time() * 1000)
+        names = iter(f"bench_{run_id}_{i}" for i in range(repeats))
+        samples = time_call(lambda: app.save_user(next(names), "password", False), repeats)
+        results[f"save_user.{size}"] = latency(samples)
+        with db_util.transaction() as conn:
+            conn.execute("DELETE FROM users WHERE username LIKE ?", (f"bench_{run_id}_%",))
+    finally:
+        config.KDF_ITERATIONS = iterations
+    # Listing the whole table is slow at 1M rows; fewer repeats keep the suite bounded
+    list_repeats = max(3, repeats // max(1, size // 10000))
+    results[f"get_all_users.{size}"] = latency(time_call(app.get_all_users, list_repeats))
+    return results
+
+def bench_tokens(count):
+    import session_tokens
+
+    start = time.perf_counter()
+    tokens = [session_tokens.create_session_token(f"user{i % 1000}", i % 10 == 0) for i in range(count)]
+    create = throughput(count, time.perf_counter() - start)
+    start = time.perf_counter()
+    for token in tokens:
+        if session_tokens.validate_session_token(token) is None:
+            raise RuntimeError("benchmark token did not validate")
+    validate = throughput(count, time.perf_counter() - start)
+    return {"token.create": create, "token.validate": validate}
+
+# Runner
+
+def metadata():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                  capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": revision,
+        "python": platform_info.python_version(),
+        "streamlit": streamlit.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "cpus": os.cpu_count(),
+        "kdf_iterations": config.KDF_ITERATIONS,
+    }
+
+def run_suite(sizes, data_dir, selected, repeats):
+    results = {}
+
+    def record(name, func, *args):
+        if not selected(name):
+            return
+        print(f"running {name}", flush=True)
+        outcome = func(*args)
+        # Groups (token, database.<n>) return several named results
+        results.update({name: outcome} if "unit" in outcome else outcome)
+
+    # The page and login benchmarks use the suite's own small database
+    migrations.ensure_schema()
+    record("cold_start", bench_cold_start, max(3, repeats // 10))
+    for page_id in PAGES:
+        record(f"rerun.{page_id}", bench_rerun, page_id, repeats)
+    record("login", bench_login, max(3, repeats // 4))
+    record("token", bench_tokens, repeats * 500)
+
+    base_path = config.DB_PATH
+    for size in sizes:
+        record(f"database.{size}", bench_database, size, data_dir, repeats)
+    use_database(base_path)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Print a comparison table and return the names of regressed benchmarks."""
+    regressions = []
+    print(f"\n{'benchmark':<28}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None or not old.get("value"):
+            print(f"{name:<28}{'-':>14}{result['value']:>14.3f}{'new':>10}")
+            continue
+        change = (result["value"] - old["value"]) / old["value"]
+        worse = change > tolerance if result["better"] == "lower" else change < -tolerance
+        flag = "  REGRESSION" if worse else ""
+        print(f"{name:<28}{old['value']:>14.3f}{result['value']:>14.3f}{change:>+10.1%}{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the headless benchmark suite")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated seeded database sizes")
+    parser.add_argument("--only", default=None, help="regex; run benchmarks whose name matches")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "bench_suite_data"))
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--ci", action="store_true", default=os.environ.get("CI", "").lower() in ("1", "true", "yes"),
+                        help="fail when there is no baseline to compare against (default: on when CI is set)")
+    args = parser.parse_args(argv)
+
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        if args.ci:
+            # Checked before running, so a misconfigured CI job fails in seconds
+            print(f"error: no baseline at {args.baseline}; record one with --save-baseline", file=sys.stderr)
+            return 2
+        print(f"warning: no baseline at {args.baseline}, results are not compared", file=sys.stderr)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    pattern = re.compile(args.only) if args.only else None
+    selected = (lambda name: pattern.search(name) is not None) if pattern else (lambda name: True)
+
+    results = run_suite(sizes, args.data_dir, selected, args.repeats)
+    report = {"meta": metadata(), "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"results written to {args.output}")
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline.get("results", {}), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            status = 1
+        missing = sorted(set(results) - set(baseline.get("results", {})))
+        if missing and args.ci:
+            print(f"\nno baseline for: {', '.join(missing)}; record one with --save-baseline")
+            status = 1
+    else:
+        compare(results, {}, args.tolerance)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""Concurrent load generator: many simulated browser sessions against a local server.
+
+Starts ``streamlit run app.py`` on localhost with a fresh database and drives N
+sessions over Streamlit's websocket protocol (protobuf BackMsg/ForwardMsg via
+tornado), the same messages the browser sends. Each session follows a scripted
+scenario and every interaction (one rerun request until the script finishes)
+is timed.
+
+Scenarios:
+  login      open the app, log in as admin, log out
+  navigate   log in, then alternate Models -> Model A / Model B
+  admin      log in as admin, open the Admin Panel and create users in a loop
+
+For each concurrency level the report shows interactions per second, p50/p99
+interaction latency, errors (script exceptions, timeouts, dropped connections),
+st.error alerts, and the peak server RSS read from /proc.
+
+Usage:
+  python benchmarks/load_test.py [--scenario login|navigate|admin] [--concurrency 1,5,10,25]
+      [--iterations 5] [--kdf-iterations N] [--output results.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import WebSocketClosedError, websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+ADMIN_USER = ("admin", "admin123")
+
+FINAL_STATUSES = (
+    ForwardMsg.FINISHED_SUCCESSFULLY,
+    ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+    ForwardMsg.FINISHED_WITH_COMPILE_ERROR,
+)
+WIDGET_TYPES = ("button", "text_input", "checkbox")
+
+class InteractionError(Exception):
+    """A rerun that failed: exception element, timeout or lost connection."""
+
+# Server
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(port, workdir, kdf_iterations=None, app_path=APP_PATH):
+    env = dict(os.environ)
+    env.setdefault("APP_DB_PATH", os.path.join(workdir, "users.db"))
+    env.setdefault("APP_SESSION_SECRET", "load-test-secret")
+    env.setdefault("APP_LOG_FILE", os.path.join(workdir, "app.log"))
+    env.setdefault("APP_LOG_LEVEL", "WARNING")
+    # All simulated sessions log in as admin from 127.0.0.1; measure the app, not the login throttle
+    env.setdefault("APP_LOGIN_CLIENT_BURST", "1000000")
+    env.setdefault("APP_LOGIN_USER_BURST", "1000000")
+    env.setdefault("APP_LOGIN_MAX_CONCURRENT", "1000000")
+    if kdf_iterations:
+        env["APP_KDF_ITERATIONS"] = str(kdf_iterations)
+    with open(os.path.join(workdir, "server.err"), "w") as stderr:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", app_path,
+             "--server.headless", "true", "--server.address", "127.0.0.1", "--server.port", str(port),
+             "--browser.gatherUsageStats", "false", "--server.fileWatcherType", "none"],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with status {server.returncode}, see {workdir}/server.err")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("server did not become healthy within 60s")
+
+def rss_bytes(pid):
+    """Resident set size of ``pid`` from /proc, or 0 where unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+# Client
+
+class Widget:
+    def __init__(self, kind, proto, fragment_id):
+        self.kind = kind
+        self.id = proto.id
+        self.label = proto.label
+        self.form_id = proto.form_id
+        self.fragment_id = fragment_id
+
+class BrowserSession:
+    """One simulated browser tab speaking the Streamlit websocket protocol."""
+
+    def __init__(self, port, timeout):
+        self.url = f"ws://127.0.0.1:{port}/_stcore/stream"
+        self.origin = f"http://127.0.0.1:{port}"
+        self.timeout = timeout
+        self.query_string = ""
+        self.widgets = {}       # (kind, label, form_id) -> Widget from the latest runs
+        self.alerts = []        # st.error bodies seen in the latest interaction
+        self.exception = None   # script exception seen in the latest interaction
+        self._cache = {}        # message hash -> ForwardMsg, for ref_hash messages
+        self._conn = None
+
+    async def connect(self):
+        request = HTTPRequest(self.url, headers={"Origin": self.origin})
+        self._conn = await websocket_connect(request, subprotocols=["streamlit"])
+        await self.rerun()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def rerun(self, widget_states=(), fragment_id=""):
+        """Send one rerun request and wait for the script (or fragment) to finish."""
+        msg = BackMsg()
+        msg.rerun_script.query_string = self.query_string
+        msg.rerun_script.fragment_id = fragment_id
+        for state in widget_states:
+            msg.rerun_script.widget_states.widgets.append(state)
+        if not fragment_id:
+            self.widgets = {}
+        self.alerts = []
+        self.exception = None
+        try:
+            await self._conn.write_message(msg.SerializeToString(), binary=True)
+            await asyncio.wait_for(self._read_until_finished(), self.timeout)
+        except asyncio.TimeoutError:
+            raise InteractionError("timeout")
+        except WebSocketClosedError:
+            raise InteractionError("connection closed")
+        if self.exception:
+            raise InteractionError(self.exception)
+
+    async def _read_until_finished(self):
+        while True:
+            payload = await self._conn.read_message()
+            if payload is None:
+                raise InteractionError("connection closed")
+            msg = ForwardMsg()
+            msg.ParseFromString(payload)
+            if msg.WhichOneof("type") == "ref_hash":
+                msg = self._cache.get(msg.ref_hash, msg)
+            elif msg.hash and msg.metadata.cacheable:
+                self._cache[msg.hash] = msg
+            kind = msg.WhichOneof("type")
+            if kind == "delta":
+                self._on_delta(msg.delta)
+            elif kind == "page_info_changed":
+                self.query_string = msg.page_info_changed.query_string
+            elif kind == "script_finished" and msg.script_finished in FINAL_STATUSES:
+                return
+
+    def _on_delta(self, delta):
+        if delta.WhichOneof("type") != "new_element":
+            return
+        element = delta.new_element
+        kind = element.WhichOneof("type")
+        if kind in WIDGET_TYPES:
+            widget = Widget(kind, getattr(element, kind), delta.fragment_id)
+            self.widgets[(kind, widget.label, widget.form_id)] = widget
+        elif kind == "exception":
+            # Keep reading to the end of the run so the next interaction starts clean
+            self.exception = f"{element.exception.type}: {element.exception.message}"
+        elif kind == "alert" and element.alert.format == element.alert.ERROR:
+            self.alerts.append(element.alert.body)
+
+    def widget(self, kind, label, form_id=None):
+        """Find a widget by label; labels may repeat across forms, so ``form_id`` narrows it."""
+        for (widget_kind, widget_label, widget_form), widget in self.widgets.items():
+            if widget_kind == kind and widget_label == label and form_id in (None, widget_form):
+                return widget
+        raise InteractionError(f"no {kind} labelled {label!r} on the page")
+
+    def has_widget(self, kind, label):
+        return any(key[:2] == (kind, label) for key in self.widgets)
+
+    async def click(self, label):
+        button = self.widget("button", label)
+        state = WidgetState()
+        state.id = button.id
+        state.trigger_value = True
+        await self.rerun([state], button.fragment_id)
+
+    async def submit_form(self, submit_label, values):
+        """Fill form widgets by label and press the form's submit button."""
+        submit = self.widget("button", submit_label)
+        states = []
+        for label, value in values.items():
+            kind = "checkbox" if isinstance(value, bool) else "text_input"
+            widget = self.widget(kind, label, submit.form_id)
+            state = WidgetState()
+            state.id = widget.id
+            if kind == "checkbox":
+                state.bool_value = value
+            else:
+                state.string_value = value
+            states.append(state)
+        state = WidgetState()
+        state.id = submit.id
+        state.trigger_value = True
+        states.append(state)
+        await self.rerun(states, submit.fragment_id)
+
+# Scenarios
+
+async def login(session, username, password):
+    await session.submit_form("Login", {"Username": username, "Password": password})
+    if not session.has_widget("button", "Logout"):
+        raise InteractionError(f"login failed: {'; '.join(session.alerts) or 'no logout button'}")
+
+async def scenario_login(session, timed, iterations, names):
+    for _ in range(iterations):
+        await timed(login(session, *ADMIN_USER))
+        await timed(session.click("Logout"))
+
+async def scenario_navigate(session, timed, iterations, names):
+    await timed(login(session, *ADMIN_USER))
+    for _ in range(iterations):
+        await timed(session.click("Model A"))
+        await timed(session.click("Model B"))
+
+async def scenario_admin(session, timed, iterations, names):
+    await timed(login(session, *ADMIN_USER))
+    await timed(session.click("Admin Panel"))
+    for _ in range(iterations):
+        await timed(session.submit_form("Create User", {
+            "New Username": next(names), "New Password": "load-test-password", "Admin privileges": False}))
+
+SCENARIOS = {
+    "login": scenario_login,
+    "navigate": scenario_navigate,
+    "admin": scenario_admin,
+}
+
+# Runner
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+async def run_level(port, scenario, concurrency, iterations, timeout, server_pid, names):
+    latencies = []
+    errors = {}
+    alerts = 0
+    peak_rss = rss_bytes(server_pid)
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, rss_bytes(server_pid))
+            await asyncio.sleep(0.25)
+
+    def count_error(message):
+        errors[message] = errors.get(message, 0) + 1
+
+    async def user():
+        nonlocal alerts
+        session = BrowserSession(port, timeout)
+
+        async def timed(interaction):
+            nonlocal alerts
+            start = time.perf_counter()
+            try:
+                await interaction
+            finally:
+                latencies.append(time.perf_counter() - start)
+                alerts += len(session.alerts)
+
+        try:
+            await timed(session.connect())
+            await scenario(session, timed, iterations, names)
+        except InteractionError as e:
+            count_error(str(e).split(":")[0])
+        except OSError as e:
+            count_error(type(e).__name__)
+        finally:
+            session.close()
+
+    sampler = asyncio.ensure_future(sample_rss())
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+
+    ordered = sorted(latencies)
+    return {
+        "concurrency": concurrency,
+        "interactions": len(latencies),
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(ordered, 0.50) * 1000 if ordered else None,
+        "p99_ms": percentile(ordered, 0.99) * 1000 if ordered else None,
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "alerts": alerts,
+        "peak_rss_mb": peak_rss / (1024 * 1024),
+    }
+
+def print_row(row):
+    def ms(value):
+        return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+    print(f"{row['concurrency']:>11}{row['interactions']:>13}{row['throughput']:>12.1f}"
+          f"{ms(row['p50_ms'])}{ms(row['p99_ms'])}{row['errors']:>8}{row['alerts']:>8}"
+          f"{row['peak_rss_mb']:>10.1f}", flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive concurrent sessions against a local server")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="navigate")
+    parser.add_argument("--concurrency", default="1,5,10,25", help="comma-separated session counts")
+    parser.add_argument("--iterations", type=int, default=5, help="scenario loops per session")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds per interaction")
+    parser.add_argument("--kdf-iterations", type=int, default=None,
+                        help="override APP_KDF_ITERATIONS on the server")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    port = args.port or free_port()
+    print(f"starting server on port {port} (workdir {workdir})", flush=True)
+    server = start_server(port, workdir, args.kdf_iterations)
+    names = (f"load_{os.getpid()}_{i}" for i in itertools.count())
+    rows = []
+    try:
+        print(f"scenario: {args.scenario}, {args.iterations} iteration(s) per session")
+        print(f"{'concurrency':>11}{'interactions':>13}{'ops/s':>12}{'p50 ms':>9}{'p99 ms':>9}"
+              f"{'errors':>8}{'alerts':>8}{'RSS MB':>10}")
+        for concurrency in (int(level) for level in args.concurrency.split(",") if level):
+            row = asyncio.run(run_level(port, SCENARIOS[args.scenario], concurrency,
+                                        args.iterations, args.timeout, server.pid, names))
+            rows.append(row)
+            print_row(row)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"scenario": args.scenario, "iterations": args.iterations, "levels": rows}, f, indent=2)
+        print(f"results written to {args.output}")
+    return 1 if any(row["errors"] for row in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Bounded, thread-safe LRU cache whose entries also expire after a TTL.
+
+    Entries may carry a tag (for example a username) so that every entry for
+    that tag can be dropped at once with ``invalidate_tag``.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value, tag)
+        self._tags = {}             # tag -> set of keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        """Drop ``key`` and its tag link; caller holds the lock."""
+        _, _, tag = self._data.pop(key)
+        if tag is not None:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key, default=None):
+        """Return the cached value, or ``default`` on a miss or expired entry."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None, tag=None):
+        """Store ``value``; ``ttl`` overrides the default lifetime in seconds."""
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, value, tag)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key):
+        """Invalidate a single entry."""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_tag(self, tag):
+        """Invalidate every entry stored with ``tag``."""
+        with self._lock:
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
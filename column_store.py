@@ -0,0 +1,342 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from itertools import islice
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; conversions are then only serialized per process
+    fcntl = None
+
+import config
+import log_util
+
+logger = log_util.get_logger(__name__)
+
+# Columnar, memory-mapped copies of CSV datasets (the model evaluation data).
+#
+# A store is a directory holding one raw little-endian array file per column
+# and a schema header, schema.json:
+#
+#   {"format": 1, "generation": "<id>", "rows": N,
+#    "source": {"path": ..., "bytes": ..., "mtime_ns": ..., "fingerprint": ...},
+#    "columns": [{"name": ..., "dtype": "<f8", "file": ..., "categories": [...]}, ...]}
+#
+# Numeric columns are stored as float64. Other columns are dictionary encoded:
+# int32 codes into "categories". Columns are opened with np.memmap, so every
+# session and every server process reads the same page-cached bytes and gets
+# zero-copy NumPy views; nothing is parsed after the conversion.
+#
+# ``sync`` keeps a store in step with its CSV. Rows appended to the CSV are
+# converted and appended to the column files, and the header is rewritten
+# last, so readers only ever see complete rows. Any other change rebuilds the
+# store under a new generation (file names carry the generation, the header
+# switches atomically). Consumers that keep per-row state, like evaluation.py,
+# use the generation to know whether their rows are still valid.
+
+FORMAT = 1
+SCHEMA_FILE = "schema.json"
+LOCK_FILE = ".lock"
+FINGERPRINT_SAMPLE = 64 * 1024
+CONVERT_CHUNK_ROWS = 100000
+
+class StoreError(Exception):
+    """Raised when a CSV cannot be converted or a store cannot be read."""
+
+def fingerprint(path, size):
+    """Sampled fingerprint of the first ``size`` bytes of ``path`` (size, first and last 64 KB)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(min(size, FINGERPRINT_SAMPLE)))
+        if size > FINGERPRINT_SAMPLE:
+            f.seek(max(FINGERPRINT_SAMPLE, size - FINGERPRINT_SAMPLE))
+            digest.update(f.read(size - f.tell()))
+    return digest.hexdigest()
+
+def store_path(csv_path):
+    """Default store directory for ``csv_path`` under COLUMN_STORE_DIR."""
+    csv_path = os.path.abspath(csv_path)
+    digest = hashlib.blake2b(csv_path.encode(), digest_size=6).hexdigest()
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(config.COLUMN_STORE_DIR, f"{name}-{digest}")
+
+class ColumnStore:
+    """Read-only view of a store; columns are memory mapped on first access."""
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self.rows = schema["rows"]
+        self.generation = schema["generation"]
+        self._columns = {column["name"]: column for column in schema["columns"]}
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    @property
+    def names(self):
+        return [column["name"] for column in self.schema["columns"]]
+
+    @property
+    def source_bytes(self):
+        return self.schema["source"]["bytes"]
+
+    def _info(self, name):
+        info = self._columns.get(name)
+        if info is None:
+            raise KeyError(f"No column {name!r} in {self.path}")
+        return info
+
+    def column(self, name):
+        """Zero-copy array of the column: float64 values, or int32 codes for categorical columns."""
+        with self._lock:
+            array = self._maps.get(name)
+            if array is None:
+                info = self._info(name)
+                if self.rows == 0:
+                    array = np.empty(0, dtype=info["dtype"])
+                else:
+                    array = np.memmap(os.path.join(self.path, info["file"]), dtype=info["dtype"],
+                                      mode="r", shape=(self.rows,))
+                self._maps[name] = array
+            return array
+
+    def categories(self, name):
+        """Category names of a dictionary-encoded column, or None for numeric columns."""
+        categories = self._info(name).get("categories")
+        return None if categories is None else np.asarray(categories, dtype=object)
+
+    def values(self, name, start=0, stop=None):
+        """Rows ``start:stop`` of a column, decoded to names for categorical columns."""
+        values = self.column(name)[start:stop]
+        categories = self.categories(name)
+        return values if categories is None else categories[values]
+
+    def matrix(self, names, start=0, stop=None):
+        """float64 matrix (rows x len(names)) of numeric columns; this one is a copy."""
+        stop = self.rows if stop is None else min(stop, self.rows)
+        out = np.empty((max(stop - start, 0), len(names)), dtype=np.float64)
+        for i, name in enumerate(names):
+            if self.categories(name) is not None:
+                raise StoreError(f"Column {name!r} is not numeric")
+            out[:, i] = self.column(name)[start:stop]
+        return out
+
+def _read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE), encoding="utf-8") as f:
+        schema = json.load(f)
+    if schema.get("format") != FORMAT:
+        raise StoreError(f"Unsupported column store format in {path}")
+    return schema
+
+_stores = {}                # store path -> (schema mtime_ns, ColumnStore)
+_stores_lock = threading.Lock()
+_sync_locks = {}
+
+def open_store(path):
+    """Return the shared ColumnStore at ``path``; reopened only when its header changes."""
+    try:
+        mtime = os.stat(os.path.join(path, SCHEMA_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        raise StoreError(f"No column store at {path}") from None
+    with _stores_lock:
+        cached = _stores.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    store = ColumnStore(path, _read_schema(path))
+    with _stores_lock:
+        _stores[path] = (mtime, store)
+    return store
+
+# Conversion
+
+def _parse_header(csv_path):
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+    names = [name.strip() for name in next(csv.reader([header.decode("utf-8-sig")]), [])]
+    if not names or not any(names):
+        raise StoreError(f"{csv_path} has no header row")
+    return names, len(header)
+
+def _complete_lines(f, chunk_rows):
+    """Yield (lines, bytes) chunks of complete lines; a trailing partial line is left unread."""
+    while True:
+        raw = list(islice(f, chunk_rows))
+        if raw and not raw[-1].endswith(b"\n"):
+            raw.pop()
+        if not raw:
+            return
+        data = b"".join(raw)
+        yield [line for line in data.decode("utf-8").splitlines() if line.strip()], len(data)
+
+def _infer_columns(names, lines, generation):
+    """Column schema from the first chunk: float64 where every value parses, categorical otherwise."""
+    text = np.loadtxt(lines, delimiter=",", dtype=str, ndmin=2, quotechar='"')
+    if text.shape[1] != len(names):
+        raise StoreError(f"Expected {len(names)} columns, found {text.shape[1]}")
+    columns = []
+    for i, name in enumerate(names):
+        column = {"name": name, "file": f"{generation}.{i}.bin"}
+        try:
+            text[:, i].astype(np.float64)
+            column["dtype"] = "<f8"
+        except ValueError:
+            column["dtype"] = "<i4"
+            column["categories"] = []
+        columns.append(column)
+    return columns
+
+def _append_chunk(path, columns, lines, first_byte):
+    numeric = [i for i, column in enumerate(columns) if "categories" not in column]
+    categorical = [i for i, column in enumerate(columns) if "categories" in column]
+    try:
+        if numeric:
+            values = np.loadtxt(lines, delimiter=",", usecols=numeric, dtype=np.float64, ndmin=2, quotechar='"')
+        if categorical:
+            labels = np.loadtxt(lines, delimiter=",", usecols=categorical, dtype=str, ndmin=2, quotechar='"')
+    except ValueError as e:
+        raise StoreError(f"Invalid row after byte {first_byte}: {e}") from None
+    for j, i in enumerate(numeric):
+        with open(os.path.join(path, columns[i]["file"]), "ab") as f:
+            f.write(np.ascontiguousarray(values[:, j], dtype="<f8").tobytes())
+    for j, i in enumerate(categorical):
+        categories = columns[i]["categories"]
+        index = {name: code for code, name in enumerate(categories)}
+        names, inverse = np.unique(np.char.strip(labels[:, j]), return_inverse=True)
+        for name in names.tolist():
+            if name not in index:
+                index[name] = len(categories)
+                categories.append(name)
+        lookup = np.array([index[name] for name in names.tolist()], dtype="<i4")
+        with open(os.path.join(path, columns[i]["file"]), "ab") as f:
+            f.write(lookup[inverse].tobytes())
+
+def _write_schema(path, schema):
+    partial = os.path.join(path, f"{SCHEMA_FILE}.{os.getpid()}.tmp")
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(schema, f)
+    os.replace(partial, os.path.join(path, SCHEMA_FILE))
+
+def _convert(csv_path, path, schema, chunk_rows):
+    """Append the CSV rows from ``schema['source']['bytes']`` on; returns (schema, rows added)."""
+    names, header_bytes = _parse_header(csv_path)
+    offset = schema["source"]["bytes"] if schema else header_bytes
+    if schema is not None:
+        # Drop whatever an interrupted conversion wrote past the last complete row
+        for column in schema["columns"]:
+            os.truncate(os.path.join(path, column["file"]), schema["rows"] * np.dtype(column["dtype"]).itemsize)
+    added = 0
+    with open(csv_path, "rb") as f:
+        f.seek(offset)
+        for lines, chunk_bytes in _complete_lines(f, chunk_rows):
+            if lines:
+                if schema is None:
+                    generation = uuid.uuid4().hex[:12]
+                    schema = {"format": FORMAT, "generation": generation, "rows": 0, "source": {},
+                              "columns": _infer_columns(names, lines, generation)}
+                    for column in schema["columns"]:
+                        open(os.path.join(path, column["file"]), "wb").close()
+                _append_chunk(path, schema["columns"], lines, offset)
+                schema["rows"] += len(lines)
+                added += len(lines)
+            offset += chunk_bytes
+    if schema is None:
+        # Header only: an empty store, typed once rows arrive
+        generation = uuid.uuid4().hex[:12]
+        schema = {"format": FORMAT, "generation": generation, "rows": 0, "source": {},
+                  "columns": [{"name": name, "dtype": "<f8", "file": f"{generation}.{i}.bin"}
+                              for i, name in enumerate(names)]}
+        for column in schema["columns"]:
+            open(os.path.join(path, column["file"]), "wb").close()
+        offset = header_bytes
+    stat = os.stat(csv_path)
+    schema["source"] = {"path": os.path.abspath(csv_path), "bytes": offset, "mtime_ns": stat.st_mtime_ns,
+                        "fingerprint": fingerprint(csv_path, offset)}
+    return schema, added
+
+def _remove_stale_files(path, generation):
+    for name in os.listdir(path):
+        if name.endswith(".bin") and not name.startswith(generation + "."):
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError as e:
+                # Still mapped by a reader on platforms that forbid deleting open files
+                logger.warning("Could not remove old column file %s: %s", name, e)
+
+def sync(csv_path, path=None, chunk_rows=CONVERT_CHUNK_ROWS):
+    """Bring the store for ``csv_path`` up to date and return it.
+
+    Cheap when nothing changed (two stats). Appended CSV rows are appended to
+    the store; any other change rebuilds it under a new generation.
+    """
+    path = path or store_path(csv_path)
+    stat = os.stat(csv_path)
+    try:
+        store = open_store(path)
+    except StoreError:
+        store = None
+    if store is not None:
+        source = store.schema["source"]
+        if source.get("bytes") is not None and stat.st_mtime_ns == source.get("mtime_ns"):
+            return store
+
+    with _stores_lock:
+        lock = _sync_locks.setdefault(path, threading.Lock())
+    with lock:
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, LOCK_FILE), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return _sync_locked(csv_path, path, chunk_rows)
+
+def _sync_locked(csv_path, path, chunk_rows):
+    stat = os.stat(csv_path)
+    try:
+        schema = _read_schema(path)
+    except (OSError, ValueError, StoreError):
+        schema = None
+    if schema is not None:
+        source = schema["source"]
+        if stat.st_mtime_ns == source.get("mtime_ns"):
+            return open_store(path)
+        # A store without rows has no inferred column types yet: rebuild it
+        appendable = (schema["rows"] > 0 and source.get("bytes", 0) <= stat.st_size and
+                      fingerprint(csv_path, source["bytes"]) == source.get("fingerprint"))
+        if not appendable:
+            logger.info("%s changed, rebuilding its column store", csv_path)
+            schema = None
+
+    start = time.perf_counter()
+    if schema is None:
+        schema, added = _convert(csv_path, path, None, chunk_rows)
+        _write_schema(path, schema)
+        _remove_stale_files(path, schema["generation"])
+    else:
+        schema, added = _convert(csv_path, path, schema, chunk_rows)
+        _write_schema(path, schema)
+    logger.info("Column store %s: %d rows added (%d total) in %.3fs", path, added, schema["rows"],
+                time.perf_counter() - start)
+    return open_store(path)
+
+def main(argv=None):
+    """Convert a CSV to a column store: python column_store.py INPUT.csv [STORE_DIR]"""
+    parser = argparse.ArgumentParser(description="Convert a CSV file to a memory-mapped column store")
+    parser.add_argument("input")
+    parser.add_argument("store", nargs="?", help="store directory (default: under APP_COLUMN_STORE_DIR)")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    store = sync(args.input, args.store)
+    print(f"{store.path}: {store.rows:,} rows, columns {', '.join(store.names)} "
+          f"({time.perf_counter() - start:.2f}s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
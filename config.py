@@ -0,0 +1,113 @@
+import os
+
+# Application settings. Every value can be overridden with an environment
+# variable so the same code runs locally, in benchmarks and in production.
+
+def _env_int(name, default):
+    """Read an integer setting from the environment."""
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+# Database
+DB_PATH = os.environ.get("APP_DB_PATH", os.path.join(os.getcwd(), "users.db"))
+DB_POOL_SIZE = _env_int("APP_DB_POOL_SIZE", 8)
+DB_BUSY_TIMEOUT_MS = _env_int("APP_DB_BUSY_TIMEOUT_MS", 5000)
+DB_CACHE_SIZE_KB = _env_int("APP_DB_CACHE_SIZE_KB", 16384)
+DB_MMAP_SIZE = _env_int("APP_DB_MMAP_SIZE", 64 * 1024 * 1024)
+DB_STATEMENT_CACHE = _env_int("APP_DB_STATEMENT_CACHE", 256)
+
+# Sessions
+SESSION_TTL_SECONDS = _env_int("APP_SESSION_TTL_SECONDS", 7 * 24 * 3600)
+SESSION_FLUSH_INTERVAL_MS = _env_int("APP_SESSION_FLUSH_INTERVAL_MS", 500)
+SESSION_SWEEP_INTERVAL_SECONDS = _env_int("APP_SESSION_SWEEP_INTERVAL_SECONDS", 300)
+SESSION_SECRET = os.environ.get("APP_SESSION_SECRET")
+SESSION_SECRET_FILE = os.environ.get("APP_SESSION_SECRET_FILE", os.path.join(os.getcwd(), ".session_secret"))
+REVOCATION_REFRESH_SECONDS = _env_int("APP_REVOCATION_REFRESH_SECONDS", 5)
+TOKEN_CACHE_SIZE = _env_int("APP_TOKEN_CACHE_SIZE", 10000)
+TOKEN_CACHE_TTL_SECONDS = _env_int("APP_TOKEN_CACHE_TTL_SECONDS", 300)
+
+# In-memory user directory (see user_directory.py); 0 serves every lookup from SQLite
+USER_DIRECTORY_MAX_USERS = _env_int("APP_USER_DIRECTORY_MAX_USERS", 200000)
+USER_CHANGES_KEEP = _env_int("APP_USER_CHANGES_KEEP", 10000)
+
+# Password hashing (PBKDF2-SHA256); benchmarks/bench_kdf.py suggests an iteration count
+KDF_ITERATIONS = _env_int("APP_KDF_ITERATIONS", 600000)
+KDF_WORKERS = _env_int("APP_KDF_WORKERS", os.cpu_count() or 2)
+KDF_MAX_PENDING = _env_int("APP_KDF_MAX_PENDING", 4 * (os.cpu_count() or 2))
+KDF_QUEUE_TIMEOUT_MS = _env_int("APP_KDF_QUEUE_TIMEOUT_MS", 2000)
+
+# Bulk user import; its hashes go through the password pool, at most
+# BULK_IMPORT_WORKERS at a time, so logins keep the other KDF workers. They use
+# BULK_IMPORT_KDF_ITERATIONS (at most KDF_ITERATIONS) and are upgraded to
+# KDF_ITERATIONS on each user's first login
+BULK_IMPORT_CHUNK_SIZE = _env_int("APP_BULK_IMPORT_CHUNK_SIZE", 1000)
+BULK_IMPORT_WORKERS = _env_int("APP_BULK_IMPORT_WORKERS", max(1, KDF_WORKERS // 2))
+BULK_IMPORT_KDF_ITERATIONS = _env_int("APP_BULK_IMPORT_KDF_ITERATIONS", 1000)
+
+# Login throttling (token buckets per client address and per username, see login_throttle.py)
+LOGIN_CLIENT_BURST = _env_int("APP_LOGIN_CLIENT_BURST", 20)
+LOGIN_CLIENT_PER_MINUTE = _env_int("APP_LOGIN_CLIENT_PER_MINUTE", 20)
+LOGIN_USER_BURST = _env_int("APP_LOGIN_USER_BURST", 5)
+LOGIN_USER_PER_MINUTE = _env_int("APP_LOGIN_USER_PER_MINUTE", 5)
+LOGIN_MAX_CONCURRENT = _env_int("APP_LOGIN_MAX_CONCURRENT", KDF_MAX_PENDING)
+LOGIN_THROTTLE_MAX_KEYS = _env_int("APP_LOGIN_THROTTLE_MAX_KEYS", 100000)
+LOGIN_TRUST_FORWARDED_FOR = os.environ.get("APP_LOGIN_TRUST_FORWARDED_FOR", "").lower() in ("1", "true", "yes")
+
+# Audit log (see audit.py)
+AUDIT_QUEUE_SIZE = _env_int("APP_AUDIT_QUEUE_SIZE", 10000)
+AUDIT_BATCH_SIZE = _env_int("APP_AUDIT_BATCH_SIZE", 500)
+AUDIT_FLUSH_INTERVAL_MS = _env_int("APP_AUDIT_FLUSH_INTERVAL_MS", 1000)
+AUDIT_ENQUEUE_TIMEOUT_MS = _env_int("APP_AUDIT_ENQUEUE_TIMEOUT_MS", 50)
+AUDIT_SHUTDOWN_TIMEOUT_SECONDS = _env_int("APP_AUDIT_SHUTDOWN_TIMEOUT_SECONDS", 10)
+AUDIT_RETENTION_DAYS = _env_int("APP_AUDIT_RETENTION_DAYS", 90)
+
+# Usage rollups for the activity dashboard (see usage_rollups.py); 0 keeps a granularity forever
+ROLLUP_MINUTE_RETENTION_HOURS = _env_int("APP_ROLLUP_MINUTE_RETENTION_HOURS", 48)
+ROLLUP_HOUR_RETENTION_DAYS = _env_int("APP_ROLLUP_HOUR_RETENTION_DAYS", 90)
+ROLLUP_DAY_RETENTION_DAYS = _env_int("APP_ROLLUP_DAY_RETENTION_DAYS", 0)
+ROLLUP_COMPACT_INTERVAL_SECONDS = _env_int("APP_ROLLUP_COMPACT_INTERVAL_SECONDS", 300)
+
+# Startup warm-up, health endpoint and load shedding (see health.py); HEALTH_PORT 0 disables the endpoint
+HEALTH_PORT = _env_int("APP_HEALTH_PORT", 0)
+HEALTH_HOST = os.environ.get("APP_HEALTH_HOST", "127.0.0.1")
+WARMUP_RETRY_SECONDS = _env_int("APP_WARMUP_RETRY_SECONDS", 5)
+MAX_INFLIGHT_RERUNS = _env_int("APP_MAX_INFLIGHT_RERUNS", 32)
+
+# Logging
+DEBUG = os.environ.get("APP_DEBUG", "").lower() in ("1", "true", "yes")
+LOG_LEVEL = os.environ.get("APP_LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.environ.get("APP_LOG_FILE", os.path.join(os.getcwd(), "logs", "app.log"))
+LOG_MAX_BYTES = _env_int("APP_LOG_MAX_BYTES", 10 * 1024 * 1024)
+LOG_BACKUP_COUNT = _env_int("APP_LOG_BACKUP_COUNT", 5)
+LOG_QUEUE_SIZE = _env_int("APP_LOG_QUEUE_SIZE", 10000)
+
+# Metrics export (Prometheus text format); both exporters are off when unset
+METRICS_FILE = os.environ.get("APP_METRICS_FILE", "")
+METRICS_EXPORT_INTERVAL_SECONDS = _env_int("APP_METRICS_EXPORT_INTERVAL_SECONDS", 15)
+METRICS_PORT = _env_int("APP_METRICS_PORT", 0)
+METRICS_HOST = os.environ.get("APP_METRICS_HOST", "127.0.0.1")
+
+# Models (see model_registry.py for the directory layout)
+MODELS_DIR = os.environ.get("APP_MODELS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+MODEL_MEMORY_BUDGET_MB = _env_int("APP_MODEL_MEMORY_BUDGET_MB", 1024)
+MODEL_WARMUP_COUNT = _env_int("APP_MODEL_WARMUP_COUNT", 4)
+
+# Batch scoring on the model pages
+SCORING_CHUNK_ROWS = _env_int("APP_SCORING_CHUNK_ROWS", 50000)
+
+# Background scoring jobs
+JOBS_DIR = os.environ.get("APP_JOBS_DIR", os.path.join(os.getcwd(), "jobs"))
+JOB_WORKERS = _env_int("APP_JOB_WORKERS", os.cpu_count() or 2)
+JOB_POLL_SECONDS = _env_int("APP_JOB_POLL_SECONDS", 2)
+JOB_STALE_SECONDS = _env_int("APP_JOB_STALE_SECONDS", 120)
+JOB_MAX_ATTEMPTS = _env_int("APP_JOB_MAX_ATTEMPTS", 3)
+JOB_RETENTION_DAYS = _env_int("APP_JOB_RETENTION_DAYS", 7)
+
+# Prediction cache used by batch scoring (0 disables it)
+PREDICTION_CACHE_DIR = os.environ.get("APP_PREDICTION_CACHE_DIR", os.path.join(os.getcwd(), "cache", "predictions"))
+PREDICTION_CACHE_MB = _env_int("APP_PREDICTION_CACHE_MB", 512)
+
+# Memory-mapped columnar copies of the model evaluation data (see column_store.py)
+COLUMN_STORE_DIR = os.environ.get("APP_COLUMN_STORE_DIR", os.path.join(os.getcwd(), "cache", "columns"))
@@ -0,0 +1,160 @@
+import sqlite3
+import threading
+import queue
+from contextlib import contextmanager
+
+import config
+import metrics_util
+
+# Pragmas applied to every pooled connection. journal_mode is persistent in the
+# database file, the others are per-connection settings.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time."""
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections shared by all script threads.
+
+    Connections are opened lazily up to ``size`` and handed out one thread at a
+    time. Each connection keeps its own compiled-statement cache, so queries that
+    use the same SQL text skip the prepare step once the connection is warm.
+    """
+
+    def __init__(self, db_path, size=None):
+        self.db_path = db_path
+        self.size = size or config.DB_POOL_SIZE
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _connect(self):
+        """Open and configure a new connection."""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=config.DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=config.DB_STATEMENT_CACHE,
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn.execute(f"PRAGMA busy_timeout={int(config.DB_BUSY_TIMEOUT_MS)}")
+        conn.execute(f"PRAGMA cache_size=-{int(config.DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size={int(config.DB_MMAP_SIZE)}")
+        return conn
+
+    def acquire(self, timeout=None):
+        """Take a connection from the pool, opening one if the pool is not full."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                open_new = True
+            else:
+                open_new = False
+        if open_new:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        if timeout is None:
+            timeout = config.DB_BUSY_TIMEOUT_MS / 1000
+        try:
+            # Only reached when every connection is busy; time the wait
+            with metrics_util.span("db.pool_wait"):
+                return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection available after {timeout}s")
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any open transaction."""
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def close(self):
+        """Close every idle connection; busy ones are closed on release."""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(config.DB_PATH)
+    return _pool
+
+def close_pool():
+    """Close the process-wide pool (used by tests, benchmarks and shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for the duration of a ``with`` block."""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+@contextmanager
+def transaction():
+    """Borrow a pooled connection and commit on success, roll back on error."""
+    with metrics_util.span("db.transaction"), connection() as conn:
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+@metrics_util.timed("db.fetch_one")
+def fetch_one(sql, params=()):
+    """Run a read query and return the first row or None."""
+    with connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+@metrics_util.timed("db.fetch_all")
+def fetch_all(sql, params=()):
+    """Run a read query and return all rows."""
+    with connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+@metrics_util.timed("db.execute")
+def execute(sql, params=()):
+    """Run a single write statement in its own transaction and return the rowcount."""
+    with transaction() as conn:
+        return conn.execute(sql, params).rowcount
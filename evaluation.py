@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import column_store
+import config
+import db_util
+import log_util
+import model_registry
+
+logger = log_util.get_logger(__name__)
+
+# Evaluation metrics computed from each model's held-out dataset.
+#
+# The dataset (model.json "evaluation") is a CSV that column_store.py mirrors
+# as memory-mapped columns. Its rows are folded, chunk by chunk, into
+# mergeable accumulators: count/mean/sum of squares plus error sums for
+# regressors (MSE, RMSE, MAE, R²), a confusion matrix for classifiers. The
+# accumulator state is stored in the eval_metrics table per model version,
+# with the number of rows it covers and the store generation they came from.
+#
+# Evaluation files are treated as append-only: rows appended to the CSV are
+# appended to the store, and only those rows are folded in. Any other change
+# rebuilds the store under a new generation and the metrics start over, as
+# they do for a new model version. Results and chart samples are also kept in
+# memory per process, keyed by the model version and the file's size and
+# mtime, so page renders cost one stat.
+
+EvalResult = namedtuple("EvalResult", "metrics confusion rows new_rows data_path updated_at")
+
+class RegressionAccumulator:
+    """One-pass, mergeable regression error statistics."""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, sse=0.0, sae=0.0):
+        self.count = count
+        self.mean = mean    # mean of the targets
+        self.m2 = m2        # sum of squared deviations of the targets from their mean
+        self.sse = sse      # sum of squared errors
+        self.sae = sae      # sum of absolute errors
+
+    def update(self, y_true, y_pred):
+        n = len(y_true)
+        if not n:
+            return
+        errors = y_pred - y_true
+        self.sse += float(errors @ errors)
+        self.sae += float(np.abs(errors).sum())
+        # Chan et al. merge of (count, mean, m2) with the chunk's own statistics
+        chunk_mean = float(y_true.mean())
+        chunk_m2 = float(((y_true - chunk_mean) ** 2).sum())
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.m2 += chunk_m2 + delta * delta * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+
+    def metrics(self):
+        if not self.count:
+            return {}
+        mse = self.sse / self.count
+        return {
+            "MSE": mse,
+            "RMSE": mse ** 0.5,
+            "MAE": self.sae / self.count,
+            "R²": 1.0 - self.sse / self.m2 if self.m2 else 0.0,
+        }
+
+    def confusion(self):
+        return None
+
+    def state(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "sse": self.sse, "sae": self.sae}
+
+class ClassificationAccumulator:
+    """Confusion matrix (rows: actual class, columns: predicted class)."""
+
+    def __init__(self, classes, matrix=None):
+        self.classes = list(classes)
+        k = len(self.classes)
+        self.matrix = np.zeros((k, k), dtype=np.int64) if matrix is None else np.asarray(matrix, dtype=np.int64)
+        self._index = {name: i for i, name in enumerate(self.classes)}
+
+    @property
+    def count(self):
+        return int(self.matrix.sum())
+
+    def labels_to_index(self, labels):
+        """Map an array of class names to class indices; raises ValueError for unknown names."""
+        names, inverse = np.unique(labels, return_inverse=True)
+        unknown = [name for name in names.tolist() if name not in self._index]
+        if unknown:
+            raise ValueError(f"Unknown class label(s): {', '.join(unknown[:5])}")
+        return np.array([self._index[name] for name in names.tolist()], dtype=np.int64)[inverse]
+
+    def update(self, y_true, y_pred):
+        k = len(self.classes)
+        self.matrix += np.bincount(y_true * k + y_pred, minlength=k * k).reshape(k, k)
+
+    def metrics(self):
+        total = self.count
+        if not total:
+            return {}
+        correct = np.diag(self.matrix).astype(np.float64)
+        predicted = self.matrix.sum(axis=0)
+        actual = self.matrix.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(predicted > 0, correct / predicted, 0.0)
+            recall = np.where(actual > 0, correct / actual, 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        return {
+            "Accuracy": float(correct.sum() / total),
+            "Macro precision": float(precision.mean()),
+            "Macro recall": float(recall.mean()),
+            "Macro F1": float(f1.mean()),
+        }
+
+    def confusion(self):
+        return self.matrix
+
+    def state(self):
+        return {"classes": self.classes, "matrix": self.matrix.tolist()}
+
+def new_accumulator(spec, state=None):
+    state = state or {}
+    if spec.kind == model_registry.KIND_CLASSIFIER:
+        return ClassificationAccumulator(spec.classes, state.get("matrix"))
+    return RegressionAccumulator(**state)
+
+def accumulate(model, store, accumulator, start=0, chunk_size=None):
+    """Fold the store's rows from ``start`` on into ``accumulator``."""
+    spec = model.spec
+    chunk_size = chunk_size or config.SCORING_CHUNK_ROWS
+    missing = [name for name in (*spec.features, spec.eval_target) if name not in store.names]
+    if missing:
+        raise ValueError(f"Evaluation data is missing column(s): {', '.join(missing)}")
+    categories = store.categories(spec.eval_target)
+    if isinstance(accumulator, ClassificationAccumulator):
+        if categories is None:
+            raise ValueError(f"Target column {spec.eval_target} must hold class names")
+        # Store category codes -> the model's class indices
+        lookup = accumulator.labels_to_index(categories) if len(categories) else np.zeros(0, dtype=np.int64)
+    elif categories is not None:
+        raise ValueError(f"Target column {spec.eval_target} must be numeric")
+    target = store.column(spec.eval_target)
+    for begin in range(start, store.rows, chunk_size):
+        end = min(begin + chunk_size, store.rows)
+        y_true = lookup[target[begin:end]] if categories is not None else target[begin:end]
+        accumulator.update(y_true, model.predict(store.matrix(spec.features, begin, end)))
+
+def sample(model_id, limit=2000):
+    """Evenly spaced rows of the evaluation data for charting: {column: values}.
+
+    Strided copies of the memory-mapped columns, so nothing is copied but the
+    sample. Regressors also get a "predicted" column. Samples are kept in
+    memory per process, keyed like the metrics, so page renders cost one stat;
+    callers must not modify the arrays.
+    """
+    spec = model_registry.get_registry().spec(model_id)
+    signature = (*_signature(spec), limit)
+    cached = _samples.get(model_id)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    store = column_store.sync(spec.eval_data)
+    step = max(1, -(-store.rows // limit))
+    # Copies, so the cache does not keep the store's maps alive after a rebuild
+    data = {name: np.array(store.values(name)[::step]) for name in (*spec.features, spec.eval_target)}
+    if spec.kind == model_registry.KIND_REGRESSOR and store.rows:
+        model = model_registry.get_registry().get(model_id, count_use=False)
+        data["predicted"] = model.predict(np.column_stack([data[name] for name in spec.features]))
+    _samples[model_id] = (signature, data)
+    return data
+
+_results = {}                  # model_id -> (signature, EvalResult)
+_samples = {}                  # model_id -> (signature, sample)
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _signature(spec):
+    """Model version and evaluation file identity; cached results are valid while it is unchanged."""
+    stat = os.stat(spec.eval_data)
+    return spec.version, spec.eval_data, stat.st_size, stat.st_mtime_ns
+
+def _store(spec, store, accumulator):
+    now = int(time.time())
+    db_util.execute(
+        'INSERT INTO eval_metrics (model_id, model_version, data_path, fingerprint, bytes_done, rows, state, updated_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(model_id, model_version) DO UPDATE SET '
+        'data_path = excluded.data_path, fingerprint = excluded.fingerprint, bytes_done = excluded.bytes_done, '
+        'rows = excluded.rows, state = excluded.state, updated_at = excluded.updated_at',
+        (spec.model_id, spec.version, spec.eval_data, store.generation, store.source_bytes, accumulator.count,
+         json.dumps(accumulator.state()), now))
+    return now
+
+def _refresh(spec):
+    store = column_store.sync(spec.eval_data)
+    row = db_util.fetch_one(
+        'SELECT data_path, fingerprint, rows, state, updated_at FROM eval_metrics '
+        'WHERE model_id = ? AND model_version = ?', (spec.model_id, spec.version))
+    accumulator, updated_at = None, None
+    if row is not None:
+        data_path, generation, rows, state, updated_at = row
+        if data_path == spec.eval_data and generation == store.generation and rows <= store.rows:
+            accumulator = new_accumulator(spec, json.loads(state))
+        else:
+            logger.info("Evaluation data for %s changed, recomputing from the start", spec.model_id)
+    if accumulator is None:
+        accumulator = new_accumulator(spec)
+
+    rows_before = accumulator.count
+    if rows_before < store.rows:
+        start = time.perf_counter()
+        model = model_registry.get_registry().get(spec.model_id, count_use=False)
+        accumulate(model, store, accumulator, rows_before)
+        updated_at = _store(spec, store, accumulator)
+        logger.info("Evaluated %d new rows for %s %s in %.3fs", accumulator.count - rows_before,
+                    spec.model_id, spec.version, time.perf_counter() - start)
+    return EvalResult(accumulator.metrics(), accumulator.confusion(), accumulator.count,
+                      accumulator.count - rows_before, spec.eval_data, updated_at)
+
+def get_evaluation(model_id):
+    """Return the EvalResult for ``model_id``, or None if it has no evaluation data.
+
+    Raises ValueError or column_store.StoreError (bad data) or ModelError (model cannot be loaded).
+    """
+    spec = model_registry.get_registry().spec(model_id)
+    if spec is None or not spec.eval_data:
+        return None
+    signature = _signature(spec)
+    cached = _results.get(model_id)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with _locks_lock:
+        lock = _locks.setdefault(model_id, threading.Lock())
+    with lock:
+        cached = _results.get(model_id)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        result = _refresh(spec)
+        _results[model_id] = (signature, result)
+        return result
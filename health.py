@@ -0,0 +1,328 @@
+import functools
+import json
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+import log_util
+
+logger = log_util.get_logger(__name__)
+
+# Startup warm-up, rerun admission and the readiness/liveness endpoint.
+#
+# start() runs once per server process: from serve.py before Streamlit
+# starts listening, or from init_db on the first rerun under plain
+# ``streamlit run``. It starts a warm-up thread that pays the cold costs the
+# first users would otherwise pay - schema check and pooled connections,
+# session and user caches, page module imports, the most used models and
+# their evaluation metrics, the job queue and audit writer - and, when
+# HEALTH_PORT is set, a small HTTP server on HEALTH_HOST:
+#
+#   /livez    200 while the process serves requests
+#   /readyz   200 once the required warm-up steps succeeded and the rerun
+#             limit is not reached, 503 otherwise; the JSON body reports the
+#             progress of each step and the in-flight reruns
+#
+# A failed required step is retried every WARMUP_RETRY_SECONDS; the other
+# steps only log their errors. Every rerun holds a slot from admit_rerun().
+# Above MAX_INFLIGHT_RERUNS concurrent reruns the app renders a short "busy"
+# page instead of starting more work.
+#
+# Streamlit reruns a fragment on its own, without the rest of the script, so
+# app.main() never sees those reruns. Fragments are declared with
+# gated_fragment() instead of st.fragment: their body takes a slot too and
+# renders a busy notice when shed. Inside a full rerun the body runs on the
+# thread that already holds the rerun's slot and passes straight through.
+
+Step = namedtuple("Step", "name required func")
+
+BUSY_MESSAGE = "The server is busy right now. Please try again in a few seconds."
+
+# Step states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+def _prime_database():
+    import db_util
+    import migrations
+
+    migrations.ensure_schema()
+    # Open every pooled connection now (connect, pragmas, schema parse) and
+    # read the small hot tables into the page cache
+    pool = db_util.get_pool()
+    connections = []
+    try:
+        for _ in range(pool.size):
+            try:
+                connections.append(pool.acquire(timeout=0.1))
+            except db_util.PoolTimeout:
+                # The rest are in use by reruns already
+                break
+        for conn in connections:
+            conn.execute('SELECT COUNT(*) FROM sessions').fetchone()
+    finally:
+        for conn in connections:
+            pool.release(conn)
+
+def _prime_sessions():
+    import session_tokens
+
+    session_tokens.get_revocation_index()
+
+def _prime_users():
+    import user_directory
+
+    user_directory.get_directory()
+
+def _prime_pages():
+    import page_registry
+
+    page_registry.get_registry().preload()
+
+def _prime_models():
+    import model_registry
+
+    if config.MODEL_WARMUP_COUNT > 0:
+        model_registry.get_registry().warm_up(config.MODEL_WARMUP_COUNT)
+
+def _prime_evaluation():
+    import evaluation
+    import model_registry
+
+    registry = model_registry.get_registry()
+    for spec in registry.specs():
+        # Only models already in memory; the rest are computed on their first visit
+        if spec.eval_data and registry.is_loaded(spec.model_id):
+            try:
+                evaluation.get_evaluation(spec.model_id)
+            except Exception as e:
+                logger.warning("Warm-up could not evaluate %s: %s", spec.model_id, e)
+
+def _start_services():
+    import audit
+    import jobs
+
+    jobs.get_queue()
+    audit.get_log()
+
+STEPS = (
+    Step("database", True, _prime_database),
+    Step("sessions", True, _prime_sessions),
+    Step("users", True, _prime_users),
+    Step("services", True, _start_services),
+    Step("pages", False, _prime_pages),
+    Step("models", False, _prime_models),
+    Step("evaluation", False, _prime_evaluation),
+)
+
+class WarmUp:
+    """Runs the warm-up steps in order on a background thread and reports their progress."""
+
+    def __init__(self, steps=STEPS, retry_seconds=None):
+        self.steps = steps
+        self.retry_seconds = config.WARMUP_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self._lock = threading.Lock()
+        self._status = {step.name: {"state": PENDING, "seconds": None, "error": None} for step in steps}
+        self._thread = None
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+        self._thread.start()
+
+    def _run_step(self, step):
+        with self._lock:
+            self._status[step.name].update(state=RUNNING, error=None)
+        start = time.perf_counter()
+        try:
+            step.func()
+        except Exception as e:
+            logger.exception("Warm-up step %s failed", step.name)
+            with self._lock:
+                self._status[step.name].update(state=FAILED, seconds=time.perf_counter() - start, error=str(e))
+            return False
+        with self._lock:
+            self._status[step.name].update(state=DONE, seconds=time.perf_counter() - start)
+        return True
+
+    def _run(self):
+        for step in self.steps:
+            while not self._run_step(step) and step.required:
+                time.sleep(self.retry_seconds)
+        self.finished_at = time.time()
+        logger.info("Warm-up finished in %.2fs", self.finished_at - self.started_at)
+
+    def ready(self):
+        """True once every required step has succeeded."""
+        with self._lock:
+            return all(self._status[step.name]["state"] == DONE for step in self.steps if step.required)
+
+    def progress(self):
+        with self._lock:
+            steps = {name: dict(status) for name, status in self._status.items()}
+        finished = sum(status["state"] in (DONE, FAILED) for status in steps.values())
+        return {
+            "ready": self.ready(),
+            "finished": self.finished_at is not None,
+            "progress": finished / len(steps) if steps else 1.0,
+            "seconds": ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0,
+            "steps": steps,
+        }
+
+class RerunGate:
+    """Counts in-flight reruns and turns away those above ``max_inflight`` (0: no limit)."""
+
+    def __init__(self, max_inflight=None):
+        self.max_inflight = config.MAX_INFLIGHT_RERUNS if max_inflight is None else max_inflight
+        self._lock = threading.Lock()
+        self._held = threading.local()
+        self.inflight = 0
+        self.peak = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def admit(self):
+        """Context manager yielding True if the rerun may proceed, False if it should render the busy page."""
+        return _Admission(self)
+
+    def overloaded(self):
+        return 0 < self.max_inflight <= self.inflight
+
+    def stats(self):
+        with self._lock:
+            return {
+                "inflight": self.inflight,
+                "peak": self.peak,
+                "max_inflight": self.max_inflight,
+                "admitted": self.admitted,
+                "shed": self.shed,
+            }
+
+class _Admission:
+    def __init__(self, gate):
+        self.gate = gate
+        self._holding = False
+
+    def __enter__(self):
+        gate = self.gate
+        if getattr(gate._held, "slot", False):
+            # Nested in a rerun of this thread that already holds a slot
+            return True
+        with gate._lock:
+            if 0 < gate.max_inflight <= gate.inflight:
+                gate.shed += 1
+                return False
+            gate.inflight += 1
+            gate.peak = max(gate.peak, gate.inflight)
+            gate.admitted += 1
+        self._holding = True
+        gate._held.slot = True
+        return True
+
+    def __exit__(self, *exc_info):
+        if self._holding:
+            self.gate._held.slot = False
+            with self.gate._lock:
+                self.gate.inflight -= 1
+        return False
+
+_warm_up = WarmUp()
+_gate = RerunGate()
+_started = False
+_start_lock = threading.Lock()
+_server = None
+_process_started_at = time.time()
+
+def get_warm_up():
+    return _warm_up
+
+def get_gate():
+    return _gate
+
+def admit_rerun():
+    """Hold an in-flight rerun slot for the duration of a ``with`` block (yields False when busy)."""
+    return _gate.admit()
+
+def gated_fragment(func=None, *, run_every=None):
+    """``st.fragment`` whose reruns hold an in-flight slot like full reruns (see the module comment)."""
+    import streamlit as st
+
+    if func is None:
+        return functools.partial(gated_fragment, run_every=run_every)
+
+    @functools.wraps(func)
+    def gated(*args, **kwargs):
+        with admit_rerun() as admitted:
+            if not admitted:
+                st.warning(BUSY_MESSAGE)
+                return None
+            return func(*args, **kwargs)
+
+    return st.fragment(gated, run_every=run_every)
+
+def ready():
+    return _warm_up.ready() and not _gate.overloaded()
+
+def status():
+    """Readiness report served by /readyz."""
+    return {
+        "ready": ready(),
+        "uptime_seconds": round(time.time() - _process_started_at, 3),
+        "warm_up": _warm_up.progress(),
+        "reruns": _gate.stats(),
+    }
+
+class _HealthHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/livez":
+            code, body = 200, {"alive": True, "uptime_seconds": round(time.time() - _process_started_at, 3)}
+        elif path in ("/readyz", "/"):
+            body = status()
+            code = 200 if body["ready"] else 503
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("health endpoint: " + format, *args)
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serve /livez and /readyz on a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _HealthHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="health-http", daemon=True).start()
+    logger.info("Serving health checks on http://%s:%d/readyz", host, server.server_port)
+    return server
+
+def start():
+    """Start the warm-up and the health endpoint, once per process."""
+    global _started, _server
+    if _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+        if config.HEALTH_PORT:
+            try:
+                _server = start_http_server(config.HEALTH_PORT, config.HEALTH_HOST)
+            except OSError as e:
+                # Another server process may already own the port
+                logger.warning("Could not start health endpoint on port %d: %s", config.HEALTH_PORT, e)
+        _warm_up.start()
@@ -0,0 +1,412 @@
+import atexit
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+import db_util
+import log_util
+import model_registry
+import prediction_cache
+import scoring
+import user_bulk
+
+logger = log_util.get_logger(__name__)
+
+# Background jobs: batch scoring and bulk user imports.
+#
+# Submitting a job copies the upload to JOBS_DIR/<job_id>/, records a 'queued'
+# row in the jobs table and hands the job id to a process pool (JOB_WORKERS,
+# one per core by default). A worker claims the row ('queued' -> 'running'),
+# runs the job - scoring.score_file for SCORE jobs, user_bulk.import_users for
+# USER_IMPORT jobs - and reports progress to the row as it goes; the output
+# (scores, or the import result as JSON) is renamed into place only when
+# complete. The pages just poll the row, so a job survives the user
+# navigating away or disconnecting.
+#
+# An import that is retried after its worker died re-reads the whole file:
+# users it already inserted are reported as existing, not created twice.
+#
+# All state is in SQLite, so a restarted server picks up where it left off: a
+# monitor thread re-dispatches queued jobs and requeues 'running' jobs whose
+# row has not been updated for JOB_STALE_SECONDS (their worker died), up to
+# JOB_MAX_ATTEMPTS attempts. While a job runs, a heartbeat thread in its
+# worker touches the row every JOB_STALE_SECONDS / 4, however long a chunk
+# takes, so only jobs whose worker is gone look stale. Claiming is a
+# conditional UPDATE, and every later write of the worker is conditional on
+# its attempt number, so a job that was requeued is never finished twice.
+#
+# Workers are spawned processes; their log records are sent back to the
+# server process, which owns the log file (see log_util.py).
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# Job kinds
+SCORE = "score"
+USER_IMPORT = "user_import"
+
+JOB_COLUMNS = ("job_id username model_id model_version status input_name input_path output_path "
+               "bytes_total bytes_done rows_done error attempts created_at started_at finished_at updated_at "
+               "cache_hits cache_misses cached_bytes kind")
+Job = namedtuple("Job", JOB_COLUMNS)
+_SELECT_JOB = f"SELECT {', '.join(JOB_COLUMNS.split())} FROM jobs"
+
+# Progress is written to the jobs row at most this often
+PROGRESS_INTERVAL = 1.0
+
+# Window for the worker utilization figure on the admin page
+UTILIZATION_WINDOW_SECONDS = 15 * 60
+
+def get_job(job_id):
+    row = db_util.fetch_one(f"{_SELECT_JOB} WHERE job_id = ?", (job_id,))
+    return Job(*row) if row else None
+
+def list_jobs(username=None, model_id=None, limit=20, kind=None):
+    """Most recent jobs, optionally for one user, model and/or kind."""
+    clauses, params = [], []
+    if kind is not None:
+        clauses.append("kind = ?")
+        params.append(kind)
+    if username is not None:
+        clauses.append("username = ?")
+        params.append(username)
+    if model_id is not None:
+        clauses.append("model_id = ?")
+        params.append(model_id)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = db_util.fetch_all(f"{_SELECT_JOB}{where} ORDER BY created_at DESC, rowid DESC LIMIT ?", (*params, limit))
+    return [Job(*row) for row in rows]
+
+def import_result(job):
+    """The user_bulk.ImportResult of a finished USER_IMPORT job."""
+    with open(job.output_path, encoding="utf-8") as f:
+        result = json.load(f)
+    return user_bulk.ImportResult(result["rows"], result["imported"],
+                                  [tuple(error) for error in result["errors"]], result["error_count"])
+
+def cache_totals(username=None, model_id=None):
+    """Prediction cache use summed over finished jobs: hits, misses, hit_ratio, cached_bytes."""
+    clauses, params = ["status = ?"], [SUCCEEDED]
+    if username is not None:
+        clauses.append("username = ?")
+        params.append(username)
+    if model_id is not None:
+        clauses.append("model_id = ?")
+        params.append(model_id)
+    hits, misses, cached_bytes = db_util.fetch_one(
+        "SELECT COALESCE(SUM(cache_hits), 0), COALESCE(SUM(cache_misses), 0), COALESCE(SUM(cached_bytes), 0) "
+        f"FROM jobs WHERE {' AND '.join(clauses)}", params)
+    lookups = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / lookups if lookups else 0.0,
+            "cached_bytes": cached_bytes}
+
+# Worker side (runs in the pool processes)
+
+_worker_registry = None
+
+def _registry():
+    """Model registry of this worker process; models stay loaded between jobs."""
+    global _worker_registry
+    if _worker_registry is None:
+        _worker_registry = model_registry.ModelRegistry()
+    return _worker_registry
+
+def _heartbeat_interval():
+    return max(1.0, config.JOB_STALE_SECONDS / 4)
+
+def _heartbeat(job_id, attempt, stop):
+    """Touch the job row until ``stop`` is set, independent of the job's progress."""
+    while not stop.wait(_heartbeat_interval()):
+        try:
+            db_util.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ? AND status = ? AND attempts = ?",
+                            (int(time.time()), job_id, RUNNING, attempt))
+        except Exception:
+            logger.exception("Heartbeat of job %s failed", job_id)
+
+def _init_worker(log_queue):
+    log_util.setup_worker_logging(log_queue)
+
+def _score(job, partial_path, report):
+    """Score the job's input into ``partial_path``; returns the columns to record on success."""
+    model = _registry().get(job.model_id, count_use=False)
+    with open(job.input_path, "rb") as src, \
+            scoring.open_output(partial_path, job.output_path.endswith(".gz")) as dst:
+        result = scoring.score_file(model, src, dst, progress=lambda rows: report(rows, src.tell()),
+                                    cache=prediction_cache.get_cache())
+    logger.info("Job %s scored %d rows in %.1fs (%d of %d chunks cached)", job.job_id, result.rows,
+                result.seconds, result.cache_hits, result.chunks)
+    return {"model_version": model.spec.version, "rows_done": result.rows, "cache_hits": result.cache_hits,
+            "cache_misses": result.cache_misses, "cached_bytes": result.cached_bytes}
+
+def _import_users(job, partial_path, report):
+    """Import the users in the job's input and write the result to ``partial_path`` as JSON."""
+    start = time.perf_counter()
+    with open(job.input_path, "rb") as src:
+        result = user_bulk.import_users(src, user_bulk.detect_format(job.input_name),
+                                        progress=lambda rows, imported: report(rows, src.tell()))
+    with open(partial_path, "w", encoding="utf-8") as f:
+        json.dump(result._asdict(), f)
+    logger.info("Job %s imported %d of %d users in %.1fs (%d errors)", job.job_id, result.imported,
+                result.rows, time.perf_counter() - start, result.error_count)
+    return {"rows_done": result.rows}
+
+_RUNNERS = {SCORE: _score, USER_IMPORT: _import_users}
+
+def run_job(job_id):
+    """Claim and execute one job; returns its final status, or None if it was not claimable
+    (or was requeued while it ran)."""
+    now = int(time.time())
+    claimed = db_util.execute(
+        "UPDATE jobs SET status = ?, started_at = ?, updated_at = ?, attempts = attempts + 1, "
+        "rows_done = 0, bytes_done = 0, error = NULL WHERE job_id = ? AND status = ?",
+        (RUNNING, now, now, job_id, QUEUED))
+    if not claimed:
+        return None
+    job = get_job(job_id)
+    attempt = job.attempts
+    # Per attempt, so a requeued attempt never writes into a live one's file
+    partial_path = f"{job.output_path}.{attempt}.part"
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job_id, attempt, stop), name="job-heartbeat", daemon=True)
+    heartbeat.start()
+    last_report = time.monotonic()
+
+    def report(rows, bytes_done):
+        nonlocal last_report
+        if time.monotonic() - last_report < PROGRESS_INTERVAL:
+            return
+        last_report = time.monotonic()
+        db_util.execute("UPDATE jobs SET rows_done = ?, bytes_done = ?, updated_at = ? "
+                        "WHERE job_id = ? AND attempts = ?",
+                        (rows, bytes_done, int(time.time()), job_id, attempt))
+
+    try:
+        done = _RUNNERS[job.kind](job, partial_path, report)
+        if get_job(job_id).attempts != attempt:
+            os.remove(partial_path)
+            logger.warning("Job %s was requeued while attempt %d ran; discarding its result", job_id, attempt)
+            return None
+        os.replace(partial_path, job.output_path)
+        now = int(time.time())
+        db_util.execute(
+            f"UPDATE jobs SET status = ?, bytes_done = bytes_total, finished_at = ?, updated_at = ?, "
+            f"{', '.join(f'{column} = ?' for column in done)} WHERE job_id = ? AND attempts = ?",
+            (SUCCEEDED, now, now, *done.values(), job_id, attempt))
+        return SUCCEEDED
+    except Exception as e:
+        if not isinstance(e, (ValueError, UnicodeDecodeError, model_registry.ModelError)):
+            logger.exception("Job %s failed", job_id)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        now = int(time.time())
+        db_util.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ?, updated_at = ? "
+                        "WHERE job_id = ? AND attempts = ?", (FAILED, str(e), now, now, job_id, attempt))
+        return FAILED
+    finally:
+        stop.set()
+        heartbeat.join()
+
+# Server side
+
+class JobQueue:
+    """Dispatches jobs to a process pool and recovers unfinished ones."""
+
+    def __init__(self, workers=None, jobs_dir=None, monitor_interval=None):
+        self.workers = workers or config.JOB_WORKERS
+        self.jobs_dir = jobs_dir or config.JOBS_DIR
+        self.monitor_interval = monitor_interval or max(5, config.JOB_STALE_SECONDS // 4)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._inflight = set()      # job ids handed to this process's pool
+        self._monitor = None
+        self._stopped = threading.Event()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: workers must not inherit the server's threads, locks or SQLite handles
+                context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                     initializer=_init_worker,
+                                                     initargs=(log_util.worker_log_queue(context),))
+            return self._executor
+
+    def start(self):
+        """Recover unfinished jobs now and keep doing so on a monitor thread."""
+        if self._monitor is not None:
+            return
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.recover()
+        self._monitor = threading.Thread(target=self._run_monitor, name="job-monitor", daemon=True)
+        self._monitor.start()
+        atexit.register(self.shutdown)
+
+    def _run_monitor(self):
+        while not self._stopped.wait(self.monitor_interval):
+            try:
+                self.recover()
+                self.prune()
+            except Exception:
+                logger.exception("Error in job monitor")
+
+    def _store(self, kind, username, model_id, model_version, source, input_name, input_file, output_file):
+        """Copy the upload into a new job directory and record the queued job; returns the job id."""
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir)
+        input_path = os.path.join(job_dir, input_file)
+        with open(input_path, "wb") as f:
+            shutil.copyfileobj(source, f, 1024 * 1024)
+        now = int(time.time())
+        db_util.execute(
+            "INSERT INTO jobs (job_id, kind, username, model_id, model_version, status, input_name, input_path, "
+            "output_path, bytes_total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, username, model_id, model_version, QUEUED, input_name, input_path,
+             os.path.join(job_dir, output_file), os.path.getsize(input_path), now, now))
+        self._dispatch(job_id)
+        return job_id
+
+    def submit(self, username, model_id, source, input_name, compress=True):
+        """Store the upload ``source`` (a binary file) as a new scoring job and queue it; returns the job id."""
+        spec = model_registry.get_registry().spec(model_id)
+        if spec is None:
+            raise model_registry.ModelError(f"Unknown model: {model_id}")
+        job_id = self._store(SCORE, username, model_id, spec.version, source, input_name, "input.csv",
+                             "scores.csv.gz" if compress else "scores.csv")
+        logger.info("Queued job %s (%s) for %s", job_id, model_id, username)
+        return job_id
+
+    def submit_import(self, username, source, input_name):
+        """Queue a bulk user import of the upload ``source`` (CSV or NDJSON); returns the job id."""
+        fmt = user_bulk.detect_format(input_name)
+        job_id = self._store(USER_IMPORT, username, "", "", source, input_name, f"input.{fmt}", "result.json")
+        logger.info("Queued user import %s for %s", job_id, username)
+        return job_id
+
+    def _dispatch(self, job_id):
+        with self._lock:
+            if job_id in self._inflight:
+                return
+            self._inflight.add(job_id)
+        try:
+            future = self._get_executor().submit(run_job, job_id)
+        except (BrokenProcessPool, RuntimeError):
+            self._reset_executor()
+            future = self._get_executor().submit(run_job, job_id)
+        future.add_done_callback(lambda done: self._on_done(job_id, done))
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            self._inflight.discard(job_id)
+        error = future.exception()
+        if error is None:
+            cache = prediction_cache.get_cache()
+            if cache is not None:
+                # The worker wrote (and maybe evicted) entries in another process
+                cache.refresh()
+            return
+        # The worker process died (or the pool broke) mid-job: retry or give up
+        logger.error("Job %s lost its worker: %r", job_id, error)
+        if isinstance(error, BrokenProcessPool):
+            self._reset_executor()
+        job = get_job(job_id)
+        if job is not None and job.status == RUNNING:
+            self._requeue_or_fail(job, f"worker failed: {error!r}")
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _requeue_or_fail(self, job, reason):
+        now = int(time.time())
+        status = QUEUED if job.attempts < config.JOB_MAX_ATTEMPTS else FAILED
+        db_util.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ?, updated_at = ? WHERE job_id = ? AND status = ?",
+            (status, None if status == QUEUED else reason, now if status == FAILED else None, now,
+             job.job_id, job.status))
+        if status == QUEUED:
+            self._dispatch(job.job_id)
+
+    def recover(self):
+        """Requeue jobs whose worker stopped reporting and dispatch every queued job."""
+        stale_before = int(time.time()) - config.JOB_STALE_SECONDS
+        with self._lock:
+            inflight = set(self._inflight)
+        stale = db_util.fetch_all(f"{_SELECT_JOB} WHERE status = ? AND updated_at < ?", (RUNNING, stale_before))
+        for row in stale:
+            job = Job(*row)
+            if job.job_id not in inflight:
+                logger.warning("Recovering stale job %s (attempt %d)", job.job_id, job.attempts)
+                self._requeue_or_fail(job, "worker stopped responding")
+        for (job_id,) in db_util.fetch_all("SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at",
+                                           (QUEUED,)):
+            self._dispatch(job_id)
+
+    def prune(self):
+        """Delete finished jobs (rows and files) older than JOB_RETENTION_DAYS."""
+        cutoff = int(time.time()) - config.JOB_RETENTION_DAYS * 86400
+        rows = db_util.fetch_all("SELECT job_id FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                                 (SUCCEEDED, FAILED, cutoff))
+        for (job_id,) in rows:
+            shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+            db_util.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        return len(rows)
+
+    def stats(self):
+        """Queue depth and worker utilization for the admin page."""
+        now = int(time.time())
+        counts = dict(db_util.fetch_all("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        window_start = now - UTILIZATION_WINDOW_SECONDS
+        # Busy worker-seconds in the window: finished jobs plus the elapsed part of running ones
+        busy = db_util.fetch_one(
+            "SELECT COALESCE(SUM(MIN(COALESCE(finished_at, ?), ?) - MAX(started_at, ?)), 0) FROM jobs "
+            "WHERE started_at IS NOT NULL AND (finished_at IS NULL OR finished_at > ?) AND status != ?",
+            (now, now, window_start, window_start, QUEUED))[0]
+        with self._lock:
+            inflight = len(self._inflight)
+        running = counts.get(RUNNING, 0)
+        return {
+            "workers": self.workers,
+            "queued": counts.get(QUEUED, 0),
+            "running": running,
+            "succeeded": counts.get(SUCCEEDED, 0),
+            "failed": counts.get(FAILED, 0),
+            "dispatched_here": inflight,
+            "busy_now": min(running, self.workers) / self.workers,
+            "utilization": min(1.0, busy / (self.workers * UTILIZATION_WINDOW_SECONDS)),
+        }
+
+    def shutdown(self):
+        self._stopped.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            # Unclaimed jobs stay queued in the table and are recovered on restart
+            executor.shutdown(wait=False, cancel_futures=True)
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_queue():
+    """Return the process-wide job queue, recovering unfinished jobs on first use."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                queue = JobQueue()
+                queue.start()
+                _queue = queue
+    return _queue
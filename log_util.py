@@ -0,0 +1,149 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+import config
+
+# Application logging. Modules get a logger with ``get_logger(__name__)`` and
+# log with %-style arguments (``logger.debug("user %s", name)``), so messages
+# below the active level cost a level check and nothing else.
+#
+# Records are handed to a bounded in-memory queue; a listener thread encodes
+# them as JSON lines and writes them to a rotating file (and to stderr). The
+# calling thread never waits on disk; if the queue is full the record is
+# dropped and counted.
+#
+# Only the server process opens the log file. Pool worker processes (jobs.py)
+# call setup_worker_logging with a queue from worker_log_queue(): their
+# records travel back over that queue and the server writes them, so a single
+# process owns the file and its rotation.
+
+ROOT_LOGGER = "app"
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records are dropped when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments now (they may change after the call returns) but
+        # leave JSON encoding and I/O to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener = None
+_handler = None
+_setup_lock = threading.Lock()
+
+def setup_logging():
+    """Configure the application loggers once per process."""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    with _setup_lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter()
+        handlers = []
+        # Child processes leave the file to the server (see setup_worker_logging)
+        if config.LOG_FILE and multiprocessing.parent_process() is None:
+            log_dir = os.path.dirname(os.path.abspath(config.LOG_FILE))
+            os.makedirs(log_dir, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                config.LOG_FILE, maxBytes=config.LOG_MAX_BYTES,
+                backupCount=config.LOG_BACKUP_COUNT, encoding="utf-8")
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+        handlers.append(stream_handler)
+
+        _handler = DroppingQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(logging.DEBUG if config.DEBUG else getattr(logging, config.LOG_LEVEL, logging.INFO))
+        root.addHandler(_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+class _ServerHandler(logging.Handler):
+    """Hands records received from worker processes to this process's loggers."""
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+_worker_queue = None
+
+def worker_log_queue(context):
+    """Queue that worker processes of the multiprocessing ``context`` send their records to.
+
+    Created once per process, with a listener thread that logs what arrives
+    through this process's handlers.
+    """
+    global _worker_queue
+    setup_logging()
+    with _setup_lock:
+        if _worker_queue is None:
+            _worker_queue = context.Queue(maxsize=config.LOG_QUEUE_SIZE)
+            listener = logging.handlers.QueueListener(_worker_queue, _ServerHandler())
+            listener.start()
+            atexit.register(listener.stop)
+        return _worker_queue
+
+def setup_worker_logging(log_queue):
+    """In a worker process: send every record to the server process through ``log_queue``."""
+    global _handler
+    setup_logging()
+    with _setup_lock:
+        root = logging.getLogger(ROOT_LOGGER)
+        root.removeHandler(_handler)
+        _handler = DroppingQueueHandler(log_queue)
+        root.addHandler(_handler)
+
+def get_logger(name):
+    """Return a logger under the application root, configuring logging on first use."""
+    setup_logging()
+    if name == "__main__" or not name:
+        name = "main"
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+def dropped_records():
+    """Number of log records dropped because the queue was full."""
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,194 @@
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+
+import config
+
+# Login throttling, checked before verify_user touches the database or the
+# password pool.
+#
+# Every attempt takes one token from the bucket of its client (IP address)
+# and one from the bucket of the username it tries; an empty bucket rejects
+# the attempt. Buckets refill continuously (``rate`` tokens per second up to
+# ``capacity``), so a user who mistypes a password a few times is not
+# affected while a credential-stuffing burst is cut down to the refill rate.
+# A global cap on concurrent attempts protects the database and hashing pool
+# when the attempts come from many clients at once.
+#
+# Buckets live in ``stripes`` independent OrderedDicts, each with its own
+# lock, kept in last-update order. A bucket idle for capacity / rate seconds
+# is full again, which is the same as having no bucket, so each access drops
+# the idle buckets at the old end of its stripe. A per-stripe entry limit
+# bounds memory even when millions of distinct keys arrive faster than they
+# expire (the oldest buckets are dropped first).
+
+Decision = namedtuple("Decision", "allowed reason retry_after")
+
+ALLOWED = Decision(True, None, 0.0)
+
+# Rejection reasons
+CLIENT = "client"
+USERNAME = "username"
+BUSY = "busy"
+
+# Username keys are truncated so arbitrary input cannot grow the table's memory
+MAX_KEY_LENGTH = 128
+
+class TokenBuckets:
+    """Lock-striped token buckets keyed by string, with idle eviction and a size bound."""
+
+    def __init__(self, capacity, rate, max_entries, stripes=64):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.idle_seconds = self.capacity / self.rate
+        self._stripes = [OrderedDict() for _ in range(stripes)]   # key -> (tokens, updated_at)
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._max_per_stripe = max(1, max_entries // stripes)
+        self.evicted = 0
+
+    def _stripe(self, key):
+        return zlib.crc32(key.encode("utf-8", "surrogatepass")) % len(self._stripes)
+
+    def take(self, key, now=None):
+        """Take a token for ``key``; returns 0.0 on success, else the seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        index = self._stripe(key)
+        buckets = self._stripes[index]
+        with self._locks[index]:
+            entry = buckets.pop(key, None)
+            if entry is None:
+                tokens = self.capacity
+            else:
+                tokens = min(self.capacity, entry[0] + (now - entry[1]) * self.rate)
+            if tokens >= 1.0:
+                tokens -= 1.0
+                wait = 0.0
+            else:
+                wait = (1.0 - tokens) / self.rate
+            buckets[key] = (tokens, now)
+            self._evict(buckets, now)
+        return wait
+
+    def _evict(self, buckets, now):
+        """Drop refilled buckets from the old end of a stripe, then enforce its size bound."""
+        while buckets:
+            key, (_, updated_at) = next(iter(buckets.items()))
+            if now - updated_at < self.idle_seconds and len(buckets) <= self._max_per_stripe:
+                break
+            buckets.popitem(last=False)
+            self.evicted += 1
+
+    def __len__(self):
+        return sum(len(buckets) for buckets in self._stripes)
+
+class LoginThrottle:
+    """Per-client and per-username token buckets plus a global cap on concurrent attempts."""
+
+    def __init__(self, client_burst=None, client_per_minute=None, user_burst=None, user_per_minute=None,
+                 max_concurrent=None, max_entries=None):
+        max_entries = max_entries or config.LOGIN_THROTTLE_MAX_KEYS
+        self.clients = TokenBuckets(client_burst or config.LOGIN_CLIENT_BURST,
+                                    (client_per_minute or config.LOGIN_CLIENT_PER_MINUTE) / 60, max_entries)
+        self.usernames = TokenBuckets(user_burst or config.LOGIN_USER_BURST,
+                                      (user_per_minute or config.LOGIN_USER_PER_MINUTE) / 60, max_entries)
+        self.max_concurrent = max_concurrent or config.LOGIN_MAX_CONCURRENT
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._counts_lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = {CLIENT: 0, USERNAME: 0, BUSY: 0}
+
+    def _reject(self, reason, retry_after):
+        with self._counts_lock:
+            self.rejected[reason] += 1
+        return Decision(False, reason, retry_after)
+
+    def check(self, client, username):
+        """Take the tokens for one attempt; returns a Decision. Does not take a concurrency slot."""
+        wait = self.clients.take(client)
+        if wait:
+            return self._reject(CLIENT, wait)
+        wait = self.usernames.take(username[:MAX_KEY_LENGTH])
+        if wait:
+            return self._reject(USERNAME, wait)
+        return ALLOWED
+
+    def attempt(self, client, username):
+        """Context manager for one login attempt: yields a Decision and holds a concurrency slot if allowed."""
+        return _Attempt(self, client, username)
+
+    def stats(self):
+        with self._counts_lock:
+            rejected = dict(self.rejected)
+        return {
+            "allowed": self.allowed,
+            "rejected": rejected,
+            "rejected_total": sum(rejected.values()),
+            "client_keys": len(self.clients),
+            "username_keys": len(self.usernames),
+            "evicted": self.clients.evicted + self.usernames.evicted,
+        }
+
+class _Attempt:
+    def __init__(self, throttle, client, username):
+        self.throttle = throttle
+        self.client = client
+        self.username = username
+        self._holding = False
+
+    def __enter__(self):
+        throttle = self.throttle
+        decision = throttle.check(self.client, self.username)
+        if not decision.allowed:
+            return decision
+        if not throttle._slots.acquire(blocking=False):
+            return throttle._reject(BUSY, 1.0)
+        self._holding = True
+        with throttle._counts_lock:
+            throttle.allowed += 1
+        return decision
+
+    def __exit__(self, *exc_info):
+        if self._holding:
+            self.throttle._slots.release()
+        return False
+
+def client_key():
+    """Identify the client of the current Streamlit session, for the per-client buckets.
+
+    With LOGIN_TRUST_FORWARDED_FOR set (the app runs behind a proxy that sets
+    it) the first X-Forwarded-For address is used; otherwise the websocket's
+    remote address. Falls back to the session id when neither is available.
+    """
+    import streamlit as st
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    if config.LOGIN_TRUST_FORWARDED_FOR:
+        forwarded = st.context.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return "local"
+    try:
+        # Not public API; guarded so a Streamlit upgrade degrades to per-session buckets
+        client = Runtime.instance().get_client(ctx.session_id)
+        remote_ip = client.request.remote_ip
+        if isinstance(remote_ip, str) and remote_ip:
+            return remote_ip
+    except Exception:
+        pass
+    return f"session:{ctx.session_id}"
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+def get_throttle():
+    """Return the process-wide login throttle."""
+    global _throttle
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                _throttle = LoginThrottle()
+    return _throttle
@@ -0,0 +1,290 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+import log_util
+
+logger = log_util.get_logger(__name__)
+
+# In-process latency metrics. Code is timed with spans, either as a context
+# manager or a decorator:
+#
+#   with metrics_util.span("init_db"):
+#       ...
+#
+#   @metrics_util.timed("db.fetch_one")
+#   def fetch_one(...): ...
+#
+# Each stage name owns a histogram with fixed, exponentially spaced buckets, so
+# recording a span is a bisect and a few integer increments under a lock, and
+# memory does not grow with traffic. Percentiles are interpolated within the
+# bucket that contains them. The aggregates can be exported in the Prometheus
+# text format to a file and/or a local HTTP endpoint (both off by default).
+
+# Bucket upper bounds in seconds: 50µs doubling every two steps up to ~52s
+BUCKETS = tuple(0.00005 * 2 ** (i / 2) for i in range(41))
+
+METRIC_PREFIX = "app"
+
+class Histogram:
+    """Latency histogram with a count, sum and error count."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds, error=False):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+            if error:
+                self.errors += 1
+
+    def snapshot(self):
+        """Return (bucket_counts, count, errors, total, max) consistently."""
+        with self._lock:
+            return list(self._counts), self.count, self.errors, self.total, self.max
+
+    def percentile(self, q, snapshot=None):
+        """Estimate the ``q`` quantile (0..1) in seconds, or None without samples."""
+        counts, count, _, _, maximum = snapshot or self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else maximum
+                # Linear interpolation inside the bucket, capped at the observed max
+                value = lower + (upper - lower) * (rank - seen) / bucket_count
+                return min(value, maximum)
+            seen += bucket_count
+        return maximum
+
+class Metrics:
+    """Registry of stage histograms, counters and gauge callbacks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}   # name -> (help, callable)
+        self.started_at = time.time()
+
+    def histogram(self, stage):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage, seconds, error=False):
+        self.histogram(stage).observe(seconds, error)
+
+    def inc(self, name, amount=1):
+        """Increase a monotonically growing counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name, func, help_text=""):
+        """Register a callable that returns the current value of ``name`` when exported."""
+        with self._lock:
+            self._gauges[name] = (help_text, func)
+
+    def stages(self):
+        """Return a summary row per stage, sorted by name."""
+        with self._lock:
+            items = sorted(self._histograms.items())
+        rows = []
+        for stage, histogram in items:
+            snapshot = histogram.snapshot()
+            _, count, errors, total, maximum = snapshot
+            rows.append({
+                "stage": stage,
+                "count": count,
+                "errors": errors,
+                "error_rate": errors / count if count else 0.0,
+                "mean": total / count if count else None,
+                "p50": histogram.percentile(0.50, snapshot),
+                "p95": histogram.percentile(0.95, snapshot),
+                "p99": histogram.percentile(0.99, snapshot),
+                "max": maximum,
+            })
+        return rows
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def gauges(self):
+        """Evaluate every registered gauge; failing gauges are skipped."""
+        with self._lock:
+            items = sorted(self._gauges.items())
+        values = {}
+        for name, (_, func) in items:
+            try:
+                values[name] = func()
+            except Exception:
+                logger.exception("Error reading gauge %s", name)
+        return values
+
+    def reset(self):
+        """Forget all histograms and counters (gauges stay registered)."""
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+            self.started_at = time.time()
+
+    def render_prometheus(self):
+        """Return every metric in the Prometheus text exposition format."""
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Time spent per instrumented stage.",
+            f"# TYPE {name} histogram",
+        ]
+        errors = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+        for stage, histogram in items:
+            counts, count, error_count, total, _ = histogram.snapshot()
+            label = _escape_label(stage)
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{stage="{label}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{label}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{label}"}} {total:.9f}')
+            lines.append(f'{name}_count{{stage="{label}"}} {count}')
+            errors.append(f'{METRIC_PREFIX}_stage_errors_total{{stage="{label}"}} {error_count}')
+        lines.append(f"# HELP {METRIC_PREFIX}_stage_errors_total Stages that ended with an exception.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_stage_errors_total counter")
+        lines.extend(errors)
+        for counter, value in sorted(self.counters().items()):
+            metric = f"{METRIC_PREFIX}_{counter}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        with self._lock:
+            gauge_help = {gauge: help_text for gauge, (help_text, _) in self._gauges.items()}
+        for gauge, value in self.gauges().items():
+            metric = f"{METRIC_PREFIX}_{gauge}"
+            if gauge_help.get(gauge):
+                lines.append(f"# HELP {metric} {gauge_help[gauge]}")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics():
+    """Return the process-wide metrics registry, starting the exporters on first use."""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+                _start_exporters(_metrics)
+    return _metrics
+
+@contextmanager
+def span(stage):
+    """Time the ``with`` block under ``stage``; exceptions count as errors and propagate.
+
+    Streamlit's st.rerun()/st.stop() unwind with BaseException subclasses; those
+    are recorded as normal completions.
+    """
+    metrics = get_metrics()
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        metrics.observe(stage, time.perf_counter() - start, error)
+
+def timed(stage):
+    """Decorator form of ``span``."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Exporters
+
+def write_textfile(path, metrics=None):
+    """Atomically write the Prometheus text format to ``path``."""
+    metrics = metrics or get_metrics()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(metrics.render_prometheus())
+    os.replace(tmp_path, path)
+
+def _textfile_loop(metrics, path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_textfile(path, metrics)
+        except Exception:
+            logger.exception("Error writing metrics file %s", path)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics endpoint: " + format, *args)
+
+def start_http_server(port, host="127.0.0.1", metrics=None):
+    """Serve ``/metrics`` on a daemon thread; returns the server."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"metrics": metrics or get_metrics()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, server.server_port)
+    return server
+
+def _start_exporters(metrics):
+    if config.METRICS_FILE:
+        threading.Thread(target=_textfile_loop, name="metrics-textfile", daemon=True,
+                         args=(metrics, config.METRICS_FILE, config.METRICS_EXPORT_INTERVAL_SECONDS)).start()
+    if config.METRICS_PORT:
+        try:
+            start_http_server(config.METRICS_PORT, config.METRICS_HOST, metrics)
+        except OSError as e:
+            # Another server process may already own the port
+            logger.warning("Could not start metrics endpoint on port %d: %s", config.METRICS_PORT, e)
@@ -0,0 +1,309 @@
+import threading
+
+import db_util
+import log_util
+from password_util import hash_password
+
+logger = log_util.get_logger(__name__)
+
+# Numbered schema migrations. The schema version is stored in the database
+# header (PRAGMA user_version); each migration runs in its own transaction
+# together with the version bump, so a crash never leaves a half-applied step.
+# Append new migrations to the end of the list, never edit applied ones.
+
+def _create_users_table(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password TEXT NOT NULL,
+        is_admin BOOLEAN NOT NULL
+    )
+    ''')
+
+    # Seed the default accounts unless they already exist
+    seed_users = [
+        ('admin', 'admin123', True),
+        ('user', 'password', False),
+    ]
+    for username, password, is_admin in seed_users:
+        cursor.execute('INSERT OR IGNORE INTO users (username, password, is_admin) VALUES (?, ?, ?)',
+                      (username, hash_password(password), is_admin))
+
+def _index_users_listing(cursor):
+    # Covering index for the admin listing (username order plus admin flag)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username_admin ON users (username, is_admin)')
+
+def _create_sessions_table(cursor):
+    # One row per browser session; navigation state is kept next to the token
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        token TEXT NOT NULL,
+        username TEXT NOT NULL,
+        current_page TEXT NOT NULL DEFAULT 'default',
+        current_section TEXT,
+        expires_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_username ON sessions (username)')
+
+def _create_token_revocations_table(cursor):
+    # Append-only revocation log: either a single token id (logout) or every
+    # token of a user issued up to revoked_before (password reset)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS token_revocations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        token_id BLOB,
+        username TEXT,
+        revoked_before INTEGER,
+        expires_at INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_token_revocations_expires_at ON token_revocations (expires_at)')
+    # Tokens now use the binary format; sessions holding old JSON tokens must log in again
+    cursor.execute('DELETE FROM sessions')
+
+def _create_user_stats(cursor):
+    # Row count of users maintained by triggers, so the admin page never counts the table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        user_count INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('INSERT OR REPLACE INTO user_stats (id, user_count) SELECT 1, COUNT(*) FROM users')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_users_count_insert AFTER INSERT ON users
+    BEGIN
+        UPDATE user_stats SET user_count = user_count + 1 WHERE id = 1;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_users_count_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE user_stats SET user_count = user_count - 1 WHERE id = 1;
+    END
+    ''')
+
+def _create_model_usage_table(cursor):
+    # How often each model was used, so startup warm-up can preload the busiest ones
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS model_usage (
+        model_id TEXT PRIMARY KEY,
+        uses INTEGER NOT NULL,
+        last_used INTEGER NOT NULL
+    )
+    ''')
+
+def _create_jobs_table(cursor):
+    # Background scoring jobs; files live under JOBS_DIR/<job_id>/
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        username TEXT NOT NULL,
+        model_id TEXT NOT NULL,
+        model_version TEXT NOT NULL,
+        status TEXT NOT NULL,
+        input_name TEXT NOT NULL,
+        input_path TEXT NOT NULL,
+        output_path TEXT NOT NULL,
+        bytes_total INTEGER NOT NULL DEFAULT 0,
+        bytes_done INTEGER NOT NULL DEFAULT 0,
+        rows_done INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at INTEGER NOT NULL,
+        started_at INTEGER,
+        finished_at INTEGER,
+        updated_at INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_username ON jobs (username, created_at)')
+
+def _add_jobs_cache_columns(cursor):
+    # Prediction cache use per job (chunks served from / added to the cache, input bytes not re-scored)
+    cursor.execute('ALTER TABLE jobs ADD COLUMN cache_hits INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('ALTER TABLE jobs ADD COLUMN cache_misses INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('ALTER TABLE jobs ADD COLUMN cached_bytes INTEGER NOT NULL DEFAULT 0')
+
+def _create_eval_metrics_table(cursor):
+    # Evaluation accumulators per model version; fingerprint is the column store generation (evaluation.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS eval_metrics (
+        model_id TEXT NOT NULL,
+        model_version TEXT NOT NULL,
+        data_path TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        bytes_done INTEGER NOT NULL,
+        rows INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        updated_at INTEGER NOT NULL,
+        PRIMARY KEY (model_id, model_version)
+    )
+    ''')
+
+def _create_user_changes_log(cursor):
+    # Usernames whose row changed, in commit order, so user_directory.py can refresh incrementally
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_users_changes_insert AFTER INSERT ON users
+    BEGIN
+        INSERT INTO user_changes (username) VALUES (NEW.username);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_users_changes_update AFTER UPDATE OF username, password, is_admin ON users
+    BEGIN
+        INSERT INTO user_changes (username) VALUES (OLD.username);
+        INSERT INTO user_changes (username) SELECT NEW.username WHERE NEW.username IS NOT OLD.username;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_users_changes_delete AFTER DELETE ON users
+    BEGIN
+        INSERT INTO user_changes (username) VALUES (OLD.username);
+    END
+    ''')
+
+def _create_audit_events_table(cursor):
+    # Append-only audit trail written in batches by audit.py; rows are only deleted by retention pruning
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS audit_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at INTEGER NOT NULL,
+        event TEXT NOT NULL,
+        username TEXT,
+        target TEXT,
+        detail TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_events_no_update BEFORE UPDATE ON audit_events
+    BEGIN
+        SELECT RAISE(ABORT, 'audit_events is append-only');
+    END
+    ''')
+
+def _create_usage_rollups(cursor):
+    # Minute/hour/day usage counts maintained by the audit writer (usage_rollups.py), the
+    # users already counted as active per open bucket, and the index retention pruning uses
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS usage_rollups (
+        granularity TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        metric TEXT NOT NULL,
+        key TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (granularity, bucket, metric, key)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS usage_active (
+        granularity TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        PRIMARY KEY (granularity, bucket, username)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_events_created ON audit_events (created_at)')
+    # Roll up the events recorded before this migration
+    for granularity, seconds in (("minute", 60), ("hour", 3600), ("day", 86400)):
+        cursor.execute('''
+        INSERT INTO usage_rollups (granularity, bucket, metric, key, count)
+        SELECT ?, created_at - created_at % ?,
+               CASE event WHEN 'login' THEN 'logins' WHEN 'login_failed' THEN 'login_failures' ELSE 'page_views' END,
+               CASE event WHEN 'page_view' THEN COALESCE(target, '') ELSE '' END, COUNT(*)
+        FROM audit_events WHERE event IN ('login', 'login_failed', 'page_view')
+        GROUP BY 2, 3, 4
+        ''', (granularity, seconds))
+        cursor.execute('''
+        INSERT OR IGNORE INTO usage_active (granularity, bucket, username)
+        SELECT DISTINCT ?, created_at - created_at % ?, username
+        FROM audit_events WHERE event IN ('login', 'page_view') AND username IS NOT NULL
+        ''', (granularity, seconds))
+        cursor.execute('''
+        INSERT INTO usage_rollups (granularity, bucket, metric, key, count)
+        SELECT granularity, bucket, 'active_users', '', COUNT(*) FROM usage_active
+        WHERE granularity = ? GROUP BY bucket
+        ''', (granularity,))
+
+def _revocations_in_milliseconds(cursor):
+    # revoked_before switches from "issued at or before this second" to
+    # "issued before this millisecond", matching the millisecond issue times
+    # of version 2 session tokens
+    cursor.execute('UPDATE token_revocations SET revoked_before = (revoked_before + 1) * 1000 '
+                   'WHERE revoked_before IS NOT NULL')
+
+def _add_jobs_kind(cursor):
+    # Bulk user imports run on the job queue next to scoring jobs; they have no model
+    cursor.execute("ALTER TABLE jobs ADD COLUMN kind TEXT NOT NULL DEFAULT 'score'")
+
+MIGRATIONS = [
+    (1, "create users table and default accounts", _create_users_table),
+    (2, "covering index for user listing", _index_users_listing),
+    (3, "sessions table", _create_sessions_table),
+    (4, "token revocations table", _create_token_revocations_table),
+    (5, "trigger-maintained user count", _create_user_stats),
+    (6, "model usage counts", _create_model_usage_table),
+    (7, "background jobs table", _create_jobs_table),
+    (8, "prediction cache columns on jobs", _add_jobs_cache_columns),
+    (9, "evaluation metrics table", _create_eval_metrics_table),
+    (10, "user change log for the in-memory directory", _create_user_changes_log),
+    (11, "audit events table", _create_audit_events_table),
+    (12, "usage rollup tables", _create_usage_rollups),
+    (13, "millisecond user token revocations", _revocations_in_milliseconds),
+    (14, "job kinds", _add_jobs_kind),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_applied = False
+_lock = threading.Lock()
+
+def get_schema_version(conn):
+    """Return the schema version recorded in the database."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    """Apply every pending migration on ``conn`` and return the versions applied."""
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if get_schema_version(conn) >= version:
+            continue
+        # Take the write lock first and re-check, so concurrent server
+        # processes starting together apply each migration exactly once.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            logger.info("Applying migration %d: %s", version, description)
+            step(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+def ensure_schema():
+    """Bring the schema up to date once per process; later calls are a flag check."""
+    global _applied
+    if _applied:
+        return []
+    with _lock:
+        if _applied:
+            return []
+        with db_util.connection() as conn:
+            applied = migrate(conn)
+        _applied = True
+    return applied
@@ -0,0 +1,338 @@
+import atexit
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+import config
+import db_util
+import log_util
+
+logger = log_util.get_logger(__name__)
+
+# Models live in MODELS_DIR, one directory per model:
+#
+#   models/<model_id>/model.json    metadata (see ModelSpec)
+#   models/<model_id>/<artifact>    weights, named by "artifact" in model.json
+#
+# model.json needs "name", "version", "kind" ("classifier" or "regressor"),
+# "format" and "artifact"; "features", "classes", "description" and "metrics"
+# are optional and shown on the model pages. "evaluation": {"data": "eval.csv",
+# "target": "<column>"} names a held-out CSV in the model directory from which
+# evaluation.py computes the metrics instead. Supported formats:
+#
+#   npz     NumPy archive with "coef" (features x outputs) and "intercept";
+#           evaluated as a linear model (softmax/sigmoid for classifiers)
+#   pickle  any pickled object with a ``predict(X)`` method. Only put trusted
+#           files in the model directory: unpickling runs code.
+#
+# Discovery reads only the metadata. Artifacts are loaded on first use, once
+# per process, and shared by every session. Loaded models are kept in LRU
+# order and evicted when their total size exceeds MODEL_MEMORY_BUDGET_MB.
+
+KIND_CLASSIFIER = "classifier"
+KIND_REGRESSOR = "regressor"
+METADATA_FILE = "model.json"
+
+ModelSpec = namedtuple("ModelSpec", "model_id name version kind format artifact features classes "
+                                    "description metrics path size_bytes eval_data eval_target")
+
+class ModelError(Exception):
+    """Raised when a model is unknown or its artifact cannot be loaded."""
+
+class LinearModel:
+    """Linear model from an npz archive: ``X @ coef + intercept``."""
+
+    def __init__(self, coef, intercept, kind):
+        self.coef = coef.reshape(-1, 1) if coef.ndim == 1 else coef
+        self.intercept = np.atleast_1d(intercept)
+        self.kind = kind
+
+    @property
+    def nbytes(self):
+        return self.coef.nbytes + self.intercept.nbytes
+
+    def decision_function(self, X):
+        return X @ self.coef + self.intercept
+
+    def predict_proba(self, X):
+        scores = self.decision_function(X)
+        if scores.shape[1] == 1:
+            positive = 1.0 / (1.0 + np.exp(-scores[:, 0]))
+            return np.column_stack((1.0 - positive, positive))
+        scores = scores - scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def predict(self, X):
+        if self.kind == KIND_CLASSIFIER:
+            return self.predict_proba(X).argmax(axis=1)
+        return self.decision_function(X)[:, 0]
+
+class LoadedModel:
+    """A loaded model together with its spec and approximate memory footprint."""
+
+    def __init__(self, spec, estimator, nbytes):
+        self.spec = spec
+        self.estimator = estimator
+        self.nbytes = nbytes
+        self.loaded_at = time.time()
+
+    def predict(self, X):
+        return self.estimator.predict(X)
+
+    def predict_proba(self, X):
+        return self.estimator.predict_proba(X)
+
+    def labels(self, predictions):
+        """Map class indices to class names for classifiers with known classes."""
+        classes = self.spec.classes
+        if self.spec.kind != KIND_CLASSIFIER or not classes:
+            return predictions
+        return np.asarray(classes, dtype=object)[predictions]
+
+def _read_spec(model_dir, model_id):
+    with open(os.path.join(model_dir, METADATA_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    artifact = os.path.join(model_dir, meta["artifact"])
+    evaluation = meta.get("evaluation") or {}
+    return ModelSpec(
+        model_id=model_id,
+        name=meta.get("name", model_id),
+        version=str(meta["version"]),
+        kind=meta["kind"],
+        format=meta["format"],
+        artifact=artifact,
+        features=tuple(meta.get("features", ())),
+        classes=tuple(meta.get("classes", ())),
+        description=meta.get("description", ""),
+        metrics=meta.get("metrics", {}),
+        path=model_dir,
+        size_bytes=os.path.getsize(artifact) if os.path.exists(artifact) else 0,
+        eval_data=os.path.join(model_dir, evaluation["data"]) if evaluation.get("data") else None,
+        eval_target=evaluation.get("target"),
+    )
+
+def discover(models_dir):
+    """Return {model_id: ModelSpec} for every model directory with valid metadata."""
+    specs = {}
+    if not os.path.isdir(models_dir):
+        return specs
+    for model_id in sorted(os.listdir(models_dir)):
+        model_dir = os.path.join(models_dir, model_id)
+        if model_id.startswith((".", "_")) or not os.path.isfile(os.path.join(model_dir, METADATA_FILE)):
+            continue
+        try:
+            specs[model_id] = _read_spec(model_dir, model_id)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Skipping model %s: %s", model_id, e)
+    return specs
+
+def _load_artifact(spec):
+    """Load the estimator for ``spec``; returns (estimator, nbytes)."""
+    if spec.format == "npz":
+        with np.load(spec.artifact) as archive:
+            estimator = LinearModel(archive["coef"], archive["intercept"], spec.kind)
+        return estimator, estimator.nbytes
+    if spec.format == "pickle":
+        with open(spec.artifact, "rb") as f:
+            estimator = pickle.load(f)
+        # The unpickled object graph is not measurable cheaply; its file size is a fair proxy
+        return estimator, max(spec.size_bytes, getattr(estimator, "nbytes", 0))
+    raise ModelError(f"Unsupported model format for {spec.model_id}: {spec.format}")
+
+def _dir_signature(models_dir):
+    """mtimes of the model dir and each model's metadata; they change when models are added or updated."""
+    if not os.path.isdir(models_dir):
+        return None
+    signature = [os.stat(models_dir).st_mtime_ns]
+    for entry in os.scandir(models_dir):
+        metadata = os.path.join(entry.path, METADATA_FILE)
+        if entry.is_dir() and os.path.exists(metadata):
+            signature.append((entry.name, os.stat(metadata).st_mtime_ns))
+    return tuple(sorted(signature, key=str))
+
+class ModelRegistry:
+    """Process-wide model cache with lazy loading and a memory budget.
+
+    ``get`` loads a model on first use; concurrent first requests for the same
+    model wait for a single load. Loaded models are kept in LRU order and the
+    least recently used ones are evicted once the total exceeds ``budget_bytes``
+    (a model larger than the whole budget is still served, alone). Use counts
+    are persisted to the ``model_usage`` table so warm-up can preload the most
+    used models after a restart.
+    """
+
+    def __init__(self, models_dir=None, budget_bytes=None, usage_flush_interval=60):
+        self.models_dir = models_dir or config.MODELS_DIR
+        if budget_bytes is None:
+            budget_bytes = config.MODEL_MEMORY_BUDGET_MB * 1024 * 1024
+        self.budget_bytes = budget_bytes
+        self.usage_flush_interval = usage_flush_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._specs = {}
+        self._loaded = OrderedDict()   # model_id -> LoadedModel, least recently used first
+        self._load_locks = {}          # model_id -> Lock held while loading
+        self._uses = {}                # model_id -> uses not yet written to model_usage
+        self._last_usage_flush = time.time()
+        self.loads = 0
+        self.evictions = 0
+        self.hits = 0
+
+    def _refresh(self):
+        signature = _dir_signature(self.models_dir)
+        if signature == self._signature:
+            return
+        specs = discover(self.models_dir)
+        with self._lock:
+            # Drop loaded models whose metadata changed (new version) or that disappeared
+            for model_id in list(self._loaded):
+                if specs.get(model_id) != self._loaded[model_id].spec:
+                    del self._loaded[model_id]
+            self._specs = specs
+            self._signature = signature
+
+    def specs(self):
+        """Return the discovered ModelSpecs, sorted by model id."""
+        self._refresh()
+        return [self._specs[model_id] for model_id in sorted(self._specs)]
+
+    def spec(self, model_id):
+        self._refresh()
+        return self._specs.get(model_id)
+
+    def is_loaded(self, model_id):
+        with self._lock:
+            return model_id in self._loaded
+
+    def get(self, model_id, count_use=True):
+        """Return the LoadedModel for ``model_id``, loading it on first use."""
+        self._refresh()
+        if count_use:
+            self._record_use(model_id)
+        with self._lock:
+            model = self._loaded.get(model_id)
+            if model is not None:
+                self._loaded.move_to_end(model_id)
+                self.hits += 1
+                return model
+            spec = self._specs.get(model_id)
+            if spec is None:
+                raise ModelError(f"Unknown model: {model_id}")
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+
+        with load_lock:
+            # Another session may have finished loading while we waited
+            with self._lock:
+                model = self._loaded.get(model_id)
+                if model is not None:
+                    self._loaded.move_to_end(model_id)
+                    self.hits += 1
+                    return model
+            start = time.perf_counter()
+            try:
+                estimator, nbytes = _load_artifact(spec)
+            except ModelError:
+                raise
+            except Exception as e:
+                logger.exception("Error loading model %s", model_id)
+                raise ModelError(f"Could not load model {model_id}: {e}") from e
+            model = LoadedModel(spec, estimator, nbytes)
+            with self._lock:
+                self._loaded[model_id] = model
+                self.loads += 1
+                self._evict(keep=model_id)
+            logger.info("Loaded model %s %s (%d bytes) in %.3fs",
+                        model_id, spec.version, nbytes, time.perf_counter() - start)
+            return model
+
+    def _evict(self, keep):
+        """Evict least recently used models until within budget; caller holds the lock."""
+        total = sum(model.nbytes for model in self._loaded.values())
+        for model_id in list(self._loaded):
+            if total <= self.budget_bytes:
+                break
+            if model_id == keep:
+                continue
+            total -= self._loaded.pop(model_id).nbytes
+            self.evictions += 1
+            logger.info("Evicted model %s to stay within the memory budget", model_id)
+
+    def unload(self, model_id):
+        with self._lock:
+            return self._loaded.pop(model_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            loaded = [(model_id, model.nbytes) for model_id, model in self._loaded.items()]
+        return {
+            "loaded": loaded,
+            "loaded_bytes": sum(nbytes for _, nbytes in loaded),
+            "budget_bytes": self.budget_bytes,
+            "loads": self.loads,
+            "hits": self.hits,
+            "evictions": self.evictions,
+        }
+
+    # Usage counts and warm-up
+
+    def _record_use(self, model_id):
+        with self._lock:
+            self._uses[model_id] = self._uses.get(model_id, 0) + 1
+            due = time.time() - self._last_usage_flush >= self.usage_flush_interval
+        if due:
+            self.flush_usage()
+
+    def flush_usage(self):
+        """Add the buffered use counts to the model_usage table."""
+        with self._lock:
+            uses, self._uses = self._uses, {}
+            self._last_usage_flush = time.time()
+        if not uses:
+            return
+        now = int(time.time())
+        try:
+            with db_util.transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO model_usage (model_id, uses, last_used) VALUES (?, ?, ?) '
+                    'ON CONFLICT(model_id) DO UPDATE SET uses = uses + excluded.uses, last_used = excluded.last_used',
+                    [(model_id, count, now) for model_id, count in uses.items()])
+        except Exception:
+            logger.exception("Error writing model usage counts")
+
+    def most_used(self, limit):
+        rows = db_util.fetch_all('SELECT model_id FROM model_usage ORDER BY uses DESC LIMIT ?', (limit,))
+        return [row[0] for row in rows]
+
+    def warm_up(self, limit):
+        """Load up to ``limit`` of the most used models that fit in the budget together."""
+        self._refresh()
+        budget = self.budget_bytes
+        for model_id in self.most_used(limit):
+            spec = self._specs.get(model_id)
+            if spec is None or spec.size_bytes > budget:
+                continue
+            try:
+                budget -= self.get(model_id, count_use=False).nbytes
+            except ModelError as e:
+                logger.warning("Warm-up skipped model %s: %s", model_id, e)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Return the process-wide model registry (warm-up runs from health.py)."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = ModelRegistry()
+                atexit.register(registry.flush_usage)
+                _registry = registry
+    return _registry
@@ -0,0 +1,176 @@
+import ast
+import importlib
+import os
+import threading
+from collections import namedtuple
+
+import log_util
+
+logger = log_util.get_logger(__name__)
+
+# Page modules live in section packages under pages/ (pages/<section>/<page>.py)
+# and describe themselves with a module-level literal, for example:
+#
+#   PAGE = {"id": "model_a", "label": "Model A", "order": 1, "entry": "model_a_page"}
+#
+# Optional keys: "role" ("user" or "admin", default "user"), "section_label"
+# and "section_order". Discovery reads that literal with ``ast`` without
+# importing the module; the module is imported the first time the page is shown.
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+
+ROLE_USER = "user"
+ROLE_ADMIN = "admin"
+
+PageSpec = namedtuple("PageSpec", "page_id section label role module entry order")
+Section = namedtuple("Section", "section_id label order pages")
+
+def _read_page_literal(path):
+    """Return the PAGE dict literal of a module file, or None if it has none."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == "PAGE" for target in node.targets):
+            return ast.literal_eval(node.value)
+    return None
+
+def discover(pages_dir=PAGES_DIR, package="pages"):
+    """Scan section packages under ``pages_dir`` and return the page manifest."""
+    pages = []
+    section_meta = {}
+    for section_id in sorted(os.listdir(pages_dir)):
+        section_dir = os.path.join(pages_dir, section_id)
+        if section_id.startswith(("_", ".")) or not os.path.isdir(section_dir):
+            continue
+        for filename in sorted(os.listdir(section_dir)):
+            if not filename.endswith(".py") or filename.startswith("_"):
+                continue
+            try:
+                meta = _read_page_literal(os.path.join(section_dir, filename))
+            except (SyntaxError, ValueError) as e:
+                logger.warning("Skipping page module %s/%s: %s", section_id, filename, e)
+                continue
+            if not meta:
+                continue
+            pages.append(PageSpec(
+                page_id=meta["id"],
+                section=section_id,
+                label=meta["label"],
+                role=meta.get("role", ROLE_USER),
+                module=f"{package}.{section_id}.{filename[:-3]}",
+                entry=meta["entry"],
+                order=meta.get("order", 0),
+            ))
+            label, order = section_meta.get(section_id, (section_id.replace("_", " ").title(), None))
+            section_meta[section_id] = (meta.get("section_label", label),
+                                        meta.get("section_order", order))
+    return pages, section_meta
+
+def _tree_signature(pages_dir):
+    """mtimes of pages/ and its section dirs; they change when pages are added or removed."""
+    signature = [os.stat(pages_dir).st_mtime_ns]
+    for entry in os.scandir(pages_dir):
+        if entry.is_dir():
+            signature.append((entry.name, entry.stat().st_mtime_ns))
+    return tuple(sorted(signature, key=str))
+
+class PageRegistry:
+    """Maps page ids to their spec and dispatches rendering.
+
+    The discovered manifest is cached per process and only rebuilt when the
+    pages/ tree gains or loses files; page modules are imported lazily.
+    """
+
+    def __init__(self, pages_dir=PAGES_DIR, package="pages"):
+        self.pages_dir = pages_dir
+        self.package = package
+        self._lock = threading.Lock()
+        self._signature = None
+        self._discovered = {}
+        self._sections = []
+        self._builtin = {}      # page_id -> PageSpec registered in code
+        self._renderers = {}    # page_id -> callable, filled on first visit
+
+    def register(self, page_id, label, func, role=ROLE_USER, section=None, order=0):
+        """Register a page implemented in code (e.g. the admin panel in app.py)."""
+        with self._lock:
+            self._builtin[page_id] = PageSpec(page_id, section, label, role, None, None, order)
+            self._renderers[page_id] = func
+
+    def _refresh(self):
+        signature = _tree_signature(self.pages_dir)
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            pages, section_meta = discover(self.pages_dir, self.package)
+            by_section = {}
+            for spec in pages:
+                by_section.setdefault(spec.section, []).append(spec)
+            sections = []
+            for position, (section_id, specs) in enumerate(sorted(by_section.items())):
+                label, order = section_meta[section_id]
+                specs.sort(key=lambda spec: (spec.order, spec.label))
+                sections.append(Section(section_id, label, position if order is None else order, tuple(specs)))
+            sections.sort(key=lambda section: section.order)
+            self._discovered = {spec.page_id: spec for spec in pages}
+            self._sections = sections
+            # Modules of removed or changed pages are re-resolved on next visit
+            for page_id in list(self._renderers):
+                if page_id not in self._builtin:
+                    del self._renderers[page_id]
+            self._signature = signature
+
+    def get(self, page_id):
+        """Return the PageSpec for ``page_id`` or None."""
+        self._refresh()
+        return self._builtin.get(page_id) or self._discovered.get(page_id)
+
+    def sections(self, is_admin=False):
+        """Return the navigation sections with the pages visible to this role."""
+        self._refresh()
+        visible = []
+        for section in self._sections:
+            pages = tuple(spec for spec in section.pages if is_admin or spec.role != ROLE_ADMIN)
+            if pages:
+                visible.append(section._replace(pages=pages))
+        return visible
+
+    def is_allowed(self, spec, is_admin):
+        return spec.role != ROLE_ADMIN or is_admin
+
+    def _resolve(self, spec):
+        """Import the page module on first visit and cache its entry function."""
+        func = self._renderers.get(spec.page_id)
+        if func is None:
+            module = importlib.import_module(spec.module)
+            func = getattr(module, spec.entry)
+            self._renderers[spec.page_id] = func
+        return func
+
+    def preload(self):
+        """Import every discovered page module now (startup warm-up) instead of on first visit."""
+        self._refresh()
+        for spec in list(self._discovered.values()):
+            self._resolve(spec)
+
+    def render(self, page_id, is_admin=False):
+        """Render ``page_id``; returns False if it is unknown or not permitted."""
+        spec = self.get(page_id)
+        if spec is None or not self.is_allowed(spec, is_admin):
+            return False
+        self._resolve(spec)()
+        return True
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Return the process-wide page registry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PageRegistry()
+    return _registry
@@ -1,5 +1,7 @@
 import streamlit as st
 
+PAGE = {"id": "about_about", "label": "About", "order": 2, "entry": "about_page"}
+
 def about_page():
     st.title("About Page")
     st.write("This is the About page in the About section.")
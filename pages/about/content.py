@@ -1,5 +1,7 @@
 import streamlit as st
 
+PAGE = {"id": "about_content", "label": "Content", "order": 1, "entry": "content_page"}
+
 def content_page():
     st.title("Content Page")
     st.write("This is the Content page in the About section.")
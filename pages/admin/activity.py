@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+
+import streamlit as st
+
+import audit
+import page_registry
+import usage_rollups
+
+PAGE = {"id": "activity", "label": "Activity", "order": 3, "entry": "activity_page",
+        "role": "admin", "section_label": "Admin", "section_order": 100}
+
+# Range label -> (granularity, number of buckets); each chart reads that many buckets of rollups
+RANGES = {
+    "Last hour, per minute": (usage_rollups.MINUTE, 60),
+    "Last 2 days, per hour": (usage_rollups.HOUR, 48),
+    "Last 30 days, per day": (usage_rollups.DAY, 30),
+}
+
+def _total(values, metric):
+    return sum(sum(counts) for counts in values.get(metric, {}).values())
+
+def _page_label(page_id):
+    spec = page_registry.get_registry().get(page_id)
+    return spec.label if spec is not None else page_id
+
+def activity_page():
+    st.title("Activity")
+    st.caption("Logins, active users and page views from the usage rollups (UTC buckets). "
+               "Recent events can take a few seconds to appear.")
+
+    label = st.selectbox("Range", list(RANGES), key="activity_range")
+    granularity, buckets = RANGES[label]
+    starts, values = usage_rollups.series(granularity, buckets)
+    times = [datetime.fromtimestamp(start, timezone.utc) for start in starts]
+    zeros = [0] * buckets
+
+    # Distinct users are not additive: the widest bucket available is today's
+    _, today = usage_rollups.series(usage_rollups.DAY, 1)
+    active_today = today.get(usage_rollups.ACTIVE_USERS, {}).get("", [0])[0]
+
+    columns = st.columns(4)
+    columns[0].metric("Logins", f"{_total(values, usage_rollups.LOGINS):,}")
+    columns[1].metric("Failed logins", f"{_total(values, usage_rollups.LOGIN_FAILURES):,}")
+    columns[2].metric("Page views", f"{_total(values, usage_rollups.PAGE_VIEWS):,}")
+    columns[3].metric("Active users today", f"{active_today:,}")
+
+    st.subheader(f"Logins per {granularity.name}")
+    st.line_chart({
+        "Time": times,
+        "Logins": values.get(usage_rollups.LOGINS, {}).get("", zeros),
+        "Failed": values.get(usage_rollups.LOGIN_FAILURES, {}).get("", zeros),
+    }, x="Time", y=["Logins", "Failed"], height=260)
+
+    st.subheader(f"Active users per {granularity.name}")
+    st.line_chart({
+        "Time": times,
+        "Active users": values.get(usage_rollups.ACTIVE_USERS, {}).get("", zeros),
+    }, x="Time", y="Active users", height=260)
+
+    st.subheader("Page popularity")
+    views = sorted(((sum(counts), page_id) for page_id, counts in values.get(usage_rollups.PAGE_VIEWS, {}).items()),
+                   reverse=True)
+    if views:
+        st.bar_chart({
+            "Page": [_page_label(page_id) for _, page_id in views],
+            "Views": [count for count, _ in views],
+        }, x="Page", y="Views", height=260)
+    else:
+        st.info("No page views in this range.")
+
+    stats = audit.get_log().stats()
+    st.caption(f"{stats['queued']} audit events waiting to be rolled up · "
+               f"{stats['dropped']} dropped since this server process started.")
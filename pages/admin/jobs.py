@@ -0,0 +1,57 @@
+import time
+
+import streamlit as st
+
+import jobs
+import prediction_cache
+
+PAGE = {"id": "jobs", "label": "Jobs", "order": 2, "entry": "jobs_page",
+        "role": "admin", "section_label": "Admin", "section_order": 100}
+
+def _format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else ""
+
+def jobs_page():
+    st.title("Jobs")
+    queue = jobs.get_queue()
+    stats = queue.stats()
+    st.caption(f"Background scoring and user import jobs. {stats['workers']} worker process(es) per server process; "
+               f"utilization is the busy share of the workers over the last "
+               f"{jobs.UTILIZATION_WINDOW_SECONDS // 60} minutes.")
+
+    columns = st.columns(5)
+    columns[0].metric("Queued", f"{stats['queued']:,}")
+    columns[1].metric("Running", f"{stats['running']:,}")
+    columns[2].metric("Workers busy", f"{stats['busy_now']:.0%}")
+    columns[3].metric("Utilization", f"{stats['utilization']:.0%}")
+    columns[4].metric("Failed", f"{stats['failed']:,}")
+
+    cache = prediction_cache.get_cache()
+    if cache is not None:
+        totals = jobs.cache_totals()
+        usage = cache.stats()
+        st.caption(f"Prediction cache: {totals['hit_ratio']:.0%} hit ratio over finished jobs "
+                   f"({totals['hits']:,} of {totals['hits'] + totals['misses']:,} chunks), "
+                   f"{totals['cached_bytes'] / 1024 / 1024:,.1f} MB of input not re-scored; "
+                   f"{usage['entries']:,} entries, {usage['bytes'] / 1024 / 1024:,.1f} of "
+                   f"{usage['max_bytes'] / 1024 / 1024:,.0f} MB used.")
+
+    recent = jobs.list_jobs(limit=100)
+    if not recent:
+        st.info("No jobs yet.")
+        return
+    st.subheader("Recent Jobs")
+    st.dataframe([{
+        "Job": job.job_id[:8],
+        "User": job.username,
+        "Model": f"{job.model_id} {job.model_version}" if job.kind == jobs.SCORE else "(user import)",
+        "File": job.input_name,
+        "Status": job.status,
+        "Attempts": job.attempts,
+        "Rows": job.rows_done,
+        "Progress": f"{job.bytes_done / job.bytes_total:.0%}" if job.bytes_total else "",
+        "Submitted": _format_time(job.created_at),
+        "Started": _format_time(job.started_at),
+        "Finished": _format_time(job.finished_at),
+        "Error": job.error or "",
+    } for job in recent], hide_index=True, use_container_width=True)
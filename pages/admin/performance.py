@@ -0,0 +1,72 @@
+import time
+
+import streamlit as st
+
+import config
+import health
+import metrics_util
+
+PAGE = {"id": "performance", "label": "Performance", "order": 1, "entry": "performance_page",
+        "role": "admin", "section_label": "Admin", "section_order": 100}
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+def performance_page():
+    st.title("Performance")
+    metrics = metrics_util.get_metrics()
+    st.caption(f"Latency per stage in this server process over the last "
+               f"{(time.time() - metrics.started_at) / 60:.0f} minutes (milliseconds).")
+
+    rows = [{
+        "Stage": row["stage"],
+        "Count": row["count"],
+        "Errors": row["errors"],
+        "Error rate": f"{row['error_rate']:.1%}",
+        "Mean": _ms(row["mean"]),
+        "p50": _ms(row["p50"]),
+        "p95": _ms(row["p95"]),
+        "p99": _ms(row["p99"]),
+        "Max": _ms(row["max"]),
+    } for row in metrics.stages()]
+    if rows:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+    else:
+        st.info("No timings recorded yet.")
+
+    counters = {**metrics.counters(), **metrics.gauges()}
+    if counters:
+        st.subheader("Counters")
+        st.dataframe([{"Name": name, "Value": value} for name, value in sorted(counters.items())],
+                     hide_index=True, use_container_width=True)
+
+    warm_up = health.get_warm_up().progress()
+    reruns = health.get_gate().stats()
+    st.subheader("Warm-up and Load")
+    state = "ready" if warm_up["ready"] else f"{warm_up['progress']:.0%} done"
+    limit = f"limit {reruns['max_inflight']}" if reruns['max_inflight'] else "no limit"
+    st.caption(f"Startup warm-up {state} after {warm_up['seconds']:.2f}s · {reruns['inflight']} reruns in "
+               f"flight (peak {reruns['peak']}, {limit}), {reruns['shed']} answered with the busy page.")
+    st.dataframe([{
+        "Step": name,
+        "State": step["state"],
+        "Seconds": None if step["seconds"] is None else round(step["seconds"], 3),
+        "Error": step["error"] or "",
+    } for name, step in warm_up["steps"].items()], hide_index=True, use_container_width=True)
+
+    if st.button("Reset timings", key="performance_reset"):
+        metrics.reset()
+        st.rerun()
+
+    exporters = []
+    if config.METRICS_PORT:
+        exporters.append(f"http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+    if config.METRICS_FILE:
+        exporters.append(config.METRICS_FILE)
+    with st.expander("Prometheus export"):
+        if exporters:
+            st.write("Exported to: " + ", ".join(f"`{target}`" for target in exporters))
+        else:
+            st.write("Set `APP_METRICS_PORT` or `APP_METRICS_FILE` to export these metrics.")
+        st.download_button("Download metrics", metrics.render_prometheus(),
+                           file_name="metrics.prom", key="performance_download")
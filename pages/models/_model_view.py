@@ -0,0 +1,202 @@
+import os
+import time
+
+import streamlit as st
+
+import column_store
+import config
+import evaluation
+import health
+import jobs
+import model_registry
+import prediction_cache
+import scoring
+
+# Shared layout of the model pages; the page modules only pick the model id.
+
+# Jobs listed under the batch scoring form
+JOB_LIST_LIMIT = 10
+
+def _format_metric(value):
+    if isinstance(value, float):
+        return f"{value:g}"
+    return f"{value:,}" if isinstance(value, int) else str(value)
+
+def _format_bytes(size):
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024:
+            return f"{size:,.0f} {unit}" if unit == "bytes" else f"{size:,.1f} {unit}"
+        size /= 1024
+    return f"{size:,.1f} GB"
+
+def render_model_page(model_id):
+    registry = model_registry.get_registry()
+    spec = registry.spec(model_id)
+    if spec is None:
+        st.title(model_id.replace("_", " ").title())
+        st.error(f"No model '{model_id}' found in {registry.models_dir}.")
+        return
+
+    st.title(spec.name)
+    st.write(f"This is the {spec.name} page in the Models section.")
+
+    st.subheader(f"{spec.name} Specifications")
+    st.write(f"Type: {spec.description or spec.kind.title()}")
+    st.write(f"Version: {spec.version}")
+    if spec.features:
+        st.write(f"Features: {', '.join(spec.features)}")
+    if spec.classes:
+        st.write(f"Classes: {', '.join(spec.classes)}")
+
+    if spec.eval_data:
+        render_evaluation(spec)
+    elif spec.metrics:
+        st.subheader("Performance Metrics")
+        columns = st.columns(len(spec.metrics))
+        for column, (name, value) in zip(columns, spec.metrics.items()):
+            column.metric(name, _format_metric(value))
+
+    # Loaded once per server process and shared by every session
+    was_loaded = registry.is_loaded(model_id)
+    try:
+        with st.spinner(f"Loading {spec.name}..."):
+            model = registry.get(model_id)
+    except model_registry.ModelError as e:
+        st.error(str(e))
+        return
+    st.caption(f"{'Served from memory' if was_loaded else 'Loaded'}: {spec.format} artifact, "
+               f"{_format_bytes(model.nbytes)} in memory.")
+
+    batch_scoring_fragment(model_id)
+    render_jobs(model_id)
+
+    st.subheader(f"{spec.name} Usage")
+    st.code(f"""
+    import model_registry
+
+    # Shared, lazily loaded model
+    model = model_registry.get_registry().get("{model_id}")
+
+    # Make predictions (one row per sample, columns in feature order)
+    predictions = model.predict(data)
+    """, language="python")
+
+def render_evaluation(spec):
+    """Metrics computed from the model's held-out evaluation data."""
+    st.subheader("Performance Metrics")
+    try:
+        with st.spinner("Evaluating..."):
+            result = evaluation.get_evaluation(spec.model_id)
+    except (OSError, ValueError, column_store.StoreError, model_registry.ModelError) as e:
+        st.error(f"Could not evaluate {spec.name}: {str(e)}")
+        return
+    if not result.rows:
+        st.info("The evaluation dataset has no rows yet.")
+        return
+    columns = st.columns(len(result.metrics) + 1)
+    for column, (name, value) in zip(columns, result.metrics.items()):
+        column.metric(name, f"{value:.4g}")
+    columns[-1].metric("Evaluation rows", f"{result.rows:,}")
+    updated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(result.updated_at)) if result.updated_at else ""
+    st.caption(f"Computed from {os.path.basename(result.data_path)} for version {spec.version}"
+               f"{f', updated {updated}' if updated else ''}"
+               f"{f' ({result.new_rows:,} new rows folded in)' if result.new_rows and result.new_rows < result.rows else ''}.")
+    if result.confusion is not None:
+        st.write("Confusion matrix (rows: actual, columns: predicted)")
+        st.dataframe([{"Actual": actual, **dict(zip(spec.classes, counts))}
+                      for actual, counts in zip(spec.classes, result.confusion.tolist())], hide_index=True)
+
+    data = evaluation.sample(spec.model_id)
+    if spec.kind == model_registry.KIND_REGRESSOR:
+        st.write("Predicted vs. actual (sample of the evaluation data)")
+        st.scatter_chart(data, x=spec.eval_target, y="predicted", height=300)
+    elif len(spec.features) >= 2:
+        st.write("Evaluation data by class (sample)")
+        st.scatter_chart(data, x=spec.features[-2], y=spec.features[-1], color=spec.eval_target, height=300)
+
+@health.gated_fragment
+def batch_scoring_fragment(model_id):
+    """Upload a CSV and queue it as a background scoring job."""
+    spec = model_registry.get_registry().spec(model_id)
+    st.subheader("Batch Scoring")
+    st.caption(f"Upload a CSV with the columns {', '.join(spec.features)}. Other columns are kept; "
+               f"{', '.join(scoring.output_columns(spec))} are appended. Scoring runs in the background, "
+               f"so you can leave this page and come back for the result. "
+               f"For files larger than the upload limit use `python scoring.py {model_id} INPUT OUTPUT`.")
+    uploaded = st.file_uploader("Input CSV", type=["csv"], key=f"{model_id}_score_file")
+    compress = st.checkbox("Compress the result (gzip)", value=True, key=f"{model_id}_score_gzip")
+
+    if uploaded is not None and st.button("Score", key=f"{model_id}_score_btn"):
+        try:
+            uploaded.seek(0)
+            job_id = jobs.get_queue().submit(st.session_state.username, model_id, uploaded,
+                                             uploaded.name, compress)
+        except (OSError, model_registry.ModelError) as e:
+            st.error(f"Could not queue the file: {str(e)}")
+        else:
+            st.session_state[f"{model_id}_job_notice"] = f"Queued job {job_id[:8]} for {uploaded.name}."
+            # Full rerun so the job list below starts polling
+            st.rerun()
+
+def _cache_caption(model_id):
+    cache = prediction_cache.get_cache()
+    if cache is None:
+        return
+    totals = jobs.cache_totals(st.session_state.username, model_id)
+    usage = cache.stats()
+    st.caption(f"Prediction cache: {totals['hit_ratio']:.0%} of your chunks for this model were served "
+               f"from the cache, saving the scoring of {_format_bytes(totals['cached_bytes'])} of input. "
+               f"The cache holds {usage['entries']:,} chunk(s) in {_format_bytes(usage['bytes'])} "
+               f"(limit {_format_bytes(usage['max_bytes'])}).")
+
+def render_jobs(model_id):
+    """The user's recent jobs for ``model_id``; polls while any of them is unfinished."""
+    notice = st.session_state.pop(f"{model_id}_job_notice", None)
+    if notice:
+        st.success(notice)
+    active = any(job.status in jobs.ACTIVE_STATUSES
+                 for job in jobs.list_jobs(st.session_state.username, model_id, limit=JOB_LIST_LIMIT))
+    poll = config.JOB_POLL_SECONDS if active else None
+    health.gated_fragment(_jobs_fragment, run_every=poll)(model_id, polling=active)
+
+def _jobs_fragment(model_id, polling):
+    recent = jobs.list_jobs(st.session_state.username, model_id, limit=JOB_LIST_LIMIT)
+    if not recent:
+        return
+    if polling and not any(job.status in jobs.ACTIVE_STATUSES for job in recent):
+        # Everything finished: a full rerun stops the polling timer
+        st.rerun()
+
+    st.subheader("Scoring Jobs")
+    for job in recent:
+        if job.status == jobs.RUNNING:
+            fraction = min(job.bytes_done / job.bytes_total, 1.0) if job.bytes_total else 0.0
+            st.progress(fraction, text=f"{job.input_name}: {job.rows_done:,} rows scored")
+    st.dataframe(
+        [{
+            "Job": job.job_id[:8],
+            "File": job.input_name,
+            "Status": job.status,
+            "Rows": job.rows_done,
+            "Size": _format_bytes(job.bytes_total),
+            "Submitted": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job.created_at)),
+            "Duration": f"{job.finished_at - job.started_at}s" if job.finished_at and job.started_at else "",
+            "Cached": (f"{job.cache_hits}/{job.cache_hits + job.cache_misses} chunks"
+                       if job.status == jobs.SUCCEEDED else ""),
+            "Error": job.error or "",
+        } for job in recent],
+        hide_index=True,
+    )
+    _cache_caption(model_id)
+
+    finished = [job for job in recent if job.status == jobs.SUCCEEDED and os.path.exists(job.output_path)]
+    if finished:
+        labels = {f"{job.input_name} ({job.job_id[:8]})": job for job in finished}
+        choice = st.selectbox("Result", list(labels), key=f"{model_id}_job_result")
+        job = labels[choice]
+        name = os.path.splitext(job.input_name)[0]
+        suffix = ".csv.gz" if job.output_path.endswith(".gz") else ".csv"
+        with open(job.output_path, "rb") as f:
+            st.download_button("Download Scores", f, file_name=f"{name}_{model_id}_scores{suffix}",
+                               mime="application/gzip" if suffix.endswith(".gz") else "text/csv",
+                               key=f"{model_id}_score_download")
@@ -1,22 +1,6 @@
-import streamlit as st
+from pages.models._model_view import render_model_page
+
+PAGE = {"id": "model_a", "label": "Model A", "order": 1, "entry": "model_a_page"}
 
 def model_a_page():
-    st.title("Model A")
-    st.write("This is the Model A page in the Models section.")
-    
-    st.subheader("Model A Specifications")
-    st.write("Type: Classification Model")
-    st.write("Accuracy: 95%")
-    st.write("Training Data: 10,000 samples")
-    
-    st.subheader("Model A Usage")
-    st.code("""
-    # Example code for using Model A
-    import model_a
-    
-    # Load the model
-    model = model_a.load()
-    
-    # Make predictions
-    predictions = model.predict(data)
-    """, language="python") 
\ No newline at end of file
+    render_model_page("model_a")
@@ -1,33 +1,6 @@
-import streamlit as st
-
-def model_b_page():
-    
-    st.title("Model B")
+from pages.models._model_view import render_model_page
 
+PAGE = {"id": "model_b", "label": "Model B", "order": 2, "entry": "model_b_page"}
 
-    st.write("This is the Model B page in the Models section.")
-    
-    st.subheader("Model B Specifications")
-    st.write("Type: Regression Model")
-    st.write("RMSE: 0.05")
-    st.write("Training Data: 15,000 samples")
-    
-    st.subheader("Model B Usage")
-    st.code("""
-    # Example code for using Model B
-    import model_b
-    
-    # Load the model
-    model = model_b.load()
-    
-    # Make predictions
-    predictions = model.predict(data)
-    """, language="python")
-    
-    st.subheader("Performance Metrics")
-    metrics = {
-        "MSE": 0.0025,
-        "MAE": 0.042,
-        "R²": 0.96
-    }
-    st.json(metrics) 
\ No newline at end of file
+def model_b_page():
+    render_model_page("model_b")
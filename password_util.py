@@ -0,0 +1,112 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+# Stored hashes look like ``pbkdf2_sha256$<iterations>$<salt>$<hash>`` (salt and
+# hash base64-encoded). Hashes created before the KDF was introduced are bare
+# 64-character SHA-256 hex digests; they still verify and are flagged for
+# rehashing so verify_user can upgrade them on the next successful login.
+ALGORITHM = "pbkdf2_sha256"
+SALT_BYTES = 16
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing pool is saturated for longer than the queue timeout."""
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+def hash_password(password, iterations=None):
+    """Hash the password with salted PBKDF2-SHA256."""
+    if iterations is None:
+        iterations = config.KDF_ITERATIONS
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"{ALGORITHM}${iterations}${_b64(salt)}${_b64(digest)}"
+
+def is_legacy_hash(stored):
+    return len(stored) == 64 and "$" not in stored
+
+def needs_rehash(stored):
+    """True if ``stored`` uses the legacy format or a lower cost than configured."""
+    if is_legacy_hash(stored):
+        return True
+    try:
+        return int(stored.split("$")[1]) < config.KDF_ITERATIONS
+    except (IndexError, ValueError):
+        return True
+
+def verify_password(password, stored):
+    """Check ``password`` against a stored hash in either format."""
+    if is_legacy_hash(stored):
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(candidate, stored)
+    try:
+        algorithm, iterations, salt, digest = stored.split("$")
+        if algorithm != ALGORITHM:
+            return False
+        candidate = hashlib.pbkdf2_hmac("sha256", password.encode(), base64.b64decode(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(candidate, base64.b64decode(digest))
+
+class PasswordPool:
+    """Bounded worker pool for password hashing and verification.
+
+    At most ``workers`` KDF computations run at once (PBKDF2 releases the GIL,
+    so threads use separate cores) and at most ``max_pending`` calls may be
+    running or queued. A caller that cannot get a slot within ``queue_timeout``
+    seconds gets PasswordPoolBusy instead of piling onto the queue, so a login
+    burst cannot stall every session.
+    """
+
+    def __init__(self, workers=None, max_pending=None, queue_timeout=None):
+        self.workers = workers or config.KDF_WORKERS
+        self.max_pending = max_pending or config.KDF_MAX_PENDING
+        if queue_timeout is None:
+            queue_timeout = config.KDF_QUEUE_TIMEOUT_MS / 1000
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-kdf")
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def run(self, func, *args, wait=False):
+        """Run ``func(*args)`` on the pool and wait for its result.
+
+        With ``wait`` the caller waits for a slot however long it takes
+        instead of getting PasswordPoolBusy (background work such as imports).
+        """
+        if not self._slots.acquire(timeout=None if wait else self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordPoolBusy("Password hashing is saturated, try again shortly")
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password, wait=False, iterations=None):
+        return self.run(hash_password, password, iterations, wait=wait)
+
+    def verify(self, password, stored):
+        return self.run(verify_password, password, stored)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide password pool."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordPool()
+    return _pool
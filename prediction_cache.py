@@ -0,0 +1,235 @@
+import hashlib
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import config
+import log_util
+
+logger = log_util.get_logger(__name__)
+
+# Content-addressed cache of chunk predictions on local disk.
+#
+# scoring.score_file asks the cache before scoring each chunk. The key is a
+# BLAKE2b digest of the model id and version, the positions of the feature
+# columns and the chunk's raw bytes. Chunk boundaries are content-defined (see
+# scoring.py), so re-scoring a file, or a file that shares runs of rows with
+# an earlier upload anywhere in it (rows added or removed in front, files
+# concatenated), reads the predictions back instead of parsing, predicting
+# and formatting again. Model updates change
+# the version and therefore every key; nothing has to be invalidated.
+#
+# What is cached is the chunk's formatted prediction columns (the text that
+# scoring appends to each row): formatting costs more than the prediction
+# itself, and the cached text is exactly what a fresh run would produce. Each
+# entry is one file, PREDICTION_CACHE_DIR/<key[:2]>/<key>.bin:
+#
+#   magic "PCC1" | row count (u32) | codec (u8: 0 raw, 1 zlib) | UTF-8 text
+#
+# Entries are written to a temporary file and renamed into place, so readers
+# (other scoring processes) never see partial files. The cache is bounded by
+# PREDICTION_CACHE_MB: when the running estimate exceeds it, the directory is
+# rescanned and the least recently used entries (file mtime, touched on every
+# hit) are deleted. The rescan keeps eviction correct while several job
+# workers share the directory. stats() reports the in-memory estimate and
+# never scans; the server refreshes it when a job finishes.
+
+MAGIC = b"PCC1"
+SUFFIX = ".bin"
+_HEADER = struct.Struct("<4sIB")
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+
+def _encode(rows, text):
+    data = text.encode("utf-8")
+    packed = zlib.compress(data, 1)
+    if len(packed) < len(data):
+        return _HEADER.pack(MAGIC, rows, CODEC_ZLIB) + packed
+    return _HEADER.pack(MAGIC, rows, CODEC_RAW) + data
+
+def _decode(data):
+    """Return (rows, text) of an entry."""
+    if len(data) < _HEADER.size:
+        raise ValueError("truncated prediction cache entry")
+    magic, rows, codec = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a prediction cache entry")
+    payload = memoryview(data)[_HEADER.size:]
+    if codec == CODEC_ZLIB:
+        payload = zlib.decompress(payload)
+    elif codec != CODEC_RAW:
+        raise ValueError(f"unknown codec {codec}")
+    return rows, bytes(payload).decode("utf-8")
+
+class PredictionCache:
+    """Size-bounded, disk-backed LRU cache of formatted chunk predictions."""
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or config.PREDICTION_CACHE_DIR
+        if max_bytes is None:
+            max_bytes = config.PREDICTION_CACHE_MB * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> size, least recently used first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._rescan()
+
+    @staticmethod
+    def key(spec, usecols, data):
+        """Cache key for the predictions of ``spec`` on the chunk ``data`` (bytes)."""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{spec.model_id}\0{spec.version}\0{','.join(map(str, usecols))}\0".encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + SUFFIX)
+
+    def _scan(self):
+        """Return [(mtime, key, size)] for every entry on disk."""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for subdir in os.scandir(self.cache_dir):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, entry.name[:-len(SUFFIX)], stat.st_size))
+        return entries
+
+    def _rescan(self):
+        entries = sorted(self._scan())
+        with self._lock:
+            self._entries = OrderedDict((key, size) for _, key, size in entries)
+            self._bytes = sum(size for _, _, size in entries)
+
+    def get(self, key, rows):
+        """Return the cached prediction text for ``key`` if it covers ``rows`` rows, else None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                cached_rows, text = _decode(f.read())
+            if cached_rows != rows:
+                raise ValueError(f"entry has {cached_rows} rows, expected {rows}")
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._bytes -= size
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Discarding unreadable prediction cache entry %s: %s", key, e)
+            self._discard(key)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return text
+
+    def put(self, key, rows, text):
+        """Store the prediction text of ``rows`` rows under ``key``; evicts old entries if over the bound."""
+        data = _encode(rows, text)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(partial, "wb") as f:
+                f.write(data)
+            os.replace(partial, path)
+        except OSError as e:
+            logger.warning("Could not write prediction cache entry %s: %s", key, e)
+            if os.path.exists(partial):
+                os.remove(partial)
+            return
+        with self._lock:
+            self._bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            over = self._bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def _discard(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._bytes -= size
+
+    def _evict(self):
+        # Other processes write to the same directory: evict from what is on disk
+        self._rescan()
+        with self._lock:
+            victims = []
+            total = self._bytes
+            for key, size in self._entries.items():
+                if total <= self.max_bytes:
+                    break
+                victims.append(key)
+                total -= size
+        for key in victims:
+            self._discard(key)
+        with self._lock:
+            self.evictions += len(victims)
+        if victims:
+            logger.info("Evicted %d prediction cache entries", len(victims))
+
+    def clear(self):
+        for _, key, _ in self._scan():
+            self._discard(key)
+
+    def refresh(self):
+        """Re-read the entries from disk, picking up what other processes wrote or evicted."""
+        self._rescan()
+
+    def stats(self):
+        """Entries and bytes as last seen by this process, plus its hit counts.
+
+        Kept in memory (updated on every write, discard and eviction), so this
+        does not touch the disk; job completion calls refresh() to fold in the
+        entries the job workers wrote.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the process-wide prediction cache, or None when PREDICTION_CACHE_MB is 0."""
+    global _cache
+    if config.PREDICTION_CACHE_MB <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PredictionCache()
+    return _cache
@@ -0,0 +1,164 @@
+import argparse
+import csv
+import gzip
+import io
+import operator
+import sys
+import time
+import zlib
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+
+import config
+import model_registry
+import prediction_cache
+
+# Batch scoring of CSV files against a registry model.
+#
+# The input is read as a stream, in chunks of about ``chunk_size`` lines. The
+# model's feature columns of each chunk are parsed into one float64 NumPy
+# array (np.loadtxt's C parser) and scored with a single vectorized predict
+# call. Each output row is the input line with the prediction columns
+# appended, and it is written to the output file before the next chunk is
+# read. Peak memory is therefore bounded by the chunk size, whatever the file
+# size.
+#
+# Chunk boundaries are content-defined: a chunk ends after a line whose CRC-32
+# hits a fixed residue, once it holds at least a quarter of ``chunk_size``
+# lines, and at twice ``chunk_size`` lines at the latest. The same run of rows
+# therefore splits into the same chunks wherever it sits in a file, and the
+# prediction cache keyed on chunk content hits for rows shifted by an
+# inserted or removed row, not only for identical leading chunks.
+#
+# Records must be one per line (no newlines inside quoted fields).
+
+# cached_bytes: input bytes whose predictions came from the prediction cache
+ScoreResult = namedtuple("ScoreResult", "rows chunks seconds cache_hits cache_misses cached_bytes")
+
+def output_columns(spec):
+    """Column names appended to every input row."""
+    if spec.kind == model_registry.KIND_CLASSIFIER and spec.classes:
+        return ["prediction"] + [f"p_{name}" for name in spec.classes]
+    return ["prediction"]
+
+def _feature_indices(header, features):
+    columns = [name.strip() for name in next(csv.reader([header]))]
+    missing = [name for name in features if name not in columns]
+    if missing:
+        raise ValueError(f"CSV header is missing feature column(s): {', '.join(missing)}")
+    return columns, [columns.index(name) for name in features]
+
+def iter_chunks(lines, chunk_size):
+    """Group an iterable of lines into lists at content-defined boundaries (see the module comment)."""
+    min_lines = max(1, chunk_size // 4)
+    max_lines = max(min_lines, 2 * chunk_size)
+    # Past min_lines, one line in ``divisor`` ends a chunk: chunks average about chunk_size lines
+    divisor = max(1, chunk_size - min_lines)
+    lines = iter(lines)
+    pending = []
+    while True:
+        chunk = pending + list(islice(lines, max_lines - len(pending)))
+        if not chunk:
+            return
+        # Hash the candidate end lines in one pass of C-level maps
+        candidates = chunk[min_lines - 1:]
+        hashes = np.fromiter(map(zlib.crc32, map(str.encode, candidates)), dtype=np.uint32, count=len(candidates))
+        ends = np.flatnonzero(hashes % divisor == 0)
+        end = min_lines + int(ends[0]) if len(ends) else len(chunk)
+        yield chunk[:end]
+        pending = chunk[end:]
+
+def _predict_chunk(model, lines, usecols, first_line):
+    """Formatted prediction columns of a chunk: one newline-terminated ``,columns`` line per input line."""
+    try:
+        X = np.loadtxt(lines, delimiter=",", usecols=usecols, dtype=np.float64, ndmin=2, quotechar='"')
+    except ValueError as e:
+        raise ValueError(f"Invalid number in lines {first_line}-{first_line + len(lines) - 1}: {e}") from None
+    predictions = model.predict(X)
+    # One %-format per row: far cheaper than formatting column by column
+    if model.spec.kind == model_registry.KIND_CLASSIFIER and model.spec.classes:
+        probabilities = model.predict_proba(X)
+        fmt = ",%s," + ",".join(["%.6g"] * probabilities.shape[1]) + "\n"
+        return "".join(fmt % (label, *p) for label, p in
+                       zip(model.labels(predictions).tolist(), probabilities.tolist()))
+    return "".join(",%.10g\n" % value for value in predictions.tolist())
+
+def _score_chunk(model, lines, usecols, first_line, cache, result):
+    """Scored CSV text of a chunk, using and filling ``cache`` when given."""
+    if cache is None:
+        predicted = _predict_chunk(model, lines, usecols, first_line)
+    else:
+        data = "".join(lines).encode("utf-8")
+        key = cache.key(model.spec, usecols, data)
+        predicted = cache.get(key, len(lines))
+        if predicted is None:
+            predicted = _predict_chunk(model, lines, usecols, first_line)
+            cache.put(key, len(lines), predicted)
+            result["cache_misses"] += 1
+        else:
+            result["cache_hits"] += 1
+            result["cached_bytes"] += len(data)
+    rows = [line.rstrip("\r\n") for line in lines]
+    return "\n".join(map(operator.add, rows, predicted.split("\n")[:-1])) + "\n"
+
+def score_file(model, binary_file, output, chunk_size=None, progress=None, cache=None):
+    """Score a CSV stream with ``model`` and write the scored CSV to the text stream ``output``.
+
+    ``progress`` is called as ``progress(rows_scored)`` after each chunk. With a
+    prediction_cache.PredictionCache as ``cache``, chunks scored before are not scored again.
+    """
+    chunk_size = chunk_size or config.SCORING_CHUNK_ROWS
+    start = time.perf_counter()
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        header = text.readline()
+        if not header.strip():
+            raise ValueError("The CSV file is empty")
+        _, usecols = _feature_indices(header, model.spec.features)
+        output.write(header.rstrip("\r\n") + "," + ",".join(output_columns(model.spec)) + "\n")
+
+        rows = chunks = 0
+        cache_result = {"cache_hits": 0, "cache_misses": 0, "cached_bytes": 0}
+        line_number = 2
+        for raw in iter_chunks(text, chunk_size):
+            lines = [line for line in raw if line.strip()]
+            if lines:
+                output.write(_score_chunk(model, lines, usecols, line_number, cache, cache_result))
+                rows += len(lines)
+                chunks += 1
+            line_number += len(raw)
+            if progress is not None:
+                progress(rows)
+    finally:
+        # Leave the caller's file open
+        text.detach()
+    return ScoreResult(rows, chunks, time.perf_counter() - start, **cache_result)
+
+def open_output(path, compress=False):
+    """Open ``path`` for writing scored CSV text, gzip-compressed if asked."""
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=5)
+    return open(path, "w", encoding="utf-8", newline="")
+
+def main(argv=None):
+    """Command line entry point for files too large to upload: python scoring.py MODEL INPUT OUTPUT"""
+    parser = argparse.ArgumentParser(description="Score a CSV file with a registry model")
+    parser.add_argument("model_id")
+    parser.add_argument("input")
+    parser.add_argument("output", help="output CSV; a .gz suffix compresses it")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--no-cache", action="store_true", help="do not use the prediction cache")
+    args = parser.parse_args(argv)
+
+    model = model_registry.get_registry().get(args.model_id, count_use=False)
+    with open(args.input, "rb") as src, open_output(args.output, args.output.endswith(".gz")) as dst:
+        result = score_file(model, src, dst, chunk_size=args.chunk_size,
+                            cache=None if args.no_cache else prediction_cache.get_cache())
+    print(f"Scored {result.rows:,} rows in {result.chunks} chunks in {result.seconds:.1f}s "
+          f"({result.cache_hits} chunks from the prediction cache)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+"""Start the Streamlit server with the startup warm-up and health endpoint running from the start.
+
+Same as ``streamlit run app.py``, except that the warm-up (health.py) begins
+before the first session connects and /readyz answers while it runs.
+
+Usage: python serve.py [streamlit run options, e.g. --server.port 8501]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import health
+
+def main():
+    health.start()
+    from streamlit.web import cli
+
+    sys.argv = ["streamlit", "run", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"),
+                *sys.argv[1:]]
+    return cli.main()
+
+if __name__ == "__main__":
+    sys.exit(main())
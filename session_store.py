@@ -0,0 +1,186 @@
+import atexit
+import threading
+import time
+
+import config
+import db_util
+import log_util
+
+logger = log_util.get_logger(__name__)
+
+class SessionStore:
+    """Multi-session store backed by the ``sessions`` table.
+
+    Logins and logouts are written through immediately. Navigation updates are
+    coalesced: an update that matches the last known state is dropped, and the
+    rest are buffered per session and written in one batch every
+    ``flush_interval`` seconds by a background thread, which also sweeps expired
+    rows. All state lives in SQLite, so several server processes can share it.
+    """
+
+    def __init__(self, flush_interval=None, sweep_interval=None):
+        if flush_interval is None:
+            flush_interval = config.SESSION_FLUSH_INTERVAL_MS / 1000
+        if sweep_interval is None:
+            sweep_interval = config.SESSION_SWEEP_INTERVAL_SECONDS
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._pending = {}   # session_id -> (current_page, current_section, updated_at)
+        self._known = {}     # session_id -> (current_page, current_section) last seen
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self._last_sweep = 0.0
+
+    def _ensure_worker(self):
+        """Start the background flush/sweep thread on first use."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="session-store-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if time.time() - self._last_sweep >= self.sweep_interval:
+                    self.sweep()
+            except Exception:
+                logger.exception("Error in session store writer")
+
+    def create(self, session_id, token, username, current_page='default', current_section=None, replaces=None):
+        """Store a freshly issued token for ``session_id`` (written immediately).
+
+        ``replaces`` names the session id this one supersedes; its row is
+        deleted in the same transaction.
+        """
+        now = int(time.time())
+        with self._lock:
+            self._pending.pop(session_id, None)
+            self._known[session_id] = (current_page, current_section)
+            if replaces is not None:
+                self._pending.pop(replaces, None)
+                self._known.pop(replaces, None)
+        with db_util.transaction() as conn:
+            if replaces is not None:
+                conn.execute('DELETE FROM sessions WHERE session_id = ?', (replaces,))
+            conn.execute(
+                'INSERT INTO sessions (session_id, token, username, current_page, current_section, expires_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(session_id) DO UPDATE SET token = excluded.token, username = excluded.username, '
+                'current_page = excluded.current_page, current_section = excluded.current_section, '
+                'expires_at = excluded.expires_at, updated_at = excluded.updated_at',
+                (session_id, token, username, current_page, current_section,
+                 now + config.SESSION_TTL_SECONDS, now))
+        self._ensure_worker()
+
+    def update_navigation(self, session_id, current_page, current_section):
+        """Queue a navigation change; no-op if the state did not change."""
+        state = (current_page, current_section)
+        with self._lock:
+            if self._known.get(session_id) == state:
+                return False
+            self._known[session_id] = state
+            self._pending[session_id] = (current_page, current_section, int(time.time()))
+        self._ensure_worker()
+        return True
+
+    def get(self, session_id):
+        """Return ``(token, current_page, current_section)`` or None if unknown/expired."""
+        row = db_util.fetch_one(
+            'SELECT token, current_page, current_section FROM sessions '
+            'WHERE session_id = ? AND expires_at > ?',
+            (session_id, int(time.time())))
+        if row is None:
+            return None
+        token, current_page, current_section = row
+        with self._lock:
+            # Our own unflushed navigation is newer than what is on disk
+            pending = self._pending.get(session_id)
+            if pending is not None:
+                current_page, current_section = pending[0], pending[1]
+            self._known[session_id] = (current_page, current_section)
+        return token, current_page, current_section
+
+    def delete(self, session_id):
+        """Remove a session immediately (logout)."""
+        with self._lock:
+            self._pending.pop(session_id, None)
+            self._known.pop(session_id, None)
+        db_util.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+
+    def delete_user(self, username):
+        """Remove every session of ``username`` (password reset)."""
+        with db_util.transaction() as conn:
+            session_ids = [row[0] for row in conn.execute(
+                'SELECT session_id FROM sessions WHERE username = ?', (username,))]
+            conn.execute('DELETE FROM sessions WHERE username = ?', (username,))
+        with self._lock:
+            for session_id in session_ids:
+                self._pending.pop(session_id, None)
+                self._known.pop(session_id, None)
+        return len(session_ids)
+
+    def flush(self):
+        """Write all buffered navigation updates in a single transaction."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch = self._pending
+            self._pending = {}
+        rows = [(page, section, updated_at, session_id)
+                for session_id, (page, section, updated_at) in batch.items()]
+        try:
+            with db_util.transaction() as conn:
+                conn.executemany(
+                    'UPDATE sessions SET current_page = ?, current_section = ?, updated_at = ? '
+                    'WHERE session_id = ?', rows)
+        except Exception:
+            # Put the batch back unless a newer update arrived in the meantime
+            with self._lock:
+                for session_id, state in batch.items():
+                    self._pending.setdefault(session_id, state)
+            raise
+        return len(rows)
+
+    def sweep(self):
+        """Delete expired sessions and forget their cached state."""
+        self._last_sweep = time.time()
+        now = int(self._last_sweep)
+        with db_util.transaction() as conn:
+            expired = [row[0] for row in conn.execute(
+                'SELECT session_id FROM sessions WHERE expires_at <= ?', (now,))]
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+        if expired:
+            with self._lock:
+                for session_id in expired:
+                    self._pending.pop(session_id, None)
+                    self._known.pop(session_id, None)
+        return len(expired)
+
+    def close(self):
+        """Stop the background thread and flush what is still buffered."""
+        self._stopped = True
+        self._wakeup.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Error flushing sessions on shutdown")
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Return the process-wide session store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore()
+    return _store
@@ -0,0 +1,240 @@
+import binascii
+import hashlib
+import hmac
+import os
+import secrets
+import struct
+import threading
+import time
+from collections import namedtuple
+
+import config
+import db_util
+
+# Token layout (big-endian), followed by a truncated HMAC-SHA256 over all of it:
+#
+#   version     u8    TOKEN_VERSION
+#   flags       u8    bit 0 = is_admin
+#   issued_at   u64   unix milliseconds
+#   expires_at  u32   unix seconds
+#   token_id    8s    random, used for revocation
+#   name_len    u8    length of the UTF-8 username that follows
+#   username    name_len bytes
+#
+# The result is base64-encoded (tokens live in the database, not in URLs). Navigation state is not part
+# of the token; it lives in the sessions table.
+#
+# issued_at has millisecond resolution so that a password reset revokes the
+# tokens issued before it but not the one issued right after it in the same
+# second. Version 1 tokens (issued_at as u32 seconds) are still accepted, with
+# issued_at read as the start of that second.
+TOKEN_VERSION = 2
+_HEADER = struct.Struct(">BBQI8sB")
+_HEADER_V1 = struct.Struct(">BBII8sB")
+_MAC_SIZE = 16
+_FLAG_ADMIN = 0x01
+
+# issued_at in unix milliseconds, expires_at in unix seconds
+TokenInfo = namedtuple("TokenInfo", "username is_admin token_id issued_at expires_at")
+
+def _now_ms():
+    return time.time_ns() // 1_000_000
+
+_secret = None
+_secret_lock = threading.Lock()
+
+def get_secret():
+    """Return the signing secret from config, creating a local secret file if needed."""
+    global _secret
+    if _secret is not None:
+        return _secret
+    with _secret_lock:
+        if _secret is not None:
+            return _secret
+        if config.SESSION_SECRET:
+            _secret = config.SESSION_SECRET.encode()
+            return _secret
+        path = config.SESSION_SECRET_FILE
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+        with open(path) as f:
+            _secret = f.read().strip().encode()
+        return _secret
+
+_mac_template = None
+
+def _sign(payload):
+    # Copying a keyed HMAC skips re-deriving the inner/outer pads per token
+    global _mac_template
+    if _mac_template is None:
+        _mac_template = hmac.new(get_secret(), digestmod=hashlib.sha256)
+    mac = _mac_template.copy()
+    mac.update(payload)
+    return mac.digest()[:_MAC_SIZE]
+
+def _b64encode(data):
+    return binascii.b2a_base64(data, newline=False).decode("ascii")
+
+def _b64decode(text):
+    return binascii.a2b_base64(text)
+
+def encode_token(username, is_admin, ttl=None, now=None):
+    """Build a signed token for ``username`` (``now`` in unix milliseconds)."""
+    if ttl is None:
+        ttl = config.SESSION_TTL_SECONDS
+    if now is None:
+        now = _now_ms()
+    name = username.encode("utf-8")
+    if len(name) > 255:
+        raise ValueError("Username is too long for a session token")
+    flags = _FLAG_ADMIN if is_admin else 0
+    payload = _HEADER.pack(TOKEN_VERSION, flags, now, now // 1000 + ttl, os.urandom(8), len(name)) + name
+    return _b64encode(payload + _sign(payload))
+
+def decode_token(token, now=None):
+    """Verify signature and expiry and return a TokenInfo, or None if invalid.
+
+    Revocation is not checked here; see ``validate_session_token``.
+    """
+    try:
+        raw = _b64decode(token)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if len(raw) < _HEADER_V1.size + _MAC_SIZE:
+        return None
+    payload, mac = raw[:-_MAC_SIZE], raw[-_MAC_SIZE:]
+    if not hmac.compare_digest(mac, _sign(payload)):
+        return None
+    header = _HEADER if payload[0] == TOKEN_VERSION else _HEADER_V1 if payload[0] == 1 else None
+    if header is None or len(payload) < header.size:
+        return None
+    version, flags, issued_at, expires_at, token_id, name_len = header.unpack_from(payload)
+    if len(payload) != header.size + name_len:
+        return None
+    if header is _HEADER_V1:
+        issued_at *= 1000
+    if now is None:
+        now = time.time()
+    if now >= expires_at:
+        return None
+    username = payload[header.size:].decode("utf-8")
+    return TokenInfo(username, bool(flags & _FLAG_ADMIN), token_id, issued_at, expires_at)
+
+class RevocationIndex:
+    """In-memory view of the ``token_revocations`` table.
+
+    Holds the ids of individually revoked tokens and, per user, the time (unix
+    milliseconds) before which every token is revoked (password resets). Lookups are a set membership
+    test and a dict lookup. The index is loaded in full once, then refreshed
+    incrementally (rows with a higher id) at most every ``refresh_interval``
+    seconds so revocations made by other server processes are picked up.
+    """
+
+    def __init__(self, refresh_interval=None):
+        if refresh_interval is None:
+            refresh_interval = config.REVOCATION_REFRESH_SECONDS
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._token_ids = set()
+        self._users = {}  # username -> tokens issued before this time (ms) are revoked
+        self._last_id = 0
+        self._last_refresh = 0.0
+
+    def _apply(self, rows):
+        for row_id, token_id, username, revoked_before in rows:
+            if token_id is not None:
+                self._token_ids.add(bytes(token_id))
+            if username is not None and revoked_before is not None:
+                if revoked_before > self._users.get(username, 0):
+                    self._users[username] = revoked_before
+            self._last_id = max(self._last_id, row_id)
+
+    def load(self):
+        """Rebuild the index from all unexpired revocations."""
+        self.prune()
+        rows = db_util.fetch_all(
+            'SELECT id, token_id, username, revoked_before FROM token_revocations WHERE expires_at > ?',
+            (int(time.time()),))
+        with self._lock:
+            self._token_ids = set()
+            self._users = {}
+            self._last_id = 0
+            self._apply(rows)
+            if not rows:
+                self._last_id = db_util.fetch_one('SELECT COALESCE(MAX(id), 0) FROM token_revocations')[0]
+            self._last_refresh = time.monotonic()
+
+    def refresh(self, force=False):
+        """Fold in revocations recorded since the last refresh."""
+        if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        rows = db_util.fetch_all(
+            'SELECT id, token_id, username, revoked_before FROM token_revocations WHERE id > ? ORDER BY id',
+            (self._last_id,))
+        with self._lock:
+            self._apply(rows)
+            self._last_refresh = time.monotonic()
+
+    def is_revoked(self, info):
+        self.refresh()
+        if info.token_id in self._token_ids:
+            return True
+        return info.issued_at < self._users.get(info.username, 0)
+
+    def revoke_token(self, info):
+        """Revoke a single token (logout)."""
+        db_util.execute(
+            'INSERT INTO token_revocations (token_id, expires_at) VALUES (?, ?)',
+            (info.token_id, info.expires_at))
+        with self._lock:
+            self._token_ids.add(info.token_id)
+
+    def revoke_user(self, username, now=None):
+        """Revoke every token issued to ``username`` so far (password reset; ``now`` in unix milliseconds)."""
+        if now is None:
+            now = _now_ms()
+        db_util.execute(
+            'INSERT INTO token_revocations (username, revoked_before, expires_at) VALUES (?, ?, ?)',
+            (username, now, now // 1000 + config.SESSION_TTL_SECONDS))
+        with self._lock:
+            if now > self._users.get(username, 0):
+                self._users[username] = now
+
+    def prune(self):
+        """Delete revocations whose tokens have expired anyway."""
+        return db_util.execute('DELETE FROM token_revocations WHERE expires_at <= ?', (int(time.time()),))
+
+    def __len__(self):
+        return len(self._token_ids) + len(self._users)
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_revocation_index():
+    """Return the process-wide revocation index, loading it on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = RevocationIndex()
+                index.load()
+                _index = index
+    return _index
+
+def create_session_token(username, is_admin):
+    """Create a signed session token"""
+    return encode_token(username, is_admin)
+
+def validate_session_token(token):
+    """Validate a session token, returning its TokenInfo or None if invalid or revoked"""
+    if not token:
+        return None
+    info = decode_token(token)
+    if info is None or get_revocation_index().is_revoked(info):
+        return None
+    return info
@@ -1,124 +1,163 @@
 import streamlit as st
-import json
-import base64
 import hashlib
-from datetime import datetime, timedelta
-
-def create_session_token(username, is_admin, current_page='default', current_section=None):
-    """Create an encoded session token"""
-    session_data = {
-        "username": username,
-        "is_admin": is_admin,
-        "current_page": current_page,
-        "current_section": current_section,
-        "expiry": (datetime.now() + timedelta(days=7)).isoformat()
-    }
-    
-    # Add a salt/secret to increase security
-    secret = "streamlit_app_secret_key"
-    signature = hashlib.sha256(f"{username}{secret}".encode()).hexdigest()
-    session_data["signature"] = signature
-    
-    # Encode the data
-    token_str = json.dumps(session_data)
-    return base64.b64encode(token_str.encode()).decode()
+import re
+import secrets
+import time
 
-def validate_session_token(token):
-    """Validate and decode a session token"""
-    try:
-        if not token:
-            return None, None, None, None
-        
-        # Decode the token
-        token_str = base64.b64decode(token).decode()
-        session_data = json.loads(token_str)
-        
-        # Check if session is expired
-        expiry = datetime.fromisoformat(session_data["expiry"])
-        if datetime.now() > expiry:
-            return None, None, None, None
-        
-        # Verify signature
-        username = session_data["username"]
-        secret = "streamlit_app_secret_key"
-        expected_signature = hashlib.sha256(f"{username}{secret}".encode()).hexdigest()
-        if session_data.get("signature") != expected_signature:
-            return None, None, None, None
-        
-        # Return username, is_admin, current_page, current_section
-        return (
-            session_data["username"], 
-            session_data["is_admin"],
-            session_data.get("current_page", "default"),
-            session_data.get("current_section", None)
-        )
-    except Exception as e:
-        print(f"Error validating token: {str(e)}")
-        return None, None, None, None
-
-# Create a file-based session store
-SESSION_FILE = "session_store.json"
-
-def save_session_to_file(username, is_admin, current_page='default', current_section=None):
-    """Save session to file to persist across app restarts"""
-    try:
-        token = create_session_token(username, is_admin, current_page, current_section)
-        with open(SESSION_FILE, 'w') as f:
-            json.dump({"token": token}, f)
-        return True
-    except Exception as e:
-        print(f"Error saving session: {e}")
-        return False
+import config
+import log_util
+import session_store
+from cache_util import TTLCache
+from session_tokens import create_session_token, decode_token, get_revocation_index, validate_session_token
 
-def load_session_from_file():
-    """Load session from file"""
-    try:
-        import os
-        if not os.path.exists(SESSION_FILE):
-            return None, None, None, None
-            
-        with open(SESSION_FILE, 'r') as f:
-            data = json.load(f)
-            token = data.get("token")
-            if token:
-                return validate_session_token(token)
-        return None, None, None, None
-    except Exception as e:
-        print(f"Error loading session: {e}")
-        return None, None, None, None
-
-def clear_session_file():
-    """Clear the session file"""
+logger = log_util.get_logger(__name__)
+
+# Validated tokens are cached in memory, keyed by the token's digest, so repeat
+# restores (reloads, new tabs, reconnects after a deploy) skip decoding and
+# signature checks. Entries never outlive the token's own expiry, and the
+# revocation index is still consulted on every hit.
+_token_cache = TTLCache(config.TOKEN_CACHE_SIZE, config.TOKEN_CACHE_TTL_SECONDS)
+
+def _token_key(token):
+    return hashlib.sha256(token.encode()).digest()
+
+def _cache_token(key, info):
+    """Remember a successfully validated token until it (or the cache TTL) expires"""
+    ttl = min(_token_cache.ttl, info.expires_at - time.time())
+    _token_cache.set(key, info, ttl=ttl, tag=info.username)
+
+def check_session_token(token):
+    """Validate a token through the cache; returns its TokenInfo or None"""
+    if not token:
+        return None
+    key = _token_key(token)
+    info = _token_cache.get(key)
+    if info is not None:
+        if get_revocation_index().is_revoked(info):
+            _token_cache.pop(key)
+            return None
+        return info
     try:
-        import os
-        if os.path.exists(SESSION_FILE):
-            os.remove(SESSION_FILE)
-        return True
-    except Exception as e:
-        print(f"Error clearing session: {e}")
-        return False
+        info = validate_session_token(token)
+    except Exception:
+        logger.exception("Error validating token")
+        return None
+    if info is not None:
+        _cache_token(key, info)
+    return info
+
+def revoke_user_tokens(username):
+    """Revoke every session of ``username`` (e.g. after a password change)"""
+    get_revocation_index().revoke_user(username)
+    session_store.get_store().delete_user(username)
+    return invalidate_user_tokens(username)
+
+def invalidate_user_tokens(username):
+    """Drop every cached token for ``username`` (e.g. after a password change)"""
+    return _token_cache.invalidate_tag(username)
+
+def token_cache_stats():
+    """Hit/miss counters of the token validation cache"""
+    return _token_cache.stats()
+
+# Sessions are kept in the database, keyed by a per-browser session id that is
+# carried in the page URL so it survives reloads and server restarts. A login
+# always moves the session to a freshly generated id, so an id planted in a
+# link (session fixation) never ends up naming an authenticated session.
+SESSION_ID_PARAM = "sid"
+SESSION_ID_BYTES = 16
+_SESSION_ID_RE = re.compile(r"[A-Za-z0-9_-]{22}")
+
+def _new_session_id():
+    return secrets.token_urlsafe(SESSION_ID_BYTES)
+
+def is_valid_session_id(session_id):
+    """True if ``session_id`` has the shape of an id issued by _new_session_id"""
+    return isinstance(session_id, str) and _SESSION_ID_RE.fullmatch(session_id) is not None
+
+def _set_session_id(session_id):
+    st.query_params[SESSION_ID_PARAM] = session_id
+    st.session_state.session_id = session_id
+
+def get_session_id():
+    """Return this browser session's id, creating one on first visit"""
+    session_id = st.session_state.get('session_id')
+    if session_id:
+        return session_id
+
+    session_id = st.query_params.get(SESSION_ID_PARAM)
+    if not is_valid_session_id(session_id):
+        session_id = _new_session_id()
+        st.query_params[SESSION_ID_PARAM] = session_id
+    st.session_state.session_id = session_id
+    return session_id
 
 def restore_session():
-    """Restore session from file"""
+    """Restore session from the session store"""
     if st.session_state.get('authenticated', False):
         return True
-        
-    username, is_admin, current_page, current_section = load_session_from_file()
-    if username:
+
+    try:
+        stored = session_store.get_store().get(get_session_id())
+    except Exception:
+        logger.exception("Error loading session")
+        return False
+    if stored is None:
+        return False
+
+    token, current_page, current_section = stored
+    info = check_session_token(token)
+    if info is not None:
+        username, is_admin = info.username, info.is_admin
+        st.session_state.session_token = token
         st.session_state.authenticated = True
         st.session_state.username = username
         st.session_state.is_admin = is_admin
         st.session_state.current_page = current_page
         st.session_state.current_section = current_section
-        print(f"Restored session for user: {username}, admin: {is_admin}, page: {current_page}, section: {current_section}")
+        logger.debug("Restored session for user: %s, admin: %s, page: %s, section: %s",
+                     username, is_admin, current_page, current_section)
         return True
     
     return False
 
 def save_session(username, is_admin, current_page='default', current_section=None):
-    """Save session to file"""
-    return save_session_to_file(username, is_admin, current_page, current_section)
+    """Issue a session token for a fresh login, under a new session id"""
+    try:
+        token = create_session_token(username, is_admin)
+        previous = st.session_state.get('session_id') or st.query_params.get(SESSION_ID_PARAM)
+        session_id = _new_session_id()
+        session_store.get_store().create(session_id, token, username, current_page, current_section,
+                                         replaces=previous if is_valid_session_id(previous) else None)
+        _set_session_id(session_id)
+        # Seed the cache so other tabs of this session restore without decoding
+        _cache_token(_token_key(token), decode_token(token))
+        st.session_state.session_token = token
+        return True
+    except Exception:
+        logger.exception("Error saving session")
+        return False
+
+def update_navigation(current_page, current_section=None):
+    """Record the current page; writes are coalesced by the session store"""
+    try:
+        return session_store.get_store().update_navigation(get_session_id(), current_page, current_section)
+    except Exception:
+        logger.exception("Error saving navigation state")
+        return False
 
 def clear_session():
     """Clear session"""
-    return clear_session_file() 
\ No newline at end of file
+    try:
+        token = st.session_state.pop('session_token', None)
+        if token is not None:
+            _token_cache.pop(_token_key(token))
+            info = decode_token(token)
+            if info is not None:
+                # Copies of the token held elsewhere stop working as well
+                get_revocation_index().revoke_token(info)
+        session_store.get_store().delete(get_session_id())
+        return True
+    except Exception:
+        logger.exception("Error clearing session")
+        return False
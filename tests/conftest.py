@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+
+# Point every on-disk path at a scratch directory before the app modules read
+# config.py, so the tests never touch users.db, logs/ or cache/ of a checkout.
+_scratch = tempfile.mkdtemp(prefix="app-tests-")
+os.environ.setdefault("APP_DB_PATH", os.path.join(_scratch, "users.db"))
+os.environ.setdefault("APP_SESSION_SECRET", "test-secret")
+os.environ.setdefault("APP_LOG_FILE", "")
+os.environ.setdefault("APP_JOBS_DIR", os.path.join(_scratch, "jobs"))
+os.environ.setdefault("APP_PREDICTION_CACHE_DIR", os.path.join(_scratch, "cache", "predictions"))
+os.environ.setdefault("APP_COLUMN_STORE_DIR", os.path.join(_scratch, "cache", "columns"))
+# Cheap hashes; the KDF cost is not under test
+os.environ.setdefault("APP_KDF_ITERATIONS", "1000")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+@pytest.fixture
+def db():
+    """A freshly migrated database for one test."""
+    import config
+    import db_util
+    import migrations
+    import user_directory
+
+    db_util.close_pool()
+    # The process-wide directory would keep serving the previous test's users
+    if user_directory._directory is not None:
+        user_directory._directory.close()
+        user_directory._directory = None
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(config.DB_PATH + suffix)
+        except FileNotFoundError:
+            pass
+    migrations._applied = False
+    migrations.ensure_schema()
+    yield config.DB_PATH
+    db_util.close_pool()
@@ -0,0 +1,83 @@
+import sys
+import threading
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import health
+
+@pytest.fixture(autouse=True)
+def restore_main(monkeypatch):
+    # AppTest runs the script as __main__; spawned job workers in later tests would re-run it
+    monkeypatch.setitem(sys.modules, "__main__", sys.modules["__main__"])
+
+@pytest.fixture
+def gate(monkeypatch):
+    gate = health.RerunGate(max_inflight=1)
+    monkeypatch.setattr(health, "_gate", gate)
+    return gate
+
+def _fragment_script():
+    import threading
+
+    import streamlit as st
+
+    import health
+
+    @health.gated_fragment
+    def fragment():
+        st.write("fragment body")
+        # Another session's rerun arriving while this fragment runs
+        result = []
+        other = threading.Thread(target=lambda: result.append(health.admit_rerun().__enter__()))
+        other.start()
+        other.join()
+        st.session_state.other_admitted = result[0]
+
+    if st.session_state.get("full_rerun"):
+        with health.admit_rerun() as admitted:
+            assert admitted
+            fragment()
+    else:
+        fragment()
+
+def _hold_slot(gate):
+    """Keep one slot busy from another thread until the returned event is set."""
+    entered, release = threading.Event(), threading.Event()
+
+    def hold():
+        with gate.admit():
+            entered.set()
+            release.wait(10)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    entered.wait(5)
+    return release, thread
+
+def test_fragment_is_shed_when_reruns_are_at_the_limit(gate):
+    release, holder = _hold_slot(gate)
+    try:
+        app = AppTest.from_function(_fragment_script).run()
+    finally:
+        release.set()
+        holder.join()
+    assert [warning.value for warning in app.warning] == [health.BUSY_MESSAGE]
+    assert not app.markdown
+    assert gate.stats()["shed"] == 1
+
+def test_fragment_holds_a_slot_while_it_runs(gate):
+    app = AppTest.from_function(_fragment_script).run()
+    assert [markdown.value for markdown in app.markdown] == ["fragment body"]
+    assert app.session_state.other_admitted is False
+    assert gate.stats()["admitted"] == 1
+    assert gate.stats()["shed"] == 1
+
+def test_fragment_inside_a_full_rerun_shares_its_slot(gate):
+    app = AppTest.from_function(_fragment_script)
+    app.session_state.full_rerun = True
+    app.run()
+    assert [markdown.value for markdown in app.markdown] == ["fragment body"]
+    assert gate.stats()["admitted"] == 1
+    assert gate.stats()["peak"] == 1
+    assert gate.stats()["inflight"] == 0
@@ -0,0 +1,122 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+import db_util
+import jobs
+import log_util
+import scoring
+
+def _add_job(tmp_path, status=jobs.QUEUED):
+    job_id = uuid.uuid4().hex
+    input_path = tmp_path / f"{job_id}.csv"
+    input_path.write_bytes(b"x1,x2,x3\n1,2,3\n4,5,6\n")
+    now = int(time.time())
+    db_util.execute(
+        "INSERT INTO jobs (job_id, username, model_id, model_version, status, input_name, input_path, "
+        "output_path, bytes_total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (job_id, "admin", "model_b", "1.0.0", status, "input.csv", str(input_path),
+         str(tmp_path / f"{job_id}.out.csv"), input_path.stat().st_size, now, now))
+    return job_id
+
+def test_slow_running_job_is_not_recovered(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "JOB_STALE_SECONDS", 2)
+    score_file = scoring.score_file
+    recovered = threading.Event()
+
+    def slow_score_file(*args, **kwargs):
+        # One chunk that takes longer than the stale limit, with no progress reports
+        time.sleep(3.5)
+        return score_file(*args, **kwargs)
+
+    monkeypatch.setattr(scoring, "score_file", slow_score_file)
+    job_id = _add_job(tmp_path)
+    result = []
+    worker = threading.Thread(target=lambda: result.append(jobs.run_job(job_id)))
+    worker.start()
+
+    # Another server process checks for stale jobs while the chunk runs
+    other = jobs.JobQueue(workers=1, jobs_dir=str(tmp_path))
+    monkeypatch.setattr(other, "_dispatch", lambda job_id: recovered.set())
+    time.sleep(3)
+    other.recover()
+    worker.join()
+
+    assert not recovered.is_set()
+    assert result == [jobs.SUCCEEDED]
+    assert jobs.get_job(job_id).attempts == 1
+
+def test_requeued_attempt_does_not_finish_the_job(db, tmp_path, monkeypatch):
+    score_file = scoring.score_file
+    job_id = _add_job(tmp_path)
+
+    def requeued_meanwhile(*args, **kwargs):
+        output = score_file(*args, **kwargs)
+        db_util.execute("UPDATE jobs SET status = ?, attempts = attempts + 1 WHERE job_id = ?",
+                        (jobs.RUNNING, job_id))
+        return output
+
+    monkeypatch.setattr(scoring, "score_file", requeued_meanwhile)
+    assert jobs.run_job(job_id) is None
+    job = jobs.get_job(job_id)
+    assert (job.status, job.attempts) == (jobs.RUNNING, 2)
+    assert not os.path.exists(job.output_path)
+
+def _log_from_worker(message):
+    log_util.get_logger("jobs").warning("from worker %s", message)
+    return os.getpid()
+
+def test_worker_records_are_logged_by_the_server_process():
+    received = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            received.append(record)
+
+    capture = Capture()
+    logging.getLogger(log_util.ROOT_LOGGER).addHandler(capture)
+    try:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=jobs._init_worker,
+                                 initargs=(log_util.worker_log_queue(context),)) as pool:
+            worker_pid = pool.submit(_log_from_worker, "hello").result()
+        deadline = time.monotonic() + 10
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        logging.getLogger(log_util.ROOT_LOGGER).removeHandler(capture)
+
+    assert worker_pid != os.getpid()
+    assert [(record.name, record.getMessage()) for record in received] == [("app.jobs", "from worker hello")]
+
+def _import_queue(tmp_path, monkeypatch):
+    queue = jobs.JobQueue(workers=1, jobs_dir=str(tmp_path))
+    monkeypatch.setattr(queue, "_dispatch", lambda job_id: None)
+    return queue
+
+def test_user_import_runs_as_a_job(db, tmp_path, monkeypatch):
+    data = io.BytesIO(b"username,password,is_admin\nalice,secret,0\nbob,,0\ncarol,secret,1\n")
+    job_id = _import_queue(tmp_path, monkeypatch).submit_import("admin", data, "users.csv")
+    assert jobs.get_job(job_id).status == jobs.QUEUED
+
+    assert jobs.run_job(job_id) == jobs.SUCCEEDED
+    job = jobs.get_job(job_id)
+    assert (job.kind, job.rows_done, job.bytes_done) == (jobs.USER_IMPORT, 3, job.bytes_total)
+    result = jobs.import_result(job)
+    assert (result.rows, result.imported, result.error_count) == (3, 2, 1)
+    assert result.errors == [(3, "bob", "password is required")]
+    assert db_util.fetch_one('SELECT is_admin FROM users WHERE username = ?', ("carol",))[0]
+    assert [job.job_id for job in jobs.list_jobs("admin", kind=jobs.USER_IMPORT)] == [job_id]
+    assert jobs.list_jobs("admin", kind=jobs.SCORE) == []
+
+def test_user_import_with_a_bad_header_fails_the_job(db, tmp_path, monkeypatch):
+    job_id = _import_queue(tmp_path, monkeypatch).submit_import("admin", io.BytesIO(b"name,secret\nx,y\n"),
+                                                               "users.csv")
+    assert jobs.run_job(job_id) == jobs.FAILED
+    assert "missing column" in jobs.get_job(job_id).error
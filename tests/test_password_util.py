@@ -0,0 +1,34 @@
+import threading
+
+import password_util
+
+def test_rejections_from_many_threads_are_all_counted():
+    pool = password_util.PasswordPool(workers=1, max_pending=1, queue_timeout=0.01)
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(10)
+
+    holder = threading.Thread(target=pool.run, args=(hold,))
+    holder.start()
+    started.wait(5)
+    rejected = []
+
+    def attempt():
+        for _ in range(20):
+            try:
+                pool.run(int)
+            except password_util.PasswordPoolBusy:
+                rejected.append(1)
+
+    threads = [threading.Thread(target=attempt) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    release.set()
+    holder.join()
+    pool.shutdown()
+    assert len(rejected) == 160
+    assert pool.rejected == 160
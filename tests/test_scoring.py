@@ -0,0 +1,42 @@
+import io
+
+import numpy as np
+
+import model_registry
+import prediction_cache
+import scoring
+
+def _csv(rows):
+    return io.BytesIO(("x1,x2,x3\n" + "".join(rows)).encode("utf-8"))
+
+def _rows(count):
+    values = np.random.default_rng(7).normal(size=(count, 3))
+    return ["%.6f,%.6f,%.6f\n" % tuple(row) for row in values]
+
+def test_chunks_cover_every_line_within_bounds():
+    rows = _rows(5000)
+    chunks = list(scoring.iter_chunks(rows, 100))
+    assert [line for chunk in chunks for line in chunk] == rows
+    assert all(25 <= len(chunk) <= 200 for chunk in chunks[:-1])
+
+def test_shifted_rows_hit_the_prediction_cache(tmp_path):
+    model = model_registry.get_registry().get("model_b", count_use=False)
+    cache = prediction_cache.PredictionCache(str(tmp_path))
+    rows = _rows(5000)
+
+    first = scoring.score_file(model, _csv(rows), io.StringIO(), chunk_size=500, cache=cache)
+    assert first.cache_hits == 0
+
+    # One row in front shifts every offset; only the first chunk changes
+    shifted = ["0.5,0.5,0.5\n"] + rows
+    output = io.StringIO()
+    second = scoring.score_file(model, _csv(shifted), output, chunk_size=500, cache=cache)
+    assert second.cache_hits >= second.chunks - 1
+
+    fresh = io.StringIO()
+    scoring.score_file(model, _csv(shifted), fresh, chunk_size=500)
+    assert output.getvalue() == fresh.getvalue()
+
+    stats = cache.stats()
+    assert stats["entries"] == first.cache_misses + second.cache_misses
+    assert stats["bytes"] == sum(entry.stat().st_size for entry in tmp_path.glob("*/*.bin"))
@@ -0,0 +1,59 @@
+import struct
+import time
+
+import session_tokens
+
+def test_token_round_trip():
+    token = session_tokens.encode_token("alice", True, now=1_700_000_000_123)
+    info = session_tokens.decode_token(token, now=1_700_000_001)
+    assert info.username == "alice"
+    assert info.is_admin
+    assert info.issued_at == 1_700_000_000_123
+
+def test_version_1_tokens_still_decode():
+    payload = struct.pack(">BBII8sB", 1, 0, 1_700_000_000, 1_700_000_100, b"12345678", 5) + b"alice"
+    token = session_tokens._b64encode(payload + session_tokens._sign(payload))
+    info = session_tokens.decode_token(token, now=1_700_000_001)
+    assert info.username == "alice"
+    assert info.issued_at == 1_700_000_000_000
+
+def test_revoke_user_spares_tokens_issued_in_the_same_second(db):
+    index = session_tokens.RevocationIndex(refresh_interval=0)
+    index.load()
+    # Start of the current second, so the revocation is not pruned as expired
+    second = int(time.time()) * 1000
+    before = session_tokens.decode_token(session_tokens.encode_token("alice", False, now=second + 100), now=0)
+    index.revoke_user("alice", now=second + 400)
+    after = session_tokens.decode_token(session_tokens.encode_token("alice", False, now=second + 400), now=0)
+    other = session_tokens.decode_token(session_tokens.encode_token("bob", False, now=second + 100), now=0)
+
+    assert index.is_revoked(before)
+    assert not index.is_revoked(after)
+    assert not index.is_revoked(other)
+
+    # Other server processes see the same from the table
+    reloaded = session_tokens.RevocationIndex(refresh_interval=0)
+    reloaded.load()
+    assert reloaded.is_revoked(before)
+    assert not reloaded.is_revoked(after)
+
+def test_version_1_revocations_are_migrated(db, monkeypatch):
+    import db_util
+    import migrations
+
+    # Only the migration under test; the later ones were applied already
+    monkeypatch.setattr(migrations, "MIGRATIONS", [step for step in migrations.MIGRATIONS if step[0] <= 13])
+
+    # A password reset recorded in seconds revoked tokens issued up to and including that second
+    second = int(time.time())
+    with db_util.connection() as conn:
+        conn.execute('PRAGMA user_version = 12')
+        conn.execute('INSERT INTO token_revocations (username, revoked_before, expires_at) VALUES (?, ?, ?)',
+                     ("alice", second, second + 60))
+        conn.commit()
+        migrations.migrate(conn)
+    index = session_tokens.RevocationIndex(refresh_interval=0)
+    index.load()
+    issued = lambda ms: session_tokens.decode_token(session_tokens.encode_token("alice", False, now=ms), now=0)
+    assert index.is_revoked(issued(second * 1000 + 999))
+    assert not index.is_revoked(issued(second * 1000 + 1000))
@@ -0,0 +1,46 @@
+from streamlit.testing.v1 import AppTest
+
+import session_store
+import session_util
+
+SCRIPT = """
+import streamlit as st
+import session_util
+
+st.session_state.seen_id = session_util.get_session_id()
+if st.button("login", key="login"):
+    session_util.save_session("user", False)
+"""
+
+PLANTED = "A" * 22
+
+def _run(query_params=None):
+    at = AppTest.from_string(SCRIPT)
+    for key, value in (query_params or {}).items():
+        at.query_params[key] = value
+    return at.run()
+
+def test_session_id_format_is_validated():
+    assert session_util.is_valid_session_id(session_util._new_session_id())
+    for session_id in (None, "", "short", "A" * 64, "A" * 21 + "!", "A" * 23):
+        assert not session_util.is_valid_session_id(session_id)
+
+def test_malformed_sid_is_replaced(db):
+    at = _run({"sid": "x" * 40})
+    assert at.session_state.seen_id != "x" * 40
+    assert session_util.is_valid_session_id(at.session_state.seen_id)
+
+def test_login_moves_the_session_to_a_fresh_id(db):
+    # A row left under the planted id is moved, not kept
+    session_store.get_store().create(PLANTED, "stale-token", "user")
+    at = _run({"sid": PLANTED})
+    assert at.session_state.seen_id == PLANTED
+
+    at.button(key="login").click().run()
+
+    session_id = at.session_state.session_id
+    assert session_id != PLANTED
+    assert at.query_params["sid"] == [session_id]
+    store = session_store.get_store()
+    assert store.get(PLANTED) is None
+    assert store.get(session_id)[0] == at.session_state.session_token
@@ -0,0 +1,95 @@
+import io
+import json
+
+import db_util
+import user_bulk
+
+def _ndjson(*records):
+    return io.BytesIO("".join(
+        (record if isinstance(record, str) else json.dumps(record)) + "\n" for record in records).encode("utf-8"))
+
+def _usernames():
+    # Without the accounts created by the first migration
+    return {row[0] for row in db_util.fetch_all('SELECT username FROM users')} - {"admin", "user"}
+
+def test_import_rejects_non_string_fields_and_keeps_going(db):
+    data = _ndjson(
+        {"username": "alice", "password": "secret"},
+        {"username": 123, "password": "x"},
+        {"username": "bob", "password": 42},
+        {"username": ["carol"], "password": "x"},
+        {"username": "dave", "password": "x", "is_admin": {"yes": True}},
+        {"username": "erin", "password": "secret", "is_admin": 1},
+    )
+    result = user_bulk.import_users(data, "ndjson", chunk_size=2)
+
+    assert result.rows == 6
+    assert result.imported == 2
+    assert result.error_count == 4
+    assert [line for line, _, _ in result.errors] == [2, 3, 4, 5]
+    assert result.errors[0] == (2, None, "username must be a string")
+    assert result.errors[1] == (3, "bob", "password must be a string")
+    assert _usernames() == {"alice", "erin"}
+    assert db_util.fetch_one('SELECT is_admin FROM users WHERE username = ?', ("erin",))[0]
+
+def test_import_reports_malformed_csv_rows(db):
+    data = io.BytesIO(b"username,password\nalice,secret\nbob," + b"x" * 200000 + b"\ncarol,secret\n")
+    result = user_bulk.import_users(data, "csv")
+
+    assert result.imported == 2
+    assert result.error_count == 1
+    line, username, message = result.errors[0]
+    assert line == 3
+    assert username is None
+    assert message.startswith("malformed CSV row")
+    assert _usernames() == {"alice", "carol"}
+
+def test_import_hashes_outside_the_write_transaction(db, monkeypatch):
+    import sqlite3
+
+    import password_util
+
+    hash_password = password_util.hash_password
+    writable = []
+
+    def checking_hash(password, iterations=None):
+        # Another writer must get the lock while the import is hashing
+        conn = sqlite3.connect(db, timeout=0)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.rollback()
+            writable.append(True)
+        except sqlite3.OperationalError:
+            writable.append(False)
+        finally:
+            conn.close()
+        return hash_password(password, iterations)
+
+    monkeypatch.setattr(password_util, "hash_password", checking_hash)
+    data = _ndjson(*({"username": f"user{i}", "password": "secret"} for i in range(5)))
+    result = user_bulk.import_users(data, "ndjson", chunk_size=2, workers=2)
+
+    assert result.imported == 5
+    assert writable == [True] * 5
+
+def _iterations(username):
+    stored = db_util.fetch_one('SELECT password FROM users WHERE username = ?', (username,))[0]
+    return int(stored.split("$")[1])
+
+def test_imported_hashes_are_cheap_until_first_login(db, monkeypatch):
+    import app
+    import config
+    import password_util
+
+    monkeypatch.setattr(config, "BULK_IMPORT_KDF_ITERATIONS", 10)
+    result = user_bulk.import_users(_ndjson({"username": "alice", "password": "secret"},
+                                            {"username": "bob", "password": "secret"}), "ndjson")
+    assert result.imported == 2
+    assert _iterations("alice") == _iterations("bob") == 10
+    assert password_util.needs_rehash(db_util.fetch_one('SELECT password FROM users WHERE username = ?',
+                                                        ("alice",))[0])
+
+    assert app.check_credentials("alice", "secret") == (True, 0)
+    assert _iterations("alice") == config.KDF_ITERATIONS
+    assert _iterations("bob") == 10
+    assert app.check_credentials("alice", "secret") == (True, 0)
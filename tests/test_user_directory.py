@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+import config
+import db_util
+import user_directory
+
+def _add_users(*usernames):
+    with db_util.transaction() as conn:
+        conn.executemany('INSERT INTO users (username, password, is_admin) VALUES (?, ?, 0)',
+                         [(username, "hash") for username in usernames])
+
+@pytest.fixture
+def directory(db):
+    directory = user_directory.UserDirectory(max_users=4)
+    yield directory
+    directory.close()
+
+def test_follows_inserts_and_deletes(directory):
+    assert directory.all_users() == [("user", 0)]
+    _add_users("bob", "alice")
+    assert directory.list_users(prefix="", limit=2) == [("alice", 0), ("bob", 0)]
+    db_util.execute('DELETE FROM users WHERE username = ?', ("bob",))
+    assert directory.get("bob") is None
+    assert directory.count() == 2
+
+def test_oversized_table_is_served_again_once_it_shrinks(directory):
+    _add_users("a", "b")
+    assert directory.count() == 3
+    _add_users("c")
+    with pytest.raises(user_directory.DirectoryUnavailable):
+        directory.get("a")
+    assert directory.oversized
+    db_util.execute('DELETE FROM users WHERE username IN (?, ?)', ("a", "c"))
+    assert directory.get("b") == ("hash", 0)
+    assert directory.get("c") is None
+    assert not directory.oversized
+
+def test_get_directory_recovers_from_oversized(db, monkeypatch):
+    monkeypatch.setattr(config, "USER_DIRECTORY_MAX_USERS", 2)
+    monkeypatch.setattr(user_directory, "_directory", None)
+    try:
+        assert user_directory.get_directory() is not None
+        _add_users("a")
+        with pytest.raises(user_directory.DirectoryUnavailable):
+            user_directory.get_directory().get("a")
+        assert user_directory.get_directory() is None
+        db_util.execute('DELETE FROM users WHERE username = ?', ("a",))
+        assert user_directory.get_directory().get("admin") is not None
+    finally:
+        user_directory._directory.close()
+
+def test_snapshots_are_not_changed_by_later_refreshes(directory):
+    before = directory.snapshot()
+    _add_users("zed")
+    after = directory.snapshot()
+    assert "zed" not in before.users and "zed" not in before.names
+    assert after.users["zed"] == ("hash", 0)
+    assert "zed" in after.names
+
+def test_lookups_do_not_hold_the_lock(directory):
+    snapshot = directory.snapshot()
+    entered, release = threading.Event(), threading.Event()
+
+    class SlowUsers(dict):
+        def get(self, key, default=None):
+            entered.set()
+            release.wait(5)
+            return super().get(key, default)
+
+    directory._snapshot = snapshot._replace(users=SlowUsers(snapshot.users))
+    slow = threading.Thread(target=directory.get, args=("admin",))
+    slow.start()
+    try:
+        assert entered.wait(5)
+        # A second lookup completes while the first is still reading
+        assert directory.count() == 1
+    finally:
+        release.set()
+        slow.join()
@@ -0,0 +1,122 @@
+import time
+from collections import Counter, namedtuple
+
+import config
+import db_util
+import log_util
+
+logger = log_util.get_logger(__name__)
+
+# Pre-aggregated login and usage counts for the admin activity dashboard.
+#
+# usage_rollups holds one count per (granularity, bucket, metric, key), where
+# bucket is the UTC start of a minute, hour or day. The audit writer calls
+# apply() inside the transaction that appends a batch of audit events, so
+# the rollups always agree with the raw events and several server processes
+# can maintain them side by side. Metrics:
+#
+#   logins          successful logins
+#   login_failures  failed and throttled logins
+#   page_views      navigations, keyed by page id
+#   active_users    distinct users who logged in or navigated in the bucket
+#
+# Distinct users are not additive, so usage_active remembers who was already
+# counted in each open bucket. compact() runs periodically on the audit
+# writer: it drops usage_active rows of buckets that have closed (their
+# counts are final), minute and hour rollups past their retention (the
+# coarser rollups still cover those periods) and raw audit events past
+# AUDIT_RETENTION_DAYS. The dashboard reads a fixed number of buckets from
+# usage_rollups only, so it costs the same however long the history is.
+
+Granularity = namedtuple("Granularity", "name seconds")
+
+MINUTE = Granularity("minute", 60)
+HOUR = Granularity("hour", 3600)
+DAY = Granularity("day", 86400)
+GRANULARITIES = (MINUTE, HOUR, DAY)
+
+LOGINS = "logins"
+LOGIN_FAILURES = "login_failures"
+PAGE_VIEWS = "page_views"
+ACTIVE_USERS = "active_users"
+
+# Audit event type (see audit.py) -> metric it counts
+EVENT_METRICS = {"login": LOGINS, "login_failed": LOGIN_FAILURES, "page_view": PAGE_VIEWS}
+
+# Audit event types that make their user active; failed logins carry whatever name was typed
+ACTIVE_EVENTS = frozenset(("login", "page_view"))
+
+def _retention(granularity):
+    """Seconds a granularity's rollups are kept (0: forever)."""
+    if granularity is MINUTE:
+        return config.ROLLUP_MINUTE_RETENTION_HOURS * 3600
+    if granularity is HOUR:
+        return config.ROLLUP_HOUR_RETENTION_DAYS * 86400
+    return config.ROLLUP_DAY_RETENTION_DAYS * 86400
+
+def apply(conn, events):
+    """Fold a batch of audit event rows (created_at, event, username, target, detail) into the rollups."""
+    counts = Counter()
+    active = set()
+    for created_at, event, username, target, _ in events:
+        metric = EVENT_METRICS.get(event)
+        is_active = username is not None and event in ACTIVE_EVENTS
+        if metric is None and not is_active:
+            continue
+        key = (target or "") if metric == PAGE_VIEWS else ""
+        for granularity in GRANULARITIES:
+            bucket = created_at - created_at % granularity.seconds
+            if metric is not None:
+                counts[(granularity.name, bucket, metric, key)] += 1
+            if is_active:
+                active.add((granularity.name, bucket, username))
+    for name, bucket, username in active:
+        # Counted once per bucket, by whichever batch (or process) sees the user first
+        if conn.execute('INSERT OR IGNORE INTO usage_active (granularity, bucket, username) VALUES (?, ?, ?)',
+                        (name, bucket, username)).rowcount:
+            counts[(name, bucket, ACTIVE_USERS, "")] += 1
+    conn.executemany(
+        'INSERT INTO usage_rollups (granularity, bucket, metric, key, count) VALUES (?, ?, ?, ?, ?) '
+        'ON CONFLICT(granularity, bucket, metric, key) DO UPDATE SET count = count + excluded.count',
+        [(*row, count) for row, count in counts.items()])
+    return len(counts)
+
+def compact(now=None):
+    """Drop settled presence rows, rollups past retention and raw events past retention; returns rows deleted."""
+    now = int(time.time()) if now is None else now
+    deleted = 0
+    with db_util.transaction() as conn:
+        for granularity in GRANULARITIES:
+            # The previous bucket stays open a little longer for events still in flight
+            closed_before = now - now % granularity.seconds - granularity.seconds
+            deleted += conn.execute('DELETE FROM usage_active WHERE granularity = ? AND bucket < ?',
+                                    (granularity.name, closed_before)).rowcount
+            retention = _retention(granularity)
+            if retention > 0:
+                deleted += conn.execute('DELETE FROM usage_rollups WHERE granularity = ? AND bucket < ?',
+                                        (granularity.name, now - retention)).rowcount
+        if config.AUDIT_RETENTION_DAYS > 0:
+            deleted += conn.execute('DELETE FROM audit_events WHERE created_at < ?',
+                                    (now - config.AUDIT_RETENTION_DAYS * 86400,)).rowcount
+    if deleted:
+        logger.info("Usage rollup compaction deleted %d rows", deleted)
+    return deleted
+
+def series(granularity, buckets, now=None):
+    """Rollups of the last ``buckets`` buckets (the current one included).
+
+    Returns (bucket starts, {metric: {key: [count per bucket]}}), with zeros
+    for buckets without events.
+    """
+    now = int(time.time()) if now is None else now
+    last = now - now % granularity.seconds
+    starts = [last - (buckets - 1 - i) * granularity.seconds for i in range(buckets)]
+    position = {start: i for i, start in enumerate(starts)}
+    rows = db_util.fetch_all(
+        'SELECT bucket, metric, key, count FROM usage_rollups WHERE granularity = ? AND bucket >= ? AND bucket <= ?',
+        (granularity.name, starts[0], last))
+    values = {}
+    for bucket, metric, key, count in rows:
+        if bucket in position:
+            values.setdefault(metric, {}).setdefault(key, [0] * buckets)[position[bucket]] = count
+    return starts, values
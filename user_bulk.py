@@ -0,0 +1,270 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import config
+import db_util
+import password_util
+import user_repo
+
+# Bulk user import/export for administrators.
+#
+# Import reads CSV (header: username,password[,is_admin]) or NDJSON (one object
+# per line with the same keys) as a stream, in chunks of ``chunk_size`` rows.
+# Each chunk is validated and checked for existing usernames, its passwords are
+# hashed through the process's password pool (at most ``workers`` at a time,
+# so logins still get KDF workers), and only then are the new users inserted with
+# one executemany in a short transaction: no connection or write lock is held
+# while hashing. Bad rows are reported with their line number and skipped;
+# they never abort the batch. The admin page runs imports as jobs on the job
+# queue (jobs.py), so they never hold a Streamlit session.
+#
+# At the login cost (KDF_ITERATIONS) a large import would take hours, so
+# imported passwords are hashed at BULK_IMPORT_KDF_ITERATIONS instead.
+# password_util.needs_rehash() flags those hashes, and the first successful
+# login of each user upgrades them to the full cost.
+#
+# Export walks the users table with keyset pagination and yields the file in
+# pieces, so neither side holds the whole table in memory. Password hashes are
+# never exported.
+
+FORMATS = ("csv", "ndjson")
+
+# Keep at most this many per-row errors in the result; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+# Stay well below SQLite's bound-parameter limit in IN (...) lookups
+_LOOKUP_BATCH = 500
+
+ImportResult = namedtuple("ImportResult", "rows imported errors error_count")
+
+def detect_format(filename):
+    """Guess the input format from a file name."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    return "ndjson" if ext in (".ndjson", ".jsonl", ".json") else "csv"
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    if not isinstance(value, (int, str)):
+        raise ValueError(f"invalid is_admin value: {value!r}")
+    text = str(value).strip().lower()
+    if text in ("", "0", "false", "no", "n"):
+        return False
+    if text in ("1", "true", "yes", "y"):
+        return True
+    raise ValueError(f"invalid is_admin value: {value!r}")
+
+def iter_records(binary_file, fmt):
+    """Yield (line_number, record_dict_or_None, error_or_None) from an uploaded file."""
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            try:
+                fieldnames = reader.fieldnames
+            except csv.Error as e:
+                raise ValueError(f"malformed CSV header: {e}") from e
+            missing = {"username", "password"} - set(fieldnames or ())
+            if missing:
+                raise ValueError(f"CSV header is missing column(s): {', '.join(sorted(missing))}")
+            while True:
+                # The row being read starts on the line after the last one consumed
+                line_number = reader.line_num + 1
+                try:
+                    record = next(reader)
+                except StopIteration:
+                    break
+                except csv.Error as e:
+                    # The reader resumes on the next line
+                    yield line_number, None, f"malformed CSV row: {e}"
+                    continue
+                yield reader.line_num, record, None
+        elif fmt == "ndjson":
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f"invalid JSON: {e}"
+                    continue
+                if not isinstance(record, dict):
+                    yield line_number, None, "expected a JSON object"
+                    continue
+                yield line_number, record, None
+        else:
+            raise ValueError(f"Unsupported format: {fmt}")
+    finally:
+        # Leave the caller's file open
+        text.detach()
+
+def _validate(record):
+    """Return (username, password, is_admin) or raise ValueError."""
+    username = record.get("username")
+    password = record.get("password")
+    # NDJSON values can be any JSON type; CSV values are str or None
+    if username is not None and not isinstance(username, str):
+        raise ValueError("username must be a string")
+    if password is not None and not isinstance(password, str):
+        raise ValueError("password must be a string")
+    username = (username or "").strip()
+    if not username:
+        raise ValueError("username is required")
+    if not password:
+        raise ValueError("password is required")
+    return username, password, _parse_bool(record.get("is_admin"))
+
+def _existing_usernames(conn, usernames):
+    existing = set()
+    usernames = list(usernames)
+    for start in range(0, len(usernames), _LOOKUP_BATCH):
+        batch = usernames[start:start + _LOOKUP_BATCH]
+        placeholders = ",".join("?" * len(batch))
+        existing.update(row[0] for row in conn.execute(
+            f'SELECT username FROM users WHERE username IN ({placeholders})', batch))
+    return existing
+
+def import_users(binary_file, fmt="csv", chunk_size=None, workers=None, progress=None, iterations=None):
+    """Stream users from ``binary_file`` into the database.
+
+    ``progress`` is called as ``progress(rows_seen, imported)`` after each chunk.
+    """
+    chunk_size = chunk_size or config.BULK_IMPORT_CHUNK_SIZE
+    workers = workers or config.BULK_IMPORT_WORKERS
+    iterations = min(iterations or config.BULK_IMPORT_KDF_ITERATIONS, config.KDF_ITERATIONS)
+    rows = imported = error_count = 0
+    errors = []
+
+    def report(line_number, username, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append((line_number, username, message))
+
+    records = iter_records(binary_file, fmt)
+    kdf = password_util.get_pool()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-import") as pool:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            rows += len(chunk)
+
+            # Validate and drop duplicates within the chunk
+            valid = {}
+            for line_number, record, error in chunk:
+                if error:
+                    report(line_number, None, error)
+                    continue
+                try:
+                    username, password, is_admin = _validate(record)
+                except ValueError as e:
+                    username = record.get("username")
+                    report(line_number, username if isinstance(username, str) else None, str(e))
+                    continue
+                if username in valid:
+                    report(line_number, username, "duplicate username in file")
+                    continue
+                valid[username] = (line_number, password, is_admin)
+
+            # Rows that already exist (in the table or earlier chunks) are reported, not hashed
+            with db_util.connection() as conn:
+                existing = _existing_usernames(conn, valid)
+            for username in existing:
+                report(valid.pop(username)[0], username, "username already exists")
+
+            # Hash without holding a connection; each worker waits for a password
+            # pool slot, so the import never runs more than ``workers`` KDFs at once
+            usernames = list(valid)
+            hashes = list(pool.map(lambda name: kdf.hash(valid[name][1], wait=True, iterations=iterations),
+                                   usernames))
+            batch = [(name, hashed, valid[name][2]) for name, hashed in zip(usernames, hashes)]
+
+            with db_util.transaction() as conn:
+                cursor = conn.executemany(
+                    'INSERT OR IGNORE INTO users (username, password, is_admin) VALUES (?, ?, ?)', batch)
+                inserted = cursor.rowcount
+                if inserted < len(batch):
+                    # Someone else created some of these users meanwhile; find which
+                    ours = {name: hashed for name, hashed, _ in batch}
+                    for start in range(0, len(usernames), _LOOKUP_BATCH):
+                        names = usernames[start:start + _LOOKUP_BATCH]
+                        placeholders = ",".join("?" * len(names))
+                        for name, stored in conn.execute(
+                                f'SELECT username, password FROM users WHERE username IN ({placeholders})', names):
+                            if stored != ours[name]:
+                                report(valid[name][0], name, "username already exists")
+            imported += inserted
+
+            if progress is not None:
+                progress(rows, imported)
+
+    return ImportResult(rows, imported, errors, error_count)
+
+def iter_export(fmt="csv", batch_size=1000, include_admin=True):
+    """Yield the users table as CSV or NDJSON text, one batch of rows at a time."""
+    exclude = None if include_admin else "admin"
+    if fmt == "csv":
+        yield "username,is_admin\n"
+    after = None
+    while True:
+        rows = user_repo.list_users(after=after, limit=batch_size, exclude=exclude)
+        if not rows:
+            break
+        out = io.StringIO()
+        if fmt == "csv":
+            writer = csv.writer(out, lineterminator="\n")
+            writer.writerows((username, int(bool(is_admin))) for username, is_admin in rows)
+        else:
+            for username, is_admin in rows:
+                out.write(json.dumps({"username": username, "is_admin": bool(is_admin)}))
+                out.write("\n")
+        yield out.getvalue()
+        after = rows[-1][0]
+
+def export_to_file(path, fmt="csv", batch_size=1000):
+    """Stream the users table into ``path``; returns the number of bytes written."""
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for piece in iter_export(fmt, batch_size):
+            f.write(piece)
+            written += len(piece)
+    return written
+
+def main(argv=None):
+    """Command line entry point: python user_bulk.py import|export FILE"""
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Bulk import or export users")
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args(argv)
+    fmt = args.format or detect_format(args.path)
+
+    migrations.ensure_schema()
+    if args.action == "export":
+        export_to_file(args.path, fmt)
+        print(f"Exported users to {args.path}")
+        return 0
+
+    with open(args.path, "rb") as f:
+        result = import_users(f, fmt, chunk_size=args.chunk_size,
+                              progress=lambda rows, imported: print(f"{rows} rows read, {imported} imported"))
+    print(f"Imported {result.imported} of {result.rows} rows, {result.error_count} errors")
+    for line_number, username, message in result.errors[:20]:
+        print(f"  line {line_number} ({username}): {message}")
+    return 1 if result.error_count else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
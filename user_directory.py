@@ -0,0 +1,267 @@
+import bisect
+import sqlite3
+import threading
+from collections import namedtuple
+
+import config
+import db_util
+import log_util
+
+logger = log_util.get_logger(__name__)
+
+# In-memory copy of the users table: username -> (password hash, is_admin),
+# plus the usernames in sorted order for the admin listing and prefix search.
+# Logins and admin pages read it instead of querying SQLite.
+#
+# Every read first asks SQLite whether anything changed. The directory keeps
+# one connection of its own and runs PRAGMA data_version on it; the value
+# changes whenever another connection - a pooled one in this process or any
+# connection in another process - commits to the database, and stays put
+# otherwise, so the common case costs one pragma and no table access. When it
+# has moved, the user_changes log (filled by triggers on users, migration 10)
+# tells which usernames changed since the last refresh, and only those rows
+# are re-read. Large batches of changes (bulk imports) and a log pruned past
+# our position reload the whole table instead.
+#
+# The lock only covers that check and refresh. Each refresh publishes a new
+# Snapshot (copied, never changed afterwards), and lookups run on the one
+# they got after releasing the lock, so concurrent logins do not wait on each
+# other's dictionary and index work.
+#
+# The log is pruned to its last USER_CHANGES_KEEP entries. Tables larger than
+# USER_DIRECTORY_MAX_USERS are not loaded (about 400 bytes per user); lookups
+# then go to SQLite as before. Every refresh reads the row count from
+# user_stats, so the directory steps aside when inserts push the table over
+# the limit and comes back with a full load once it shrinks again.
+
+# More pending changes than this reload the table instead of applying them one by one
+RELOAD_CHANGES = 5000
+
+# Above this many changed names the sorted index is rebuilt rather than patched
+RESORT_CHANGES = 256
+
+# Highest code point; ``prefix + PREFIX_END`` bounds every username starting with ``prefix``
+PREFIX_END = "\U0010ffff"
+
+# users: username -> (password hash, is_admin); names: usernames in sorted order
+Snapshot = namedtuple("Snapshot", "users names")
+
+_EMPTY = Snapshot({}, ())
+
+class DirectoryUnavailable(Exception):
+    """Raised when the users table outgrew the directory; callers fall back to SQLite."""
+
+class UserDirectory:
+    """The users table held in memory and kept in step with SQLite."""
+
+    def __init__(self, db_path=None, max_users=None, keep_changes=None):
+        self.db_path = db_path or config.DB_PATH
+        self.max_users = max_users or config.USER_DIRECTORY_MAX_USERS
+        self.keep_changes = keep_changes or config.USER_CHANGES_KEEP
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None       # None until the first load
+        self._snapshot = _EMPTY
+        self._last_id = 0               # last user_changes id applied
+        self._pruned_through = 0
+        self.oversized = False
+        self.reloads = 0
+        self.refreshes = 0
+        self.changes_applied = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=config.DB_BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False, isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout={int(config.DB_BUSY_TIMEOUT_MS)}")
+        return conn
+
+    def _sync(self):
+        """Bring the copy up to date; caller holds the lock. Returns True if the change log should be pruned."""
+        if self._conn is None:
+            self._conn = self._connect()
+        conn = self._conn
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version:
+            if self.oversized:
+                raise DirectoryUnavailable(f"more than {self.max_users} users")
+            return False
+        # One read transaction, so the log position and the rows read agree
+        conn.execute('BEGIN')
+        try:
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM user_changes').fetchone()[0]
+            count = conn.execute('SELECT user_count FROM user_stats WHERE id = 1').fetchone()[0]
+            if count > self.max_users:
+                if not self.oversized:
+                    logger.warning("Users table has %d users, more than USER_DIRECTORY_MAX_USERS=%d; "
+                                   "serving user lookups from SQLite", count, self.max_users)
+                    self.oversized = True
+                    self._snapshot = _EMPTY
+            elif self.oversized or self._data_version is None or last_id - self._last_id > RELOAD_CHANGES:
+                if self.oversized:
+                    logger.info("Users table is back to %d users; serving user lookups from memory again", count)
+                    self.oversized = False
+                self._reload(conn, last_id)
+            elif last_id > self._last_id:
+                first_id = conn.execute('SELECT MIN(id) FROM user_changes').fetchone()[0]
+                if first_id > self._last_id + 1:
+                    # Pruned by another process before we saw these changes
+                    self._reload(conn, last_id)
+                else:
+                    self._apply(conn, last_id)
+        finally:
+            conn.execute('COMMIT')
+        self._data_version = version
+        if self.oversized:
+            raise DirectoryUnavailable(f"more than {self.max_users} users")
+        return self._last_id - self._pruned_through > 2 * self.keep_changes
+
+    def _reload(self, conn, last_id):
+        rows = conn.execute('SELECT username, password, is_admin FROM users').fetchall()
+        users = {username: (password, is_admin) for username, password, is_admin in rows}
+        self._snapshot = Snapshot(users, tuple(sorted(users)))
+        self._last_id = last_id
+        self.reloads += 1
+        logger.debug("Loaded %d users into the user directory", len(rows))
+
+    def _apply(self, conn, last_id):
+        rows = conn.execute(
+            'SELECT c.username, u.password, u.is_admin FROM user_changes c '
+            'LEFT JOIN users u ON u.username = c.username WHERE c.id > ? AND c.id <= ?',
+            (self._last_id, last_id)).fetchall()
+        # Every row reflects the current state, so repeated names collapse
+        changed = {username: None if password is None else (password, is_admin)
+                   for username, password, is_admin in rows}
+        # Readers may still hold the current snapshot: patch copies
+        users = dict(self._snapshot.users)
+        for username, entry in changed.items():
+            if entry is None:
+                users.pop(username, None)
+            else:
+                users[username] = entry
+        if len(changed) > RESORT_CHANGES:
+            names = sorted(users)
+        else:
+            names = list(self._snapshot.names)
+            for username, entry in changed.items():
+                i = bisect.bisect_left(names, username)
+                present = i < len(names) and names[i] == username
+                if entry is None and present:
+                    del names[i]
+                elif entry is not None and not present:
+                    names.insert(i, username)
+        self._snapshot = Snapshot(users, tuple(names))
+        self._last_id = last_id
+        self.refreshes += 1
+        self.changes_applied += len(changed)
+
+    def _prune(self):
+        through = self._last_id - self.keep_changes
+        try:
+            db_util.execute('DELETE FROM user_changes WHERE id <= ?', (through,))
+        except sqlite3.Error:
+            # Retried after the next batch of changes
+            logger.exception("Could not prune the user change log")
+            return
+        with self._lock:
+            self._pruned_through = max(self._pruned_through, through)
+
+    def snapshot(self):
+        """The up-to-date Snapshot; raises DirectoryUnavailable while the table is too large."""
+        with self._lock:
+            prune = self._sync()
+            snapshot = self._snapshot
+        if prune:
+            self._prune()
+        return snapshot
+
+    def load(self):
+        """Load the table now instead of on the first lookup."""
+        try:
+            self.snapshot()
+        except DirectoryUnavailable:
+            pass
+
+    def get(self, username):
+        """Return (password hash, is_admin) for ``username``, or None if there is no such user."""
+        return self.snapshot().users.get(username)
+
+    @staticmethod
+    def _range(names, prefix, after=None):
+        """Index bounds in the sorted ``names`` of those starting with ``prefix`` (and after ``after``)."""
+        if after is not None and after >= prefix:
+            low = bisect.bisect_right(names, after)
+        else:
+            low = bisect.bisect_left(names, prefix)
+        return low, bisect.bisect_left(names, prefix + PREFIX_END)
+
+    def count(self, exclude='admin'):
+        users = self.snapshot().users
+        total = len(users)
+        return total - 1 if exclude is not None and exclude in users else total
+
+    def count_matching(self, prefix, limit, exclude='admin'):
+        users, names = self.snapshot()
+        low, high = self._range(names, prefix)
+        total = high - low
+        if exclude is not None and low < high and exclude.startswith(prefix) and exclude in users:
+            total -= 1
+        return min(total, limit)
+
+    def list_users(self, prefix='', after=None, limit=50, exclude='admin'):
+        """One page of (username, is_admin) rows in username order, as user_repo.list_users."""
+        users, names = self.snapshot()
+        low, high = self._range(names, prefix, after)
+        rows = []
+        # At most one name is excluded, so limit + 1 names fill the page
+        for username in names[low:min(high, low + limit + 1)]:
+            if username != exclude:
+                rows.append((username, users[username][1]))
+        return rows[:limit]
+
+    def all_users(self, exclude='admin'):
+        """Every (username, is_admin) in username order."""
+        users, names = self.snapshot()
+        return [(username, users[username][1]) for username in names if username != exclude]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._snapshot.users),
+                "oversized": self.oversized,
+                "last_change_id": self._last_id,
+                "reloads": self.reloads,
+                "refreshes": self.refreshes,
+                "changes_applied": self.changes_applied,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_directory = None
+_directory_lock = threading.Lock()
+
+def get_directory():
+    """Return the process-wide user directory, or None when it is disabled or the table is too large.
+
+    While the table is too large each call re-checks it (one pragma unless
+    something was committed), so the directory is used again once it fits.
+    """
+    global _directory
+    if config.USER_DIRECTORY_MAX_USERS <= 0:
+        return None
+    directory = _directory
+    if directory is None or directory.db_path != config.DB_PATH:
+        with _directory_lock:
+            if _directory is None or _directory.db_path != config.DB_PATH:
+                if _directory is not None:
+                    _directory.close()
+                directory = UserDirectory()
+                directory.load()
+                _directory = directory
+            directory = _directory
+    if directory.oversized:
+        directory.load()
+    return None if directory.oversized else directory
@@ -0,0 +1,88 @@
+import db_util
+import user_directory
+
+# Read-side queries for logins and the admin user listing. They are answered
+# from the in-memory user directory (user_directory.py) when it is enabled.
+# Otherwise they walk the covering index on users (username, is_admin) in
+# username order, so their cost depends on the page size, not on the size of
+# the table.
+
+# Highest code point; ``prefix + PREFIX_END`` is an exclusive upper bound for
+# every username starting with ``prefix``.
+PREFIX_END = "\U0010ffff"
+
+# Filtered counts stop here and are shown as "10,000+"
+COUNT_LIMIT = 10000
+
+def _prefix_bounds(prefix):
+    return prefix, prefix + PREFIX_END
+
+def _from_directory(query):
+    """(True, query(directory)), or (False, None) when lookups have to go to SQLite."""
+    directory = user_directory.get_directory()
+    if directory is not None:
+        try:
+            return True, query(directory)
+        except user_directory.DirectoryUnavailable:
+            pass
+    return False, None
+
+def get_credentials(username):
+    """(password hash, is_admin) of ``username``, or None if there is no such user."""
+    served, entry = _from_directory(lambda directory: directory.get(username))
+    if served:
+        return entry
+    return db_util.fetch_one('SELECT password, is_admin FROM users WHERE username = ?', (username,))
+
+def all_users(exclude='admin'):
+    """Every (username, is_admin) row other than ``exclude``."""
+    served, rows = _from_directory(lambda directory: directory.all_users(exclude))
+    if served:
+        return rows
+    return db_util.fetch_all('SELECT username, is_admin FROM users WHERE username IS NOT ?', (exclude,))
+
+def count_users(exclude='admin'):
+    """Number of users other than ``exclude``, read from the trigger-maintained counter."""
+    served, total = _from_directory(lambda directory: directory.count(exclude))
+    if served:
+        return total
+    row = db_util.fetch_one('SELECT user_count FROM user_stats WHERE id = 1')
+    total = row[0] if row else 0
+    if exclude is not None and db_util.fetch_one('SELECT 1 FROM users WHERE username = ?', (exclude,)):
+        total -= 1
+    return total
+
+def count_matching(prefix, limit=COUNT_LIMIT, exclude='admin'):
+    """Count non-excluded users starting with ``prefix``, stopping at ``limit``."""
+    served, total = _from_directory(lambda directory: directory.count_matching(prefix, limit, exclude))
+    if served:
+        return total
+    low, high = _prefix_bounds(prefix)
+    row = db_util.fetch_one(
+        'SELECT COUNT(*) FROM (SELECT 1 FROM users WHERE username >= ? AND username < ? '
+        'AND username IS NOT ? LIMIT ?)',
+        (low, high, exclude, limit))
+    return row[0]
+
+def list_users(prefix='', after=None, limit=50, exclude='admin'):
+    """One page of (username, is_admin) rows in username order.
+
+    ``after`` is the last username of the previous page (keyset pagination).
+    """
+    served, rows = _from_directory(lambda directory: directory.list_users(prefix, after, limit, exclude))
+    if served:
+        return rows
+    low, high = _prefix_bounds(prefix)
+    if after is not None and after >= low:
+        return db_util.fetch_all(
+            'SELECT username, is_admin FROM users WHERE username > ? AND username < ? '
+            'AND username IS NOT ? ORDER BY username LIMIT ?',
+            (after, high, exclude, limit))
+    return db_util.fetch_all(
+        'SELECT username, is_admin FROM users WHERE username >= ? AND username < ? '
+        'AND username IS NOT ? ORDER BY username LIMIT ?',
+        (low, high, exclude, limit))
+
+def search_usernames(prefix, limit=20, exclude='admin'):
+    """Usernames starting with ``prefix`` for pickers, without loading the table."""
+    return [row[0] for row in list_users(prefix, limit=limit, exclude=exclude)]